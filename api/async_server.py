@@ -0,0 +1,165 @@
+import logging
+from io import BytesIO
+
+import gevent
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from gevent.queue import Queue
+
+__author__ = 'Nikitas Papangelopoulos'
+
+"""
+An asynchronous server for the REST API, based on gevent. Every connection is served by a greenlet, so thousands of
+concurrent clients can be served from one process.
+Requests that change the stock exchange are all applied, in the order they arrive, by a single writer greenlet.
+Their bodies are read by the greenlet of their connection before they are passed to the writer, so a slow client
+never holds up the writes of the others. The writer then never waits for I/O: the stock exchange code does not, and
+the chunks of the responses are passed back through queues.
+Streamed uploads (/api/stream_trades) can be of any length, so they are not read as a whole. They are served by the
+greenlet of their connection, like reads, which records each chunk of trades with one call of the stock exchange
+that holds its write lock, between the writes of the writer.
+So greenlets never switch in the middle of a change, and reads always see a consistent stock exchange without any
+locking. Requests that only read the stock exchange are served by their own greenlet right away.
+"""
+
+logger = logging.getLogger(__name__)
+
+# The routes that change the stock exchange, with bodies that are read as a whole.
+WRITE_ROUTES = frozenset(['/api/create_stock_exchange', '/api/add_stock', '/api/remove_stock', '/api/add_trade',
+                          '/api/add_trades', '/api/remove_trade'])
+
+# The routes that change the stock exchange chunk by chunk, as their body is streamed. They are not passed to the
+# writer, since their body can be of any length.
+STREAMED_WRITE_ROUTES = frozenset(['/api/stream_trades'])
+
+# The maximum number of write requests waiting for the writer, before new ones wait to be queued.
+MAX_PENDING_WRITES = 10000
+
+# The maximum number of connections served at the same time.
+MAX_CONNECTIONS = 10000
+
+# Marks the end of the response of a write request.
+_END_OF_RESPONSE = object()
+
+
+class AsyncServer(object):
+    """
+    A class to serve a WSGI application (the REST API) with gevent, applying all write requests with a single writer.
+    Example usage: AsyncServer(rest_api.app, port=5000).serve_forever()
+    """
+
+    def __init__(self, application, host='127.0.0.1', port=5000, max_connections=MAX_CONNECTIONS,
+                 max_pending_writes=MAX_PENDING_WRITES):
+        """
+        Constructor.
+        :param application: the WSGI application to serve.
+        :type application: flask.Flask
+        :param host: the address to listen at.
+        :type host: str
+        :param port: the port to listen at.
+        :type port: int
+        :param max_connections: the maximum number of connections served at the same time.
+        :type max_connections: int
+        :param max_pending_writes: the maximum number of write requests waiting for the writer.
+        :type max_pending_writes: int
+        """
+        self.application = application
+        self._pending_writes = Queue(max_pending_writes)
+        self._writer = gevent.spawn(self._apply_writes)
+        self._server = WSGIServer((host, port), self.handle, spawn=Pool(max_connections), log=None)
+
+    def handle(self, environ, start_response):
+        """
+        The WSGI application of the server. Write requests are passed to the writer, once their body has been read,
+        the rest, including streamed write requests, are served directly.
+        :param environ: the WSGI environment of the request.
+        :type environ: dict
+        :param start_response: the WSGI callable to start the response with.
+        :type start_response: function
+        :return: the body of the response.
+        :rtype: iterable
+        """
+        if environ.get('PATH_INFO') in WRITE_ROUTES:
+            response_chunks = Queue()
+            self._pending_writes.put((self._buffer_body(environ), start_response, response_chunks))
+            return self._relay_response(response_chunks)
+        return self.application(environ, start_response)
+
+    @staticmethod
+    def _buffer_body(environ):
+        """
+        A helper method to read the whole body of a request, so that the application reads it from memory.
+        Chunked bodies are read up to their last chunk, and are then given to the application with their length.
+        Only the bodies of WRITE_ROUTES are read, which are single json documents.
+        :param environ: the WSGI environment of the request.
+        :type environ: dict
+        :return: the WSGI environment of the request, with the body read.
+        :rtype: dict
+        """
+        body = environ['wsgi.input'].read()
+        environ = dict(environ)
+        environ.pop('HTTP_TRANSFER_ENCODING', None)
+        environ['wsgi.input'] = BytesIO(body)
+        environ['wsgi.input_terminated'] = True
+        environ['CONTENT_LENGTH'] = str(len(body))
+        return environ
+
+    @staticmethod
+    def _relay_response(response_chunks):
+        """
+        A helper method to return the chunks of the response of a write request, as the writer produces them.
+        :param response_chunks: the queue the writer puts the chunks of the response in.
+        :type response_chunks: Queue
+        :return: a generator of the chunks of the response.
+        :rtype: generator
+        """
+        while True:
+            chunk = response_chunks.get()
+            if chunk is _END_OF_RESPONSE:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+
+    def _apply_writes(self):
+        """
+        A helper method, run by the writer greenlet, that serves the write requests one at a time.
+        """
+        for environ, start_response, response_chunks in self._pending_writes:
+            response = None
+            try:
+                response = self.application(environ, start_response)
+                for chunk in response:
+                    response_chunks.put(chunk)
+                response_chunks.put(_END_OF_RESPONSE)
+            except Exception as error:
+                logger.exception('Could not serve request to: %s', environ.get('PATH_INFO'))
+                response_chunks.put(error)
+            finally:
+                if hasattr(response, 'close'):
+                    response.close()
+
+    @property
+    def address(self):
+        """The (host, port) the server listens at."""
+        return self._server.address
+
+    def start(self):
+        """
+        A method to start listening for requests, without waiting.
+        """
+        self._server.start()
+
+    def serve_forever(self):
+        """
+        A method to listen for requests until the process is stopped.
+        """
+        logger.info('Serving the REST API asynchronously at: %s:%s', *self._server.address)
+        self._server.serve_forever()
+
+    def stop(self):
+        """
+        A method to stop listening for requests and stop the writer.
+        """
+        self._server.stop()
+        self._writer.kill()
@@ -1,6 +1,17 @@
-from flask import Flask, request, jsonify, abort, make_response
+import json
+import threading
+import time
+import timeit
+from itertools import chain, islice
 
-from simple_stock_exchange import StockExchange, Stock, TradeRecord
+from flask import Flask, Response, request, jsonify, abort, make_response, stream_with_context
+
+from api import serializers
+from simple_stock_exchange import StockExchange, Stock, TradeRecord, instrumentation
+from simple_stock_exchange.price_broadcaster import PriceBroadcaster
+from simple_stock_exchange.retention import DEFAULT_HORIZON, RetentionPolicy
+from simple_stock_exchange.rolling_vwap import DEFAULT_WINDOWS
+from simple_stock_exchange.write_ahead_log import recover_stock_exchange
 
 
 __author__ = 'Nikitas Papangelopoulos'
@@ -9,10 +20,35 @@ __author__ = 'Nikitas Papangelopoulos'
 A simple api to access and use the methods of stock_exchange via a REST API.
 """
 
+# The parameters every trade must have, and the parameters it can optionally have.
+TRADE_PARAMS = ('stock_symbol', 'quantity', 'trade_type', 'traded_price')
+OPTIONAL_TRADE_PARAMS = ('time_stamp',)
+# The optional parameters of a trade query (see StockExchange.query_trades()).
+QUERY_PARAMS = ('starting_time', 'ending_time', 'trade_type', 'min_quantity', 'max_quantity', 'offset', 'limit')
+# The number of lines of a streamed request that are recorded together, and acknowledged with one progress line.
+STREAM_CHUNK_SIZE = 10000
+# The seconds after which an idle subscription stream sends a comment, so that proxies do not close the connection.
+KEEP_ALIVE_INTERVAL = 15
+
 app = Flask(__name__)
 
 stock_exchange = None
 
+# The path of an optional write ahead log. If it is set, the stock exchange is recovered from it when it is created,
+# and all changes to the stock exchange are recorded in it.
+write_ahead_log_path = None
+# Optional keyword arguments for the write ahead log, e.g. {'fsync_policy': 'never'}.
+write_ahead_log_options = {}
+# Optional keyword arguments for a retention policy, e.g. {'horizon': 120}. If they are set, the trades older than the
+# horizon are dropped in the background once the stock exchange is created.
+retention_options = None
+# The broadcaster of the price updates of the stock exchange, created with the first subscription.
+price_broadcaster = None
+price_broadcaster_lock = threading.Lock()
+# The function subscription streams wait with between updates. When serving asynchronously it must be gevent.sleep,
+# so that waiting streams let the other greenlets run.
+sleep = time.sleep
+
 
 @app.route('/api/create_stock_exchange', methods=['POST'])
 def create_stock_exchange():
@@ -30,13 +66,23 @@ def create_stock_exchange():
         # Checking if all required params were in the request
         if 'name' in json_request:
             name = json_request['name']
-            # Initializing the stock exchange, only the first time. All other times the stock exchange is returned.
+            # Initializing the stock exchange, only the first time. All other times its status is returned.
             if stock_exchange:
-                return jsonify(stock_exchange.__dict__), 200
+                return jsonify(serializers.serialize_stock_exchange(stock_exchange)), 200
             else:
+                # The rolling volume weighted prices of subscriptions need the trades of their longest window.
+                if retention_options is not None and \
+                        int(retention_options.get('horizon', DEFAULT_HORIZON)) < max(DEFAULT_WINDOWS):
+                    abort(500, 'The retention horizon must be at least {} minutes, the longest window of the '
+                               'subscriptions.'.format(max(DEFAULT_WINDOWS)))
                 # Testing if the underlying code in stock_exchange.StockExchange() executed successfully.
                 try:
-                    stock_exchange = StockExchange(name)
+                    if write_ahead_log_path:
+                        stock_exchange = recover_stock_exchange(name, write_ahead_log_path, **write_ahead_log_options)
+                    else:
+                        stock_exchange = StockExchange(name)
+                    if retention_options is not None:
+                        RetentionPolicy(stock_exchange, **retention_options).start()
                     return jsonify({'Stock Exchange': stock_exchange.name}), 200
                 except TypeError as error:
                     abort(500, error)
@@ -76,7 +122,7 @@ def create_stock():
                                           json_request['fixed_dividend'])
                 else:
                     abort(400, 'Fifth parameter must be "fixed_dividend".')
-                return jsonify(created_stock.__dict__), 201
+                return jsonify(serializers.serialize_stock(created_stock)), 201
             except TypeError as error:
                 abort(500, error)
         else:
@@ -211,18 +257,94 @@ def add_trade():
         abort(400)
 
 
+@app.route('/api/add_trades', methods=['POST'])
+def add_trades():
+    """
+    A POST rest wrapper for StockExchange.add_trades_bulk(), to add many trades with one request.
+    The body is either a json array of trades, or (with content type application/x-ndjson) one json trade per line.
+    Every trade has the parameters of /api/add_trade. Valid trades are recorded even if others in the same request
+    are not, and the positions of the trades that were not recorded are returned.
+    Example usage: [
+                    {"stock_symbol": "POP", "quantity": "300", "trade_type": "buy", "traded_price": "150"},
+                    {"stock_symbol": "TEA", "quantity": "100", "trade_type": "sell", "traded_price": "120",
+                     "time_stamp": "2017-02-04 23:30:39"}
+                    ]
+    Example response: {"Added trades": 1, "Rejected trades": [1]}
+    """
+    check_stock_exchange()
+
+    if request.mimetype == 'application/x-ndjson':
+        trades = parse_ndjson(request.get_data().splitlines())
+    else:
+        trades = request.get_json(silent=True)
+        if not isinstance(trades, list):
+            abort(400, 'The request must be a json array of trades.')
+
+    # Testing if the underlying code in StockExchange.add_trades_bulk() executed successfully.
+    try:
+        recorded = record_trades(trades)
+        return jsonify({'Added trades': sum(recorded),
+                        'Rejected trades': [position for position, added in enumerate(recorded) if not added]}), 200
+    except TypeError as error:
+        abort(500, error)
+
+
+@app.route('/api/stream_trades', methods=['POST'])
+def stream_trades():
+    """
+    A POST rest wrapper for StockExchange.add_trades_bulk(), to add any number of trades from a streamed (e.g. chunked)
+    newline delimited json body, with one json trade per line. Trades are recorded as they arrive, in chunks of
+    STREAM_CHUNK_SIZE lines, so the body is never held in memory as a whole. As in /api/add_trade, the price of a
+    stock is only updated by trades newer than its current price.
+    The response is also newline delimited json, with one progress line per chunk: the number of trades received and
+    added so far, and the positions of the trades of the chunk that were not recorded. The last line has "Finished".
+    Example usage: {"stock_symbol": "POP", "quantity": "300", "trade_type": "buy", "traded_price": "150"}
+                   {"stock_symbol": "TEA", "quantity": "100", "trade_type": "sell", "traded_price": "120"}
+    Example response: {"Received trades": 2, "Added trades": 2, "Rejected trades": []}
+                      {"Received trades": 2, "Added trades": 2, "Rejected trades": [], "Finished": true}
+    """
+    check_stock_exchange()
+    stream = request.stream
+
+    def acknowledge_chunks():
+        received_trades = 0
+        added_trades = 0
+        while True:
+            lines = list(islice(stream, STREAM_CHUNK_SIZE))
+            trades = parse_ndjson(lines)
+            recorded = record_trades(trades)
+            rejected_trades = [received_trades + position for position, added in enumerate(recorded) if not added]
+            received_trades += len(trades)
+            added_trades += sum(recorded)
+            progress = {'Received trades': received_trades, 'Added trades': added_trades,
+                        'Rejected trades': rejected_trades}
+            # The stream ends with a chunk shorter than STREAM_CHUNK_SIZE.
+            if len(lines) < STREAM_CHUNK_SIZE:
+                progress['Finished'] = True
+                yield json.dumps(progress) + '\n'
+                break
+            yield json.dumps(progress) + '\n'
+
+    return Response(stream_with_context(acknowledge_chunks()), mimetype='application/x-ndjson')
+
+
 @app.route('/api/remove_trade', methods=['POST'])
 def remove_trade():
     """
-    A POST rest wrapper for StockExchange.remove_trade_by_symbol_date().
+    A POST rest wrapper for StockExchange.remove_trade_by_symbol_date(), or StockExchange.remove_trade_by_id() if
+    the id of the trade is given instead of its time stamp.
     Example usage: {
                     "stock_symbol": "POP",
                     "time_stamp": "2017-02-04 23:30:39"
                     }
+                   {
+                    "stock_symbol": "POP",
+                    "trade_id": 42
+                    }
     """
     check_stock_exchange()
 
-    required_params = ['stock_symbol', 'time_stamp']
+    required_params = ['stock_symbol', 'trade_id' if 'trade_id' in (request.json or {}) else 'time_stamp']
     json_request = request.json
 
     if json_request:
@@ -230,8 +352,11 @@ def remove_trade():
         if all([True if required_param in json_request else False for required_param in required_params]):
             # Testing if the underlying code in StockExchange.remove_trade_by_symbol_date() executed successfully.
             try:
-                result = stock_exchange.remove_trade_by_symbol_date(json_request['stock_symbol'],
-                                                                    json_request['time_stamp'])
+                if 'trade_id' in json_request:
+                    result = stock_exchange.remove_trade_by_id(json_request['stock_symbol'], json_request['trade_id'])
+                else:
+                    result = stock_exchange.remove_trade_by_symbol_date(json_request['stock_symbol'],
+                                                                        json_request['time_stamp'])
                 if result:
                     return jsonify({'Removed trade for stock': json_request['stock_symbol']}), 200
                 else:
@@ -246,6 +371,163 @@ def remove_trade():
         abort(400)
 
 
+@app.route('/api/stocks', methods=['GET'])
+def list_stocks():
+    """
+    A GET rest wrapper for serializers.stocks_page(): a page of the stocks of the stock exchange, by symbol.
+    Example usage: /api/stocks?limit=100&cursor=POP
+    The cursor of the next page is returned with every page, until the last one.
+    """
+    check_stock_exchange()
+    try:
+        stocks, next_cursor = serializers.stocks_page(stock_exchange, request.args.get('cursor'),
+                                                      serializers.page_size(request.args.get('limit')))
+    except ValueError:
+        abort(400, 'Parameter "limit" must be a whole number.')
+    return jsonify({'stocks': stocks, 'next_cursor': next_cursor}), 200
+
+
+@app.route('/api/trades', methods=['GET'])
+def list_trades():
+    """
+    A GET rest wrapper for serializers.trades_page(): a page of the trades of a stock, by timestamp.
+    Example usage: /api/trades?stock_symbol=POP&limit=1000&cursor=1486251039:42
+    The cursor of the next page is returned with every page, until the last one.
+    """
+    check_stock_exchange()
+    if 'stock_symbol' not in request.args:
+        abort(400, 'Parameter "stock_symbol" needs to be in the request')
+    try:
+        trades, next_cursor = serializers.trades_page(stock_exchange, request.args['stock_symbol'],
+                                                      request.args.get('cursor'),
+                                                      serializers.page_size(request.args.get('limit')))
+    except ValueError:
+        abort(400, 'Parameters "limit" and "cursor" must be as returned with the previous page.')
+    return jsonify({'trades': trades, 'next_cursor': next_cursor}), 200
+
+
+@app.route('/api/export_stocks', methods=['GET'])
+def export_stocks():
+    """
+    A GET rest wrapper for serializers.stream_stocks(): all the stocks of the stock exchange, streamed one json stock
+    per line.
+    """
+    check_stock_exchange()
+    return Response(serializers.stream_stocks(stock_exchange), mimetype='application/x-ndjson')
+
+
+@app.route('/api/export_trades', methods=['GET'])
+def export_trades():
+    """
+    A GET rest wrapper for serializers.stream_trades(): the trades of the stock exchange, streamed one json trade per
+    line, in the format they are added with (see /api/stream_trades). Only the trades of the given stocks are
+    streamed, if any are given.
+    Example usage: /api/export_trades?stock_symbol=POP&stock_symbol=TEA
+    """
+    check_stock_exchange()
+    stock_symbols = request.args.getlist('stock_symbol') or None
+    return Response(serializers.stream_trades(stock_exchange, stock_symbols), mimetype='application/x-ndjson')
+
+
+@app.route('/api/query_trades', methods=['POST'])
+def query_trades():
+    """
+    A POST rest wrapper for StockExchange.query_trade_rows(): the trades of one or many stocks between two times,
+    optionally filtered by type and quantity. With "stream" they are streamed one json trade per line.
+    Example usage: {
+                    "stock_symbols": ["POP", "TEA"],
+                    "starting_time": "2017-02-04 23:00:00",
+                    "ending_time": "2017-02-04 23:59:59",
+                    "trade_type": "buy",
+                    "min_quantity": 100,
+                    "offset": 0,
+                    "limit": 1000,
+                    "stream": false
+                    }
+    """
+    check_stock_exchange()
+
+    json_request = request.json
+    if json_request:
+        if 'stock_symbols' in json_request or 'stock_symbol' in json_request:
+            query_params = dict((param, json_request[param]) for param in QUERY_PARAMS if param in json_request)
+            stock_symbols = json_request.get('stock_symbols', json_request.get('stock_symbol'))
+            try:
+                query_params['offset'], query_params['limit'] = serializers.query_range(
+                    json_request.get('offset'), json_request.get('limit'))
+                trade_rows = stock_exchange.query_trade_rows(stock_symbols, **query_params)
+                if json_request.get('stream'):
+                    # Running the query before the response starts, so that errors are still reported.
+                    first_rows = list(islice(trade_rows, 1))
+                    lines = (json.dumps(serializers.serialize_trade_row(trade_row)) + '\n'
+                             for trade_row in chain(first_rows, trade_rows))
+                    return Response(lines, mimetype='application/x-ndjson')
+                trades = [serializers.serialize_trade_row(trade_row) for trade_row in trade_rows]
+                return jsonify({'trades': trades}), 200
+            except (TypeError, ValueError) as error:
+                abort(400, str(error))
+        else:
+            abort(400, 'Parameter "stock_symbols" needs to be in the request')
+    else:
+        abort(400)
+
+
+@app.route('/api/subscribe', methods=['GET'])
+def subscribe():
+    """
+    A GET rest wrapper for PriceBroadcaster.subscribe(): a long lived stream of server-sent events with the changes of
+    the current price ("price" events) and of the rolling volume weighted prices ("vwap" events) of the given stocks.
+    Updates are coalesced: a client gets at most max_rate updates per second for each stock and kind of update, and
+    always the latest values, however slowly it reads.
+    Example usage: /api/subscribe?stock_symbol=POP&stock_symbol=TEA&max_rate=2
+    """
+    global price_broadcaster
+
+    check_stock_exchange()
+    stock_symbols = request.args.getlist('stock_symbol')
+    if not stock_symbols:
+        abort(400, 'Parameter "stock_symbol" needs to be in the request')
+    # Creating the broadcaster only once, even for concurrent first subscriptions, and replacing it together with
+    # the stock exchange.
+    with price_broadcaster_lock:
+        if price_broadcaster is None or price_broadcaster.stock_exchange is not stock_exchange:
+            if price_broadcaster is not None:
+                price_broadcaster.close()
+                price_broadcaster = None
+            try:
+                price_broadcaster = PriceBroadcaster(stock_exchange)
+            except ValueError as error:
+                abort(500, str(error))
+        broadcaster = price_broadcaster
+    try:
+        subscription = broadcaster.subscribe(stock_symbols, request.args.get('max_rate'))
+    except ValueError:
+        abort(400, 'Parameter "max_rate" must be a positive number.')
+
+    def events():
+        try:
+            # Starting the stream right away, even if there are no updates yet.
+            yield ': subscribed\n\n'
+            last_sent = timeit.default_timer()
+            while True:
+                # Publishing the volume weighted prices that changed as trades aged out of their windows.
+                broadcaster.refresh()
+                updates = subscription.pop_updates()
+                if updates:
+                    last_sent = timeit.default_timer()
+                    yield ''.join(serializers.server_sent_event(event, data) for event, stock_symbol, data in updates)
+                elif timeit.default_timer() - last_sent >= KEEP_ALIVE_INTERVAL:
+                    last_sent = timeit.default_timer()
+                    yield ': keep-alive\n\n'
+                next_due = subscription.next_due()
+                sleep(subscription.interval if next_due is None else next_due)
+        finally:
+            # The stream is closed when the client disconnects.
+            broadcaster.unsubscribe(subscription)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
 @app.route('/api/calculate_dividend', methods=['POST'])
 def calculate_dividend():
     """
@@ -377,6 +659,26 @@ def calculate_all_share_index():
         abort(500, error)
 
 
+@app.route('/api/cache_statistics', methods=['GET'])
+def cache_statistics():
+    """
+    A GET rest wrapper for the statistics of the result cache of the stock exchange (see ResultCache.statistics()):
+    the number of calculations answered from the cache (hits), calculated again (misses) and evicted.
+    """
+    check_stock_exchange()
+    return jsonify(stock_exchange.result_cache.statistics()), 200
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """
+    A GET rest wrapper for instrumentation.render_text(): the number of calls, errors and the latency histograms of the
+    methods of the stock exchange and the routes of this api, in the Prometheus text format. They are only counted
+    while instrumentation is enabled (see rest_api_runner.py --instrument).
+    """
+    return Response(instrumentation.render_text(), mimetype='text/plain; version=0.0.4')
+
+
 def check_stock_exchange():
     """
     Small convenience method that checks if a stock exchange object exits
@@ -386,6 +688,49 @@ def check_stock_exchange():
         abort(400, 'Please create a stock exchange first.')
 
 
+def parse_ndjson(lines):
+    """
+    A method to parse the lines of a newline delimited json body. Blank lines are skipped.
+    :param lines: the lines of the body of the request.
+    :type lines: iterable
+    :return: the parsed json value of every line, or None for lines that are not valid json.
+    :rtype: list
+    """
+    parsed_lines = []
+    for line in lines:
+        if line.strip():
+            try:
+                parsed_lines.append(json.loads(line))
+            except ValueError:
+                parsed_lines.append(None)
+    return parsed_lines
+
+
+def record_trades(trades):
+    """
+    A method to validate the parameters of many trades and record the valid ones in the stock exchange in one step.
+    :param trades: the trades, as dictionaries with the parameters of /api/add_trade.
+    :type trades: list
+    :return: whether each trade was recorded successfully in the stock exchange.
+    :rtype: list
+    """
+    valid_positions = [position for position, trade in enumerate(trades)
+                       if isinstance(trade, dict) and all(param in trade for param in TRADE_PARAMS) and
+                       all(param in TRADE_PARAMS or param in OPTIONAL_TRADE_PARAMS for param in trade)]
+    recorded = [False] * len(trades)
+    if valid_positions:
+        valid_trades = [trades[position] for position in valid_positions]
+        recorded_valid = stock_exchange.add_trades_bulk(
+            stock_symbols=[trade['stock_symbol'] for trade in valid_trades],
+            quantities=[trade['quantity'] for trade in valid_trades],
+            trade_types=[trade['trade_type'] for trade in valid_trades],
+            traded_prices=[trade['traded_price'] for trade in valid_trades],
+            time_stamps=[trade.get('time_stamp') for trade in valid_trades])
+        for position, added in zip(valid_positions, recorded_valid):
+            recorded[position] = bool(added)
+    return recorded
+
+
 @app.errorhandler(400)
 def not_found(error):
     """
@@ -413,3 +758,8 @@ def not_found(error):
     """
     return make_response(jsonify({'error': error.description}), 404)
 
+
+# Counting and timing every route, while instrumentation is enabled.
+for endpoint in sorted(app.view_functions):
+    if endpoint != 'static':
+        instrumentation.instrument(app.view_functions, endpoint, 'route.' + endpoint)
@@ -0,0 +1,209 @@
+import json
+
+from simple_stock_exchange.time_stamp_parser import TIME_STAMP_FORMAT
+from simple_stock_exchange.trade_store import TRADE_TYPE_NAMES, from_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+"""
+Serializers of the state of a stock exchange for the REST API. Instead of the whole stock exchange at once, the stocks
+and the trades are serialized a page at a time, each page read under the read lock of the stock exchange, so that a
+large stock exchange can be listed page by page, or streamed, in constant memory and without blocking the writers
+for the whole listing.
+Pages start after a cursor: the symbol of the last stock, or the timestamp and ID of the last trade, of the previous
+page. So stocks and trades can be added and removed between pages, without pages skipping or repeating any others.
+"""
+
+# The default and the maximum number of stocks or trades in a page.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 10000
+# The number of stocks or trades read at a time, when streaming.
+STREAM_PAGE_SIZE = 1000
+
+
+def serialize_stock_exchange(stock_exchange):
+    """
+    A method to serialize the status of a stock exchange, without its stocks and trades.
+    :param stock_exchange: the stock exchange.
+    :type stock_exchange: StockExchange
+    :return: the name of the stock exchange, its number of stocks and trades and its all share index.
+    :rtype: dict
+    """
+    with stock_exchange.lock.read_locked():
+        return {'name': stock_exchange.name, 'stocks': len(stock_exchange.registered_stocks),
+                'trades': sum(len(trade_store) for trade_store in stock_exchange.recorded_trades.values()),
+                'all_share_index': stock_exchange.all_share_index}
+
+
+def serialize_stock(stock):
+    """
+    A method to serialize a stock.
+    :param stock: the stock.
+    :type stock: Stock
+    :return: the attributes of the stock, with the timestamp of its price formatted.
+    :rtype: dict
+    """
+    serialized_stock = stock.to_dict()
+    if serialized_stock.get('current_price_timestamp'):
+        serialized_stock['current_price_timestamp'] = serialized_stock['current_price_timestamp'].strftime(
+            TIME_STAMP_FORMAT)
+    return serialized_stock
+
+
+def serialize_trade_row(trade_row):
+    """
+    A method to serialize a trade.
+    :param trade_row: the stock symbol, timestamp, price, quantity, trade type and ID of the trade (see
+                      StockExchange.query_trade_rows()).
+    :type trade_row: tuple
+    :return: the trade, in the format the trades are added with, and its ID.
+    :rtype: dict
+    """
+    stock_symbol, time_stamp, traded_price, quantity, trade_type, trade_id = trade_row
+    return {'trade_id': trade_id, 'stock_symbol': stock_symbol, 'time_stamp': time_stamp.strftime(TIME_STAMP_FORMAT),
+            'quantity': quantity, 'trade_type': trade_type, 'traded_price': traded_price}
+
+
+def serialize_trades(stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes, trade_ids):
+    """
+    A method to serialize trades of a stock from their columns (see TradeStore.trades_after()).
+    :return: every trade, in the format the trades are added with, and its ID.
+    :rtype: list(dict)
+    """
+    return [serialize_trade_row((stock_symbol, from_epoch(time_stamp), float(traded_price), int(quantity),
+                                 TRADE_TYPE_NAMES[int(trade_type_code)], int(trade_id)))
+            for time_stamp, traded_price, quantity, trade_type_code, trade_id in
+            zip(time_stamps, traded_prices, quantities, trade_type_codes, trade_ids)]
+
+
+def page_size(limit):
+    """
+    A method to validate a user provided page size.
+    :param limit: the page size, or None for the default.
+    :type limit: str
+    :return: the page size, between 1 and MAX_PAGE_SIZE.
+    :rtype: int
+    :raises ValueError: if the page size is not a whole number.
+    """
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return min(max(int(limit), 1), MAX_PAGE_SIZE)
+
+
+def query_range(offset, limit):
+    """
+    A method to validate a user provided offset and limit of the results of a query.
+    :param offset: the number of results to skip, or None for none.
+    :type offset: str
+    :param limit: the maximum number of results, or None for all of them.
+    :type limit: str
+    :return: the offset and the limit, or None for all results.
+    :rtype: tuple(int, int | None)
+    :raises ValueError: if the offset or the limit is not a whole number, or is negative.
+    """
+    offset = 0 if offset is None else int(offset)
+    limit = None if limit is None else int(limit)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError('Parameters "offset" and "limit" must not be negative.')
+    return offset, limit
+
+
+def stocks_page(stock_exchange, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    A method to get a page of the stocks of a stock exchange, by symbol.
+    :param stock_exchange: the stock exchange.
+    :type stock_exchange: StockExchange
+    :param cursor: the symbol of the last stock of the previous page. By default: the first page.
+    :type cursor: str
+    :param limit: the maximum number of stocks in the page.
+    :type limit: int
+    :return: the serialized stocks, and the cursor of the next page, or None if this is the last page.
+    :rtype: tuple(list(dict), str | None)
+    """
+    with stock_exchange.lock.read_locked():
+        stock_symbols = sorted(stock_symbol for stock_symbol in stock_exchange.registered_stocks
+                               if cursor is None or stock_symbol > cursor)
+        stocks = [serialize_stock(stock_exchange.registered_stocks[stock_symbol])
+                  for stock_symbol in stock_symbols[:limit]]
+    next_cursor = stocks[-1]['stock_symbol'] if len(stock_symbols) > limit else None
+    return stocks, next_cursor
+
+
+def trades_page(stock_exchange, stock_symbol, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    A method to get a page of the trades of a stock, by timestamp.
+    :param stock_exchange: the stock exchange.
+    :type stock_exchange: StockExchange
+    :param stock_symbol: the symbol (abbreviated name) of the stock.
+    :type stock_symbol: str
+    :param cursor: the cursor of the page, as returned with the previous page. By default: the first page.
+    :type cursor: str
+    :param limit: the maximum number of trades in the page.
+    :type limit: int
+    :return: the serialized trades, and the cursor of the next page, or None if this is the last page.
+    :rtype: tuple(list(dict), str | None)
+    :raises ValueError: if the cursor is not valid.
+    """
+    time_stamp, trade_id = (None, None) if cursor is None else [int(part) for part in cursor.split(':', 1)]
+    with stock_exchange.lock.read_locked():
+        trade_store = stock_exchange.recorded_trades.get(stock_symbol)
+        if trade_store is None:
+            return [], None
+        # Reading one trade more than the limit, to know if there is a next page.
+        columns = trade_store.trades_after(time_stamp, trade_id, limit + 1)
+    trades = serialize_trades(stock_symbol, *[column[:limit] for column in columns])
+    next_cursor = '{}:{}'.format(columns[0][limit - 1], columns[4][limit - 1]) if len(columns[0]) > limit else None
+    return trades, next_cursor
+
+
+def stream_stocks(stock_exchange):
+    """
+    A method to serialize all the stocks of a stock exchange as newline delimited json, a page at a time.
+    :param stock_exchange: the stock exchange.
+    :type stock_exchange: StockExchange
+    :return: the lines of the stocks.
+    :rtype: generator
+    """
+    cursor = None
+    while True:
+        stocks, cursor = stocks_page(stock_exchange, cursor, STREAM_PAGE_SIZE)
+        if stocks:
+            yield ''.join(json.dumps(stock) + '\n' for stock in stocks)
+        if cursor is None:
+            break
+
+
+def stream_trades(stock_exchange, stock_symbols=None):
+    """
+    A method to serialize the trades of a stock exchange as newline delimited json, a page at a time.
+    :param stock_exchange: the stock exchange.
+    :type stock_exchange: StockExchange
+    :param stock_symbols: the symbols of the stocks whose trades to serialize. By default: all stocks with trades.
+    :type stock_symbols: list(str)
+    :return: the lines of the trades, by stock and then by timestamp.
+    :rtype: generator
+    """
+    if stock_symbols is None:
+        with stock_exchange.lock.read_locked():
+            stock_symbols = sorted(stock_exchange.recorded_trades)
+    for stock_symbol in stock_symbols:
+        cursor = None
+        while True:
+            trades, cursor = trades_page(stock_exchange, stock_symbol, cursor, STREAM_PAGE_SIZE)
+            if trades:
+                yield ''.join(json.dumps(trade) + '\n' for trade in trades)
+            if cursor is None:
+                break
+
+
+def server_sent_event(event, data):
+    """
+    A method to format an update as a server-sent event.
+    :param event: the name of the event, e.g. "price".
+    :type event: str
+    :param data: the data of the event.
+    :type data: dict
+    :return: the lines of the event, ending with a blank line.
+    :rtype: str
+    """
+    return 'event: {}\ndata: {}\n\n'.format(event, json.dumps(data))
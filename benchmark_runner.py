@@ -0,0 +1,157 @@
+#!/usr/bin/python
+import argparse
+import json
+import logging
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.cases import CASES
+from benchmarks.trade_generator import TradeGenerator
+from load_generator import percentile
+
+__author__ = 'Nikitas Papangelopoulos'
+
+"""
+A simple script to benchmark the core operations of the stock exchange (see benchmarks.cases) with synthetic stocks
+and trades, for every combination of number of stocks and size of trade history, and report their throughput,
+latency percentiles and peak memory. Every combination runs in its own process, so that its peak memory is its own.
+The results can be saved as a json baseline, and later runs compared against it to detect regressions:
+    benchmark_runner.py -w baseline.json
+    benchmark_runner.py -b baseline.json
+The comparison fails (exit code 1) if the throughput of a case dropped, or its p99 latency or peak memory grew, by
+more than the tolerance.
+"""
+
+DEFAULT_SYMBOL_COUNTS = [10, 1000]
+DEFAULT_HISTORY_SIZES = [1000, 100000]
+DEFAULT_OPERATIONS = 10000
+DEFAULT_TOLERANCE = 0.25
+
+
+def run_case(case_name, symbols_count, history_size, operations, seed=0):
+    """
+    A method to run one case in the current process and measure it.
+    :param case_name: the name of the case (see benchmarks.cases.CASES).
+    :type case_name: str
+    :param symbols_count: the number of stocks in the stock exchange.
+    :type symbols_count: int
+    :param history_size: the number of trades recorded before the operations run.
+    :type history_size: int
+    :param operations: the number of times to run the operation.
+    :type operations: int
+    :param seed: the seed of the generated stocks and trades.
+    :type seed: int
+    :return: the result of the case: its throughput in operations per second, its latency percentiles in
+             microseconds and the peak memory of the process in kilobytes.
+    :rtype: dict
+    """
+    # The cost of logging is not part of the benchmarked operations.
+    logging.disable(logging.CRITICAL)
+    latencies = sorted(CASES[case_name](TradeGenerator(symbols_count, seed), history_size, operations))
+    result = {'case': case_name, 'symbols': symbols_count, 'history': history_size, 'operations': len(latencies),
+              'throughput': len(latencies) / sum(latencies) if latencies else 0.0,
+              'peak_memory_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    for name, share in (('p50_us', 0.5), ('p90_us', 0.9), ('p99_us', 0.99), ('max_us', 1.0)):
+        result[name] = 1e6 * percentile(latencies, share)
+    return result
+
+
+def run_case_in_process(case_name, symbols_count, history_size, operations, seed=0):
+    """
+    A method to run one case in a new python process. See run_case() for the parameters.
+    :return: the result of the case.
+    :rtype: dict
+    """
+    output = subprocess.check_output([sys.executable, __file__, '--child', case_name, str(symbols_count),
+                                      str(history_size), '-o', str(operations), '--seed', str(seed)])
+    return json.loads(output.splitlines()[-1])
+
+
+def result_key(result):
+    """
+    A method to get the key of a result in the json results: case/symbols/history.
+    """
+    return '{}/{}/{}'.format(result['case'], result['symbols'], result['history'])
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    A method to compare results against a baseline. Cases that are not in the baseline are not compared.
+    :param results: the results, by key (see result_key()).
+    :type results: dict
+    :param baseline: the results of the baseline, by key.
+    :type baseline: dict
+    :param tolerance: the relative change allowed before a change is a regression, e.g. 0.25 for 25%.
+    :type tolerance: float
+    :return: a description of every regression.
+    :rtype: list(str)
+    """
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        result, baseline_result = results[key], baseline[key]
+        if result['throughput'] < baseline_result['throughput'] * (1 - tolerance):
+            regressions.append('{}: throughput dropped from {:.1f} to {:.1f} operations/second'.format(
+                key, baseline_result['throughput'], result['throughput']))
+        for metric, unit in (('p99_us', 'us'), ('peak_memory_kb', 'kB')):
+            if result[metric] > baseline_result[metric] * (1 + tolerance):
+                regressions.append('{}: {} grew from {:.1f} to {:.1f} {}'.format(
+                    key, metric, baseline_result[metric], result[metric], unit))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the core operations of the stock exchange.')
+    parser.add_argument('-c', '--cases', nargs='+', choices=list(CASES), default=list(CASES),
+                        help='The cases to run')
+    parser.add_argument('-s', '--symbols', nargs='+', type=int, default=DEFAULT_SYMBOL_COUNTS,
+                        help='The numbers of stocks to run every case with')
+    parser.add_argument('-n', '--history', nargs='+', type=int, default=DEFAULT_HISTORY_SIZES,
+                        help='The numbers of trades to record before running every case')
+    parser.add_argument('-o', '--operations', type=int, default=DEFAULT_OPERATIONS,
+                        help='The number of times every case runs its operation')
+    parser.add_argument('--seed', type=int, default=0, help='The seed of the generated stocks and trades')
+    parser.add_argument('-w', '--write', help='A json file to save the results in, e.g. as a baseline')
+    parser.add_argument('-b', '--baseline', help='A json file with baseline results to compare against')
+    parser.add_argument('-t', '--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='The relative change allowed before a change is reported as a regression')
+    parser.add_argument('--child', nargs=3, metavar=('CASE', 'SYMBOLS', 'HISTORY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Running a single case, for run_case_in_process().
+        print(json.dumps(run_case(args.child[0], int(args.child[1]), int(args.child[2]), args.operations,
+                                  args.seed)))
+        sys.exit(0)
+
+    results = {}
+    print('{:<30}{:>8}{:>10}{:>14}{:>10}{:>10}{:>10}{:>12}'.format(
+        'case', 'symbols', 'history', 'operations/s', 'p50 us', 'p90 us', 'p99 us', 'peak kB'))
+    for case_name in args.cases:
+        for symbols_count in args.symbols:
+            for history_size in args.history:
+                result = run_case_in_process(case_name, symbols_count, history_size, args.operations, args.seed)
+                results[result_key(result)] = result
+                print('{case:<30}{symbols:>8}{history:>10}{throughput:>14.1f}{p50_us:>10.1f}{p90_us:>10.1f}'
+                      '{p99_us:>10.1f}{peak_memory_kb:>12}'.format(**result))
+
+    if args.write:
+        with open(args.write, 'w') as results_file:
+            json.dump({'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                                       'platform': platform.platform(), 'operations': args.operations,
+                                       'seed': args.seed, 'time': time.strftime('%Y-%m-%d %H:%M:%S')},
+                       'results': results}, results_file, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file)['results'], args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        if regressions:
+            sys.exit(1)
+        print('No regressions against baseline: {}'.format(args.baseline))
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+
+import timeit
+from collections import OrderedDict
+
+from simple_stock_exchange import TradeRecord
+
+__author__ = 'Nikitas Papangelopoulos'
+
+"""
+The benchmarked operations. Every case prepares a stock exchange with a generated trade history, then runs an
+operation a number of times and returns the latency of each run, in seconds. Only the operation itself is timed.
+"""
+
+# The timer with the best resolution on the platform.
+timer = timeit.default_timer
+
+
+def add_new_trade(generator, history_size, operations):
+    """
+    StockExchange.add_new_trade(), for trades created beforehand.
+    """
+    stock_exchange = generator.stock_exchange(history_size)
+    # The trades are created without a stock exchange, so that creating them does not record them.
+    trades = [TradeRecord(None, *trade) for trade in zip(*generator.trades(operations))]
+    latencies = []
+    for trade in trades:
+        started = timer()
+        stock_exchange.add_new_trade(trade)
+        latencies.append(timer() - started)
+    return latencies
+
+
+def trade_record(generator, history_size, operations):
+    """
+    The TradeRecord constructor, which validates a trade and records it in the stock exchange.
+    """
+    stock_exchange = generator.stock_exchange(history_size)
+    trades = list(zip(*generator.trades(operations)))
+    latencies = []
+    for trade in trades:
+        started = timer()
+        TradeRecord(stock_exchange, *trade)
+        latencies.append(timer() - started)
+    return latencies
+
+
+def vw_stock_price_calculator(generator, history_size, operations):
+    """
+    StockExchange.vw_stock_price_calculator(), over the default time frame, for random stocks.
+    """
+    stock_exchange = generator.stock_exchange(history_size)
+    stock_symbols = generator.trades(operations)[0]
+    latencies = []
+    for stock_symbol in stock_symbols:
+        started = timer()
+        stock_exchange.vw_stock_price_calculator(stock_symbol)
+        latencies.append(timer() - started)
+    return latencies
+
+
+def all_share_index_calculator(generator, history_size, operations):
+    """
+    StockExchange.all_share_index_calculator(), with a price update between every two calculations.
+    """
+    stock_exchange = generator.stock_exchange(history_size)
+    # The price updates are not timed.
+    trades = [TradeRecord(None, *trade) for trade in zip(*generator.trades(operations))]
+    latencies = []
+    for trade in trades:
+        stock_exchange.update_stock_price(trade)
+        started = timer()
+        stock_exchange.all_share_index_calculator()
+        latencies.append(timer() - started)
+    return latencies
+
+
+def dividend_yield_calculator(generator, history_size, operations):
+    """
+    StockExchange.dividend_yield_calculator(), for random stocks and prices.
+    """
+    stock_exchange = generator.stock_exchange(history_size)
+    stock_symbols, _, _, traded_prices, _ = generator.trades(operations)
+    latencies = []
+    for stock_symbol, traded_price in zip(stock_symbols, traded_prices):
+        started = timer()
+        stock_exchange.dividend_yield_calculator(stock_symbol, traded_price)
+        latencies.append(timer() - started)
+    return latencies
+
+
+# All the cases, by name.
+CASES = OrderedDict((case.__name__, case) for case in (add_new_trade, trade_record, vw_stock_price_calculator,
+                                                       all_share_index_calculator, dividend_yield_calculator))
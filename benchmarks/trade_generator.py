@@ -0,0 +1,88 @@
+#!/usr/bin/python
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from simple_stock_exchange import Stock, StockExchange
+
+__author__ = 'Nikitas Papangelopoulos'
+
+# The time span the generated trade history covers, ending at the time the history is generated.
+HISTORY_SPAN = timedelta(days=1)
+
+
+class TradeGenerator(object):
+    """
+    A class to generate reproducible synthetic stocks and trades for the benchmarks. The same seed always gives the
+    same stocks, prices and quantities. The timestamps of the trades end at the time they are generated, so that the
+    volume weighted price of the last minutes has trades to go through.
+    Example usage: generator = TradeGenerator(100, seed=1)
+                   stock_exchange = generator.stock_exchange(history_size=100000)
+    """
+
+    def __init__(self, symbols_count, seed=0):
+        """
+        Constructor.
+        :param symbols_count: the number of stocks to generate.
+        :type symbols_count: int
+        :param seed: the seed of the random numbers.
+        :type seed: int
+        """
+        self.random_state = np.random.RandomState(seed)
+        self.stock_symbols = ['S{:05d}'.format(index) for index in range(symbols_count)]
+
+    def stocks(self):
+        """
+        A method to generate the stocks: one in five is preferred, with a fixed dividend.
+        :return: the stocks, not added to any stock exchange.
+        :rtype: list(Stock)
+        """
+        stocks = []
+        for index, stock_symbol in enumerate(self.stock_symbols):
+            if index % 5 == 4:
+                stocks.append(Stock(stock_symbol, 'preferred', str(self.random_state.randint(1, 20)), '100',
+                                    '{}%'.format(self.random_state.randint(1, 5))))
+            else:
+                stocks.append(Stock(stock_symbol, 'common', str(self.random_state.randint(0, 20)), '100'))
+        return stocks
+
+    def trades(self, trades_count, span=None):
+        """
+        A method to generate trades of random stocks, in time order.
+        :param trades_count: the number of trades to generate.
+        :type trades_count: int
+        :param span: the time span the trades are spread over, ending now. By default all trades happen now.
+        :type span: timedelta
+        :return: the stock symbols, quantities, trade types, traded prices and time stamps of the trades, as the
+                 columns StockExchange.add_trades_bulk() accepts.
+        :rtype: tuple(list)
+        """
+        now = datetime.today().replace(microsecond=0)
+        if span is None:
+            time_stamps = [str(now)] * trades_count
+        else:
+            seconds = np.sort(self.random_state.randint(0, int(span.total_seconds()), trades_count))[::-1]
+            time_stamps = [str(now - timedelta(seconds=int(second))) for second in seconds]
+        stock_symbols = [self.stock_symbols[index] for index in
+                         self.random_state.randint(0, len(self.stock_symbols), trades_count)]
+        quantities = [str(quantity) for quantity in self.random_state.randint(1, 1000, trades_count)]
+        trade_types = [('buy', 'sell')[index] for index in self.random_state.randint(0, 2, trades_count)]
+        traded_prices = [str(price) for price in self.random_state.randint(100, 200, trades_count)]
+        return stock_symbols, quantities, trade_types, traded_prices, time_stamps
+
+    def stock_exchange(self, history_size):
+        """
+        A method to create a stock exchange with the generated stocks and a history of trades.
+        :param history_size: the number of trades in the history, spread over the last HISTORY_SPAN.
+        :type history_size: int
+        :return: the stock exchange.
+        :rtype: StockExchange
+        """
+        stock_exchange = StockExchange('benchmark')
+        for stock in self.stocks():
+            stock_exchange.add_new_stock(stock)
+        stock_symbols, quantities, trade_types, traded_prices, time_stamps = self.trades(history_size, HISTORY_SPAN)
+        stock_exchange.add_trades_bulk(stock_symbols=stock_symbols, quantities=quantities, trade_types=trade_types,
+                                       traded_prices=traded_prices, time_stamps=time_stamps)
+        return stock_exchange
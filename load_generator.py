@@ -0,0 +1,126 @@
+#!/usr/bin/python
+import argparse
+import httplib
+import json
+import random
+import threading
+import time
+import urlparse
+
+__author__ = 'Nikitas Papangelopoulos'
+
+"""
+A simple script to generate load on a running REST API server and report its throughput and latency, e.g. to compare
+the threaded and the async serving modes of rest_api_runner.py:
+    rest_api_runner.py -m threaded -p 5000 & load_generator.py -u http://127.0.0.1:5000 -c 200
+    rest_api_runner.py -m async -p 5001 & load_generator.py -u http://127.0.0.1:5001 -c 200
+Every client keeps one connection open and sends requests one after the other. A share of the requests (--writes)
+adds trades, the rest calculate the volume weighted price of a stock or the all share index.
+"""
+
+STOCK_SYMBOLS = ['TEA', 'POP', 'ALE', 'GIN', 'JOE']
+
+
+def post(connection, path, payload):
+    """
+    A method to send a json POST request and read its response.
+    :param connection: the connection to the server.
+    :type connection: httplib.HTTPConnection
+    :param path: the path of the request, e.g. /api/add_trade
+    :type path: str
+    :param payload: the json payload of the request.
+    :type payload: dict
+    :return: the status code of the response.
+    :rtype: int
+    """
+    connection.request('POST', path, json.dumps(payload), {'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def prepare_stock_exchange(host, port):
+    """
+    A method to create the stock exchange and its stocks, if they do not exist yet.
+    """
+    connection = httplib.HTTPConnection(host, port)
+    post(connection, '/api/create_stock_exchange', {'name': 'load_test'})
+    for stock_symbol in STOCK_SYMBOLS:
+        post(connection, '/api/add_stock', {'stock_symbol': stock_symbol, 'stock_type': 'common',
+                                            'last_dividend': '8', 'par_value': '100'})
+    connection.close()
+
+
+def run_client(host, port, write_share, end_time, latencies, errors):
+    """
+    A method, run by every client thread, that sends requests until end_time.
+    :param latencies: the list to add the latency of every successful request to, in seconds.
+    :type latencies: list
+    :param errors: the list to add the status code (or exception) of every failed request to.
+    :type errors: list
+    """
+    connection = httplib.HTTPConnection(host, port, timeout=30)
+    while time.time() < end_time:
+        stock_symbol = random.choice(STOCK_SYMBOLS)
+        if random.random() < write_share:
+            path = '/api/add_trade'
+            payload = {'stock_symbol': stock_symbol, 'quantity': str(random.randint(1, 1000)),
+                       'trade_type': random.choice(['buy', 'sell']),
+                       'traded_price': str(random.randint(100, 200))}
+        elif random.random() < 0.5:
+            path = '/api/calculate_volume_weighted_price'
+            payload = {'stock_symbol': stock_symbol}
+        else:
+            path = '/api/calculate_all_share_index'
+            payload = {}
+        started = time.time()
+        try:
+            status = post(connection, path, payload)
+        except (httplib.HTTPException, IOError) as error:
+            errors.append(error)
+            connection.close()
+            connection = httplib.HTTPConnection(host, port, timeout=30)
+            continue
+        if status == 200:
+            latencies.append(time.time() - started)
+        else:
+            errors.append(status)
+    connection.close()
+
+
+def percentile(sorted_values, share):
+    """
+    A method to get a percentile of sorted values.
+    """
+    return sorted_values[min(int(share * len(sorted_values)), len(sorted_values) - 1)] if sorted_values else 0.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate load on a running REST API server.')
+    parser.add_argument('-u', '--url', default='http://127.0.0.1:5000', help='The base URL of the server')
+    parser.add_argument('-c', '--clients', type=int, default=50, help='The number of concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=10.0, help='How long to run for, in seconds')
+    parser.add_argument('-w', '--writes', type=float, default=0.2, help='The share of requests that add trades')
+    args = parser.parse_args()
+
+    url = urlparse.urlparse(args.url)
+    prepare_stock_exchange(url.hostname, url.port or 80)
+
+    latencies = []
+    errors = []
+    end_time = time.time() + args.duration
+    clients = [threading.Thread(target=run_client, args=(url.hostname, url.port or 80, args.writes, end_time,
+                                                         latencies, errors))
+               for _ in range(args.clients)]
+    for client in clients:
+        client.daemon = True
+        client.start()
+    for client in clients:
+        client.join()
+
+    latencies.sort()
+    print('Clients: {}, duration: {} seconds, write share: {}'.format(args.clients, args.duration, args.writes))
+    print('Requests: {}, errors: {}, throughput: {:.1f} requests/second'.format(
+        len(latencies), len(errors), len(latencies) / args.duration))
+    print('Latency (ms): p50: {:.2f}, p90: {:.2f}, p99: {:.2f}, max: {:.2f}'.format(
+        *[1000 * percentile(latencies, share) for share in (0.5, 0.9, 0.99, 1.0)]))
@@ -1,7 +1,10 @@
 #!/usr/bin/python
+import argparse
 import logging.config
 
 from api import rest_api
+from simple_stock_exchange import instrumentation
+from simple_stock_exchange.rolling_vwap import DEFAULT_WINDOWS
 
 __author__ = 'Nikitas Papangelopoulos'
 
@@ -11,5 +14,41 @@ A simple script to run rest_api and start the REST API flask server.
 
 # Getting the logging settings
 logging.config.fileConfig('simple_stock_exchange/logging.conf', disable_existing_loggers=False)
+
+# Getting the user's input.
+parser = argparse.ArgumentParser(description='Start the REST API flask server.')
+parser.add_argument('-w', '--write-ahead-log',
+                    help='A write ahead log file, to recover the stock exchange from and to record its changes in')
+parser.add_argument('-f', '--fsync-policy', choices=['always', 'batch', 'never'], default='batch',
+                    help='When to sync the write ahead log to disk')
+parser.add_argument('-s', '--snapshot',
+                    help='A snapshot file, to load the stock exchange from before replaying the write ahead log')
+parser.add_argument('-r', '--retention', type=int,
+                    help='Drop trades older than this many minutes from memory, in the background')
+parser.add_argument('-a', '--archive', help='A file to append the trades dropped by --retention to')
+parser.add_argument('-i', '--instrument', action='store_true',
+                    help='Count and time the calls of the stock exchange and the api, served at /api/metrics')
+parser.add_argument('-m', '--mode', choices=['threaded', 'async'], default='threaded',
+                    help='Serve with a thread per connection (flask development server), or asynchronously with a '
+                         'single writer (requires gevent)')
+parser.add_argument('-p', '--port', type=int, default=5000, help='The port to listen at')
+args = parser.parse_args()
+# The subscriptions of the REST API need the trades of the longest window of their volume weighted prices.
+if args.retention and args.retention < max(DEFAULT_WINDOWS):
+    parser.error('--retention must be at least {} minutes, the longest window of the subscriptions.'.format(
+        max(DEFAULT_WINDOWS)))
+
+rest_api.write_ahead_log_path = args.write_ahead_log
+rest_api.write_ahead_log_options = {'fsync_policy': args.fsync_policy, 'snapshot_path': args.snapshot}
+if args.retention:
+    rest_api.retention_options = {'horizon': args.retention, 'archive_path': args.archive}
+if args.instrument:
+    instrumentation.enable()
 # running the REST API server.
-rest_api.app.run(threaded=True)
+if args.mode == 'async':
+    import gevent
+    from api.async_server import AsyncServer
+    rest_api.sleep = gevent.sleep
+    AsyncServer(rest_api.app, port=args.port).serve_forever()
+else:
+    rest_api.app.run(threaded=True, port=args.port)
@@ -1,4 +1,5 @@
 from stock import Stock
 from trade_record import TradeRecord
 from stock_exchange import StockExchange
+from time_stamp_parser import parse_time_stamp, current_time_stamp
 __all__ = ['stock', 'trade_record, stock_exchange']
@@ -0,0 +1,243 @@
+#!/usr/bin/python
+
+import logging
+import threading
+
+import numpy as np
+
+from time_stamp_parser import parse_time_stamp
+from trade_listener import TradeListener
+from trade_store import to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The default bar intervals, in seconds: 1 minute, 5 minutes and 1 hour.
+DEFAULT_INTERVALS = (60, 300, 3600)
+
+# The number of bars allocated for a stock and interval when its first bar is created.
+INITIAL_CAPACITY = 64
+
+# The type of the bars returned by BarBuilder.bars().
+BAR_TYPE = np.dtype([('time_stamp', 'i8'), ('open', 'f8'), ('high', 'f8'), ('low', 'f8'), ('close', 'f8'),
+                     ('volume', 'i8'), ('vwap', 'f8')])
+
+
+class _BarSeries(object):
+    """
+    A helper class to keep the bars of one stock for one interval in columns, sorted by the start of the bar.
+    """
+
+    # The names of all the columns of the bars.
+    _COLUMNS = ('starts', 'opens', 'highs', 'lows', 'closes', 'volumes', 'notionals', 'first_times', 'last_times',
+                'counts')
+    _TYPES = (np.int64, np.float64, np.float64, np.float64, np.float64, np.int64, np.float64, np.int64, np.int64,
+              np.int64)
+
+    def __init__(self):
+        self.size = 0
+        for column, column_type in zip(_BarSeries._COLUMNS, _BarSeries._TYPES):
+            setattr(self, column, np.empty(INITIAL_CAPACITY, dtype=column_type))
+
+    def _insert(self, position, start):
+        """
+        A helper method to add an empty bar at a position, shifting the later bars right by one.
+        """
+        if self.size == len(self.starts):
+            for column in _BarSeries._COLUMNS:
+                old_column = getattr(self, column)
+                new_column = np.empty(2 * self.size, dtype=old_column.dtype)
+                new_column[:self.size] = old_column[:self.size]
+                setattr(self, column, new_column)
+        for column in _BarSeries._COLUMNS:
+            values = getattr(self, column)
+            values[position + 1:self.size + 1] = values[position:self.size]
+        self.starts[position] = start
+        self.volumes[position] = 0
+        self.notionals[position] = 0.0
+        self.counts[position] = 0
+        self.size += 1
+
+    def _remove(self, position):
+        """
+        A helper method to remove the bar at a position, shifting the later bars left by one.
+        """
+        for column in _BarSeries._COLUMNS:
+            values = getattr(self, column)
+            values[position:self.size - 1] = values[position + 1:self.size]
+        self.size -= 1
+
+    def merge(self, start, open_price, high, low, close, volume, notional, first_time, last_time, count):
+        """
+        A method to add the aggregated trades of one bar interval to its bar, creating the bar if needed.
+        """
+        if self.size and self.starts[self.size - 1] == start:
+            # The usual case: the trades belong to the latest bar.
+            position = self.size - 1
+        else:
+            position = int(np.searchsorted(self.starts[:self.size], start))
+            if position == self.size or self.starts[position] != start:
+                self._insert(position, start)
+                self.opens[position], self.highs[position], self.lows[position] = open_price, high, low
+                self.closes[position], self.first_times[position], self.last_times[position] = \
+                    close, first_time, last_time
+        if first_time < self.first_times[position]:
+            self.opens[position], self.first_times[position] = open_price, first_time
+        if last_time >= self.last_times[position]:
+            self.closes[position], self.last_times[position] = close, last_time
+        self.highs[position] = max(self.highs[position], high)
+        self.lows[position] = min(self.lows[position], low)
+        self.volumes[position] += volume
+        self.notionals[position] += notional
+        self.counts[position] += count
+
+    def remove(self, start, traded_price, quantity, time_stamps, traded_prices, quantities):
+        """
+        A method to take a removed trade out of its bar, given the trades of the bar that are still stored.
+        If all the other trades of the bar are stored, the bar is rebuilt from them, since its high and low can not
+        be undone. Otherwise the earliest trades of the bar have expired (see StockExchange.expire_trades()) and their
+        prices are gone, so only the volume, the notional and the close are updated, and the open, high and low
+        stay as recorded.
+        """
+        position = int(np.searchsorted(self.starts[:self.size], start))
+        if position == self.size or self.starts[position] != start:
+            return
+        if self.counts[position] <= 1:
+            self._remove(position)
+            return
+        self.counts[position] -= 1
+        if len(time_stamps) == self.counts[position]:
+            self.opens[position], self.highs[position], self.lows[position] = \
+                traded_prices[0], traded_prices.max(), traded_prices.min()
+            self.volumes[position] = quantities.sum()
+            self.notionals[position] = (traded_prices * quantities).sum()
+            self.first_times[position] = time_stamps[0]
+        else:
+            self.volumes[position] -= quantity
+            self.notionals[position] -= traded_price * quantity
+        if len(time_stamps):
+            # The stored trades are the latest ones of the bar.
+            self.closes[position], self.last_times[position] = traded_prices[-1], time_stamps[-1]
+
+    def bars(self, starting_time, ending_time):
+        """
+        A method to get the bars that start between two times (both inclusive).
+        """
+        starts = self.starts[:self.size]
+        start = 0 if starting_time is None else int(np.searchsorted(starts, starting_time, side='left'))
+        end = self.size if ending_time is None else int(np.searchsorted(starts, ending_time, side='right'))
+        bars = np.empty(max(end - start, 0), dtype=BAR_TYPE)
+        bars['time_stamp'] = starts[start:end]
+        bars['open'] = self.opens[start:end]
+        bars['high'] = self.highs[start:end]
+        bars['low'] = self.lows[start:end]
+        bars['close'] = self.closes[start:end]
+        bars['volume'] = self.volumes[start:end]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bars['vwap'] = np.round(self.notionals[start:end] / self.volumes[start:end], decimals=3)
+        return bars
+
+
+class BarBuilder(TradeListener):
+    """
+    A class to keep open/high/low/close/volume/VWAP bars of the trades of every stock, for several bar intervals,
+    up to date as trades are recorded in and removed from a stock exchange. Trades are aggregated into their bar when
+    they are recorded, so reading bars does not go through the trades.
+    The open and close of a bar are the prices of its earliest and latest trade, also for out of order trades.
+    Example usage: bar_builder = BarBuilder(stock_exchange, intervals=(60, 3600))
+                   bar_builder.bars('TEA', 60, '2017-02-05 22:00:00', '2017-02-05 23:00:00')
+    """
+
+    def __init__(self, stock_exchange, intervals=DEFAULT_INTERVALS):
+        """
+        Constructor. The bars of the trades already recorded in the stock exchange are built, and the bar builder
+        follows the stock exchange from then on.
+        :param stock_exchange: the stock exchange whose trades to aggregate.
+        :type stock_exchange: StockExchange
+        :param intervals: the intervals of the bars, in seconds.
+        :type intervals: tuple
+        """
+        self.stock_exchange = stock_exchange
+        self.intervals = tuple(int(interval) for interval in intervals)
+        # The bars of each (stock symbol, interval).
+        self._bar_series = {}
+        self._lock = threading.Lock()
+        with stock_exchange.lock.write_locked():
+            for stock_symbol, trade_store in stock_exchange.recorded_trades.items():
+                self.trades_added(stock_symbol, *trade_store.columns()[:4])
+            stock_exchange.add_trade_listener(self)
+
+    def trades_added(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes):
+        """
+        A method to add recorded trades to their bars. See TradeListener.trades_added().
+        """
+        time_stamps = np.asarray(time_stamps, dtype=np.int64)
+        traded_prices = np.asarray(traded_prices, dtype=np.float64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        if not len(time_stamps):
+            return
+        with self._lock:
+            for interval in self.intervals:
+                # Aggregating the trades of each bar in one step, with the trades in timestamp order.
+                starts = time_stamps - time_stamps % interval
+                order = np.lexsort((time_stamps, starts))
+                sorted_starts = starts[order]
+                first_positions = np.flatnonzero(np.concatenate(([True], sorted_starts[1:] != sorted_starts[:-1])))
+                last_positions = np.concatenate((first_positions[1:], [len(order)])) - 1
+                sorted_prices = traded_prices[order]
+                sorted_quantities = quantities[order]
+                highs = np.maximum.reduceat(sorted_prices, first_positions)
+                lows = np.minimum.reduceat(sorted_prices, first_positions)
+                volumes = np.add.reduceat(sorted_quantities, first_positions)
+                notionals = np.add.reduceat(sorted_prices * sorted_quantities, first_positions)
+                bar_series = self._bar_series.setdefault((stock_symbol, interval), _BarSeries())
+                for bar, (first, last) in enumerate(zip(first_positions, last_positions)):
+                    bar_series.merge(sorted_starts[first], sorted_prices[first], highs[bar], lows[bar],
+                                     sorted_prices[last], volumes[bar], notionals[bar], time_stamps[order[first]],
+                                     time_stamps[order[last]], last - first + 1)
+
+    def trade_removed(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code):
+        """
+        A method to take a removed trade out of its bars, using the remaining trades of the stock exchange, since the
+        high and low of a bar can not be undone. See TradeListener.trade_removed() and _BarSeries.remove().
+        """
+        trade_store = self.stock_exchange.recorded_trades.get(stock_symbol)
+        with self._lock:
+            for interval in self.intervals:
+                bar_series = self._bar_series.get((stock_symbol, interval))
+                if bar_series is None:
+                    continue
+                start = int(time_stamp) - int(time_stamp) % interval
+                if trade_store is None:
+                    stored_trades = [np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64)]
+                else:
+                    stored_trades = trade_store.trades_between(start, start + interval - 1)[:3]
+                bar_series.remove(start, float(traded_price), int(quantity), *stored_trades)
+
+    def bars(self, stock_symbol, interval, starting_time=None, ending_time=None):
+        """
+        A method to get the bars of a stock that start in a time range.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param interval: the interval of the bars in seconds. It must be one of the intervals of the bar builder.
+        :type interval: int
+        :param starting_time: the earliest start of a bar, in the format Y-m-d H:M:S. By default the first bar.
+        :type starting_time: str
+        :param ending_time: the latest start of a bar, in the format Y-m-d H:M:S. By default the last bar.
+        :type ending_time: str
+        :return: the bars, as a numpy array of BAR_TYPE: the epoch timestamp of the start of the bar, its open,
+                 high, low and close price, its volume and its volume weighted price.
+        :rtype: numpy.ndarray
+        :raises ValueError: if the interval is not built, or a time is not in the format Y-m-d H:M:S.
+        """
+        if int(interval) not in self.intervals:
+            raise ValueError('Bars of {} seconds are not built. The intervals built are: {}'.format(
+                interval, self.intervals))
+        starting_time = None if starting_time is None else to_epoch(parse_time_stamp(starting_time))
+        ending_time = None if ending_time is None else to_epoch(parse_time_stamp(ending_time))
+        with self._lock:
+            bar_series = self._bar_series.get((stock_symbol, int(interval)))
+            if bar_series is None:
+                return np.empty(0, dtype=BAR_TYPE)
+            return bar_series.bars(starting_time, ending_time)
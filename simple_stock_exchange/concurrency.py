@@ -0,0 +1,140 @@
+#!/usr/bin/python
+
+import functools
+import threading
+from contextlib import contextmanager
+
+__author__ = 'Nikitas Papangelopoulos'
+
+
+class ReadWriteLock(object):
+    """
+    A class for a lock that can be held by many readers at once, or by a single writer.
+    Waiting writers are preferred over new readers, so a steady stream of reads can not starve the writes.
+    Both locks are reentrant: a thread holding the read lock can take it again, and a thread holding the write lock
+    can take either lock again. A thread holding only the read lock can not take the write lock.
+    Example usage: with lock.read_locked(): ...
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._write_depth = 0
+        # The number of times the current thread holds the read lock.
+        self._local = threading.local()
+
+    def acquire_read(self):
+        """
+        A method to take the read lock, waiting while a writer holds or waits for the lock.
+        """
+        thread = threading.current_thread()
+        with self._condition:
+            if self._writer is thread:
+                self._write_depth += 1
+                return
+            reads = getattr(self._local, 'reads', 0)
+            if not reads:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+                self._readers += 1
+            self._local.reads = reads + 1
+
+    def release_read(self):
+        """
+        A method to release the read lock.
+        """
+        with self._condition:
+            if self._writer is threading.current_thread():
+                self._write_depth -= 1
+                return
+            self._local.reads -= 1
+            if not self._local.reads:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        """
+        A method to take the write lock, waiting until no other thread holds the lock.
+        :raises RuntimeError: if the current thread holds only the read lock.
+        """
+        thread = threading.current_thread()
+        with self._condition:
+            if self._writer is thread:
+                self._write_depth += 1
+                return
+            if getattr(self._local, 'reads', 0):
+                raise RuntimeError('The read lock can not be upgraded to the write lock.')
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = thread
+            self._write_depth = 1
+
+    def release_write(self):
+        """
+        A method to release the write lock.
+        """
+        with self._condition:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def read_locked(self):
+        """
+        A context manager that holds the read lock.
+        """
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write_locked(self):
+        """
+        A context manager that holds the write lock.
+        """
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def reads(method):
+    """
+    A decorator for methods that hold the read lock (self.lock) of their object while they run.
+    """
+    @functools.wraps(method)
+    def locked_method(self, *args, **kwargs):
+        self.lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.lock.release_read()
+    return locked_method
+
+
+def writes(method):
+    """
+    A decorator for methods that hold the write lock (self.lock) of their object while they run.
+    """
+    @functools.wraps(method)
+    def locked_method(self, *args, **kwargs):
+        self.lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.lock.release_write()
+    return locked_method
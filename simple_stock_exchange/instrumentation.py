@@ -0,0 +1,279 @@
+#!/usr/bin/python
+
+import functools
+import logging
+import threading
+import timeit
+import weakref
+from bisect import bisect_left
+
+from sharded_stock_exchange import ShardedStockExchange
+from stock import Stock
+from stock_exchange import StockExchange
+from trade_record import TradeRecord
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+"""
+A module to count and time the calls of the hot paths of the stock exchange: the public methods of StockExchange, the
+constructors of Stock and TradeRecord, and any other function registered with instrument() (e.g. the routes of the
+REST API). Instrumentation is disabled by default, and while it is disabled the original functions are in place, so
+it costs nothing. Once enabled, every call is counted and its latency is added to a histogram. The counters are kept
+per thread, so that calls do not contend for a lock, and are merged when they are read. The counters of threads that
+have finished are folded into shared totals, so servers that start a thread per request do not keep one set of
+counters per request.
+Example usage: instrumentation.enable()
+               ...
+               print(instrumentation.render_text())
+"""
+
+# The upper bounds, in seconds, of the buckets of the latency histograms: powers of 2 from 1 microsecond to about 16
+# seconds. Slower calls go to a last, unbounded, bucket.
+BUCKET_BOUNDS = tuple(2 ** power / 1e6 for power in range(25))
+
+# The prefix of the names of the metrics in the text format.
+METRICS_PREFIX = 'simple_stock_exchange'
+
+# The functions that are instrumented when instrumentation is enabled: (owner, attribute, metric name, original).
+# The owner is a class or a dict, e.g. the view functions of a flask application.
+_targets = []
+_enabled = False
+_targets_lock = threading.Lock()
+
+# The counters of every live thread that made an instrumented call, by metric name: [calls, errors, seconds, buckets],
+# with a weak reference to their thread. The counters of finished threads are folded into _finished_counters.
+_local = threading.local()
+_thread_counters = []
+_finished_counters = {}
+_thread_counters_lock = threading.Lock()
+
+
+def _get(owner, attribute):
+    """
+    A helper method to get an attribute of a class, as it is stored in the class (e.g. a staticmethod), or an item of
+    a dict.
+    """
+    return owner[attribute] if isinstance(owner, dict) else owner.__dict__[attribute]
+
+
+def _set(owner, attribute, value):
+    """
+    A helper method to set an attribute of a class, or an item of a dict.
+    """
+    if isinstance(owner, dict):
+        owner[attribute] = value
+    else:
+        setattr(owner, attribute, value)
+
+
+def _counters():
+    """
+    A helper method to get the counters of the current thread, creating them on its first instrumented call.
+    """
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = {}
+        with _thread_counters_lock:
+            _fold_finished_threads()
+            _thread_counters.append((weakref.ref(threading.current_thread()), counters))
+    return counters
+
+
+def _merge(merged, counters):
+    """
+    A helper method to add counters, by metric name, to merged counters of the same format.
+    """
+    for name, (calls, errors, seconds, buckets) in list(counters.items()):
+        metric = merged.get(name)
+        if metric is None:
+            metric = merged[name] = [0, 0, 0.0, [0] * (len(BUCKET_BOUNDS) + 1)]
+        metric[0] += calls
+        metric[1] += errors
+        metric[2] += seconds
+        metric[3] = [total + count for total, count in zip(metric[3], buckets)]
+
+
+def _fold_finished_threads():
+    """
+    A helper method to fold the counters of the threads that have finished into the shared totals, so that only the
+    counters of live threads are kept apart. The lock of the thread counters must be held.
+    """
+    live_thread_counters = []
+    for thread_reference, counters in _thread_counters:
+        thread = thread_reference()
+        if thread is not None and thread.is_alive():
+            live_thread_counters.append((thread_reference, counters))
+        else:
+            # A finished thread no longer changes its counters.
+            _merge(_finished_counters, counters)
+    _thread_counters[:] = live_thread_counters
+
+
+def _record(name, seconds, failed):
+    """
+    A helper method to record a call in the counters of the current thread.
+    """
+    counters = _counters()
+    metric = counters.get(name)
+    if metric is None:
+        metric = counters[name] = [0, 0, 0.0, [0] * (len(BUCKET_BOUNDS) + 1)]
+    metric[0] += 1
+    if failed:
+        metric[1] += 1
+    metric[2] += seconds
+    metric[3][bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+
+def _timed(name, function):
+    """
+    A helper method to wrap a function so that its calls are counted and timed.
+    """
+    # Static and class methods are unwrapped and wrapped again, so they stay what they were.
+    if isinstance(function, (staticmethod, classmethod)):
+        return type(function)(_timed(name, function.__func__))
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs):
+        failed = True
+        started = timeit.default_timer()
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+            return result
+        finally:
+            _record(name, timeit.default_timer() - started, failed)
+    return timed_function
+
+
+def instrument(owner, attribute, name=None):
+    """
+    A method to register a function to be counted and timed while instrumentation is enabled.
+    :param owner: the class the function is a method of, or a dict the function is an item of.
+    :type owner: type | dict
+    :param attribute: the name of the method, or the key of the function in the dict.
+    :type attribute: str
+    :param name: the name of the metric of the function. By default: the name of the class and the method.
+    :type name: str
+    """
+    if name is None:
+        name = '{}.{}'.format(owner.__name__, attribute)
+    with _targets_lock:
+        original = _get(owner, attribute)
+        _targets.append((owner, attribute, name, original))
+        if _enabled:
+            _set(owner, attribute, _timed(name, original))
+
+
+def enable():
+    """
+    A method to start counting and timing the calls of the registered functions.
+    """
+    global _enabled
+    with _targets_lock:
+        if not _enabled:
+            for owner, attribute, name, original in _targets:
+                _set(owner, attribute, _timed(name, original))
+            _enabled = True
+    logger.info('Instrumentation enabled for %s functions.', len(_targets))
+
+
+def disable():
+    """
+    A method to stop counting and timing calls, putting the original functions back. The counters are kept.
+    """
+    global _enabled
+    with _targets_lock:
+        if _enabled:
+            for owner, attribute, name, original in _targets:
+                _set(owner, attribute, original)
+            _enabled = False
+    logger.info('Instrumentation disabled.')
+
+
+def is_enabled():
+    """
+    A method to check if instrumentation is enabled.
+    :rtype: bool
+    """
+    return _enabled
+
+
+def reset():
+    """
+    A method to set all the counters back to zero.
+    """
+    with _thread_counters_lock:
+        for thread_reference, counters in _thread_counters:
+            counters.clear()
+        _finished_counters.clear()
+
+
+def _quantile(buckets, count, share):
+    """
+    A helper method to estimate a quantile of the latencies from a histogram, as the upper bound of its bucket.
+    """
+    rank = share * count
+    seen = 0
+    for position, bucket_count in enumerate(buckets):
+        seen += bucket_count
+        if seen >= rank and bucket_count:
+            return BUCKET_BOUNDS[position] if position < len(BUCKET_BOUNDS) else float('inf')
+    return 0.0
+
+
+def snapshot():
+    """
+    A method to get the counters of all threads, merged.
+    :return: by metric name: the number of calls, the number of calls that raised an error, the total time of the
+             calls in seconds, the number of calls in every bucket of the histogram (see BUCKET_BOUNDS), and estimates
+             of the 50th, 90th and 99th percentiles of the latency in seconds.
+    :rtype: dict
+    """
+    with _thread_counters_lock:
+        _fold_finished_threads()
+        totals = {}
+        _merge(totals, _finished_counters)
+        # The counters of other threads can change while they are read. _merge() copies them so the iteration is safe.
+        for thread_reference, counters in _thread_counters:
+            _merge(totals, counters)
+    merged = {}
+    for name, (calls, errors, seconds, buckets) in totals.items():
+        metric = merged[name] = {'calls': calls, 'errors': errors, 'seconds': seconds, 'buckets': buckets}
+        for percentile_name, share in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            metric[percentile_name] = _quantile(buckets, calls, share)
+    return merged
+
+
+def render_text():
+    """
+    A method to format the merged counters as text, in the Prometheus exposition format.
+    :rtype: str
+    """
+    metrics = snapshot()
+    lines = ['# Instrumentation is {}.'.format('enabled' if _enabled else 'disabled'),
+             '# TYPE {}_calls_total counter'.format(METRICS_PREFIX),
+             '# TYPE {}_errors_total counter'.format(METRICS_PREFIX),
+             '# TYPE {}_latency_seconds histogram'.format(METRICS_PREFIX)]
+    for name in sorted(metrics):
+        metric = metrics[name]
+        label = 'name="{}"'.format(name)
+        lines.append('{}_calls_total{{{}}} {}'.format(METRICS_PREFIX, label, metric['calls']))
+        lines.append('{}_errors_total{{{}}} {}'.format(METRICS_PREFIX, label, metric['errors']))
+        cumulative = 0
+        for bound, count in zip(BUCKET_BOUNDS + ('+Inf',), metric['buckets']):
+            cumulative += count
+            lines.append('{}_latency_seconds_bucket{{{},le="{}"}} {}'.format(METRICS_PREFIX, label, bound, cumulative))
+        lines.append('{}_latency_seconds_sum{{{}}} {!r}'.format(METRICS_PREFIX, label, metric['seconds']))
+        lines.append('{}_latency_seconds_count{{{}}} {}'.format(METRICS_PREFIX, label, metric['calls']))
+    return '\n'.join(lines) + '\n'
+
+
+# The hot paths of the stock exchange, and the methods the sharded stock exchange overrides or adds.
+for _owner in (StockExchange, ShardedStockExchange):
+    for _attribute in sorted(_owner.__dict__):
+        if not _attribute.startswith('_') and callable(getattr(_owner, _attribute)):
+            instrument(_owner, _attribute)
+instrument(Stock, '__init__', 'Stock.__init__')
+instrument(TradeRecord, '__init__', 'TradeRecord.__init__')
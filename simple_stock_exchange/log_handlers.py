@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import logging
+import Queue
+import threading
+
+__author__ = 'Nikitas Papangelopoulos'
+
+# The maximum number of log records waiting to be written, before new ones are dropped.
+MAX_QUEUED_RECORDS = 100000
+
+
+class QueueFileHandler(logging.Handler):
+    """
+    A logging handler that writes log records to a file from a background thread, so that the threads doing the
+    logging never wait for the disk. Records are put in a bounded queue and formatted by the background thread.
+    The message of a record is rendered before it is queued, so its arguments may be modified after logging them.
+    If the queue is full, records are dropped (and counted) instead of blocking the caller.
+    Example usage in a logging.conf file:
+        [handler_logfile]
+        class=simple_stock_exchange.log_handlers.QueueFileHandler
+        args=('Stocks.log', 'a', 'utf8')
+    """
+
+    def __init__(self, filename, mode='a', encoding=None, max_queued_records=MAX_QUEUED_RECORDS):
+        """
+        Constructor.
+        :param filename: the path of the log file.
+        :type filename: str
+        :param mode: the mode to open the log file with.
+        :type mode: str
+        :param encoding: the encoding of the log file.
+        :type encoding: str
+        :param max_queued_records: the maximum number of records waiting to be written.
+        :type max_queued_records: int
+        """
+        logging.Handler.__init__(self)
+        self.dropped_records = 0
+        self._file_handler = logging.FileHandler(filename, mode, encoding, delay=True)
+        self._queue = Queue.Queue(max_queued_records)
+        self._writer_thread = threading.Thread(target=self._write_records, name='QueueFileHandler')
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    def setFormatter(self, fmt):
+        """
+        A method to set the formatter of the handler. It is used by the background thread.
+        :param fmt: the formatter to use.
+        :type fmt: logging.Formatter
+        """
+        logging.Handler.setFormatter(self, fmt)
+        self._file_handler.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        A method to render the message and exception of a log record on the calling thread, like
+        logging.handlers.QueueHandler does, so that the queued record no longer refers to the logged arguments.
+        :param record: the log record to prepare.
+        :type record: logging.LogRecord
+        :return: the prepared log record.
+        :rtype: logging.LogRecord
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = (self.formatter or logging._defaultFormatter).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        """
+        A method to queue a log record for writing. The record is formatted later, by the background thread.
+        :param record: the log record to write.
+        :type record: logging.LogRecord
+        """
+        try:
+            self._queue.put_nowait(self.prepare(record))
+        except Queue.Full:
+            self.dropped_records += 1
+
+    def _write_records(self):
+        """
+        A helper method, run by the background thread, that writes the queued log records until the handler is
+        closed.
+        """
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            self._file_handler.handle(record)
+            if self._queue.empty():
+                self._file_handler.flush()
+
+    def restart_writer(self):
+        """
+        A method to start a new background thread in a forked process, since threads do not survive a fork. Records
+        queued by the parent process but not yet written are left to the parent.
+        """
+        self.createLock()
+        self._file_handler.createLock()
+        self._queue = Queue.Queue(self._queue.maxsize)
+        self._writer_thread = threading.Thread(target=self._write_records, name='QueueFileHandler')
+        self._writer_thread.daemon = True
+        self._writer_thread.start()
+
+    def flush(self):
+        """
+        A method to flush the log file. Records that are still queued are not waited for.
+        """
+        self._file_handler.flush()
+
+    def close(self):
+        """
+        A method to write all the queued log records, stop the background thread and close the log file.
+        """
+        if self._writer_thread.is_alive():
+            self._queue.put(None)
+            self._writer_thread.join()
+        self._file_handler.close()
+        logging.Handler.close(self)
@@ -0,0 +1,312 @@
+#!/usr/bin/python
+
+import logging
+import threading
+import timeit
+from collections import OrderedDict
+
+from rolling_vwap import RollingVWAP
+from time_stamp_parser import TIME_STAMP_FORMAT
+from trade_listener import TradeListener
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The default maximum number of updates per second a subscriber gets for each stock and kind of update.
+DEFAULT_MAX_RATE = 4.0
+
+# The kinds of updates: a new current price of a stock, and new volume weighted prices of a stock.
+PRICE_EVENT = 'price'
+VWAP_EVENT = 'vwap'
+
+
+class Subscription(object):
+    """
+    A class to hold the updates of the stocks a subscriber follows, until the subscriber takes them.
+    Only the latest update of each stock and kind is kept: a newer update replaces the one still pending, so a slow
+    subscriber gets the latest values and not a backlog. Each update is also held back until at least 1 / max_rate
+    seconds have passed since the previous update of its stock and kind was taken, so that a stock that trades often
+    is sent at most max_rate times per second.
+    Example usage: subscription = price_broadcaster.subscribe(['TEA', 'POP'])
+                   for event, stock_symbol, data in subscription.pop_updates():
+                       ...
+    """
+
+    def __init__(self, stock_symbols, max_rate=DEFAULT_MAX_RATE, clock=timeit.default_timer):
+        """
+        Constructor.
+        :param stock_symbols: the symbols (abbreviated names) of the stocks to follow.
+        :type stock_symbols: list(str)
+        :param max_rate: the maximum number of updates per second for each stock and kind of update.
+        :type max_rate: float
+        :param clock: a function that returns the current time in seconds.
+        :type clock: function
+        :raises ValueError: if the maximum rate is not a positive number.
+        """
+        if not float(max_rate) > 0:
+            raise ValueError('The maximum rate must be a positive number. You entered: {}'.format(max_rate))
+        self.stock_symbols = frozenset(stock_symbols)
+        self.interval = 1.0 / float(max_rate)
+        self.clock = clock
+        # The latest pending update of each (kind, stock symbol), in the order they first became pending.
+        self._pending = OrderedDict()
+        # The time the last update of each (kind, stock symbol) was taken.
+        self._taken = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.coalesced = 0
+
+    def publish(self, event, stock_symbol, data):
+        """
+        A method to add an update, replacing the pending update of the same stock and kind, if any.
+        :param event: the kind of the update (PRICE_EVENT or VWAP_EVENT).
+        :type event: str
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param data: the update.
+        :type data: dict
+        """
+        key = (event, stock_symbol)
+        with self._lock:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = data
+            self.published += 1
+
+    def pop_updates(self):
+        """
+        A method to take the pending updates that are due, i.e. whose stock and kind was not taken in the last
+        1 / max_rate seconds. Updates that are not due yet stay pending.
+        :return: the kind, stock symbol and data of each update.
+        :rtype: list(tuple)
+        """
+        now = self.clock()
+        updates = []
+        with self._lock:
+            for key in [key for key in self._pending if now - self._taken.get(key, float('-inf')) >= self.interval]:
+                self._taken[key] = now
+                updates.append(key + (self._pending.pop(key),))
+        return updates
+
+    def next_due(self):
+        """
+        A method to find when the next pending update will be due.
+        :return: the seconds until then (0 if an update is due already), or None if no updates are pending.
+        :rtype: float | None
+        """
+        now = self.clock()
+        with self._lock:
+            if not self._pending:
+                return None
+            return max(min(self._taken.get(key, float('-inf')) + self.interval for key in self._pending) - now, 0.0)
+
+
+class PriceBroadcaster(TradeListener):
+    """
+    A class to push the changes of the current price of stocks (see StockExchange.update_stock_price()) and of their
+    rolling volume weighted prices (see RollingVWAP) to subscribers, as they happen, instead of the subscribers polling
+    the stock exchange. Every subscriber has its own Subscription, with the latest update of each stock it follows.
+    Updates are published while the stock exchange holds its write lock, so publishing is kept to replacing a pending
+    update, and stocks nobody follows cost a dict lookup. Volume weighted prices also change without any trade, as
+    trades age out of their windows, so refresh() must be called periodically (e.g. by every subscriber) to publish
+    them.
+    Example usage: price_broadcaster = PriceBroadcaster(stock_exchange)
+                   subscription = price_broadcaster.subscribe(['TEA'])
+                   ...
+                   price_broadcaster.unsubscribe(subscription)
+    """
+
+    def __init__(self, stock_exchange, rolling_vwap=None, max_rate=DEFAULT_MAX_RATE, clock=timeit.default_timer):
+        """
+        Constructor. The broadcaster follows the stock exchange from then on.
+        :param stock_exchange: the stock exchange whose prices to broadcast.
+        :type stock_exchange: StockExchange
+        :param rolling_vwap: the rolling volume weighted prices to broadcast. It must already be a listener of the
+                             stock exchange. By default a RollingVWAP over its default windows is created, with the
+                             trades of the stock exchange that are still in its windows.
+        :type rolling_vwap: RollingVWAP
+        :param max_rate: the default, and the highest, maximum number of updates per second a subscriber gets for each
+                         stock and kind of update.
+        :type max_rate: float
+        :param clock: a function that returns the current time in seconds.
+        :type clock: function
+        :raises ValueError: if a window of the rolling volume weighted prices is longer than the horizon after which
+                            the stock exchange drops trades (see RetentionPolicy).
+        """
+        self.stock_exchange = stock_exchange
+        self.max_rate = float(max_rate)
+        self.clock = clock
+        # The subscriptions following each stock.
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+        # The last published volume weighted prices of each stock, and when they were last refreshed.
+        self._published_vwaps = {}
+        self._refreshed = float('-inf')
+        self._refresh_lock = threading.Lock()
+        # Whether the rolling volume weighted prices were created by the broadcaster, and are removed with it.
+        self._owns_rolling_vwap = rolling_vwap is None
+        with stock_exchange.lock.write_locked():
+            if rolling_vwap is None:
+                rolling_vwap = RollingVWAP()
+                stock_exchange.add_trade_listener(rolling_vwap)
+            self.rolling_vwap = rolling_vwap
+            # Added after the rolling volume weighted prices, so that they are up to date when they are published.
+            stock_exchange.add_trade_listener(self)
+
+    def subscribe(self, stock_symbols, max_rate=None):
+        """
+        A method to start following stocks. The current price and volume weighted prices of the stocks are pending
+        right away, so the subscriber starts from the latest values.
+        :param stock_symbols: the symbols (abbreviated names) of the stocks to follow. They do not need to be
+                              registered yet.
+        :type stock_symbols: list(str)
+        :param max_rate: the maximum number of updates per second for each stock and kind of update. By default, and
+                         at most, the maximum rate of the broadcaster.
+        :type max_rate: float
+        :return: the subscription to take the updates from.
+        :rtype: Subscription
+        :raises ValueError: if the maximum rate is not a positive number.
+        """
+        max_rate = self.max_rate if max_rate is None else min(float(max_rate), self.max_rate)
+        subscription = Subscription(stock_symbols, max_rate, self.clock)
+        # Holding the read lock, so that no update is published between the current values and the first update.
+        with self.stock_exchange.lock.read_locked():
+            with self._lock:
+                for stock_symbol in subscription.stock_symbols:
+                    self._subscriptions[stock_symbol] = self._subscriptions.get(stock_symbol, ()) + (subscription,)
+            for stock_symbol in subscription.stock_symbols:
+                current_stock = self.stock_exchange.registered_stocks.get(stock_symbol)
+                if current_stock is not None and current_stock.current_price_timestamp:
+                    subscription.publish(PRICE_EVENT, stock_symbol, self._price_update(
+                        stock_symbol, current_stock.current_price, current_stock.current_price_timestamp))
+                if stock_symbol in self.stock_exchange.recorded_trades:
+                    # If the volume weighted prices changed since they were last published, every subscription of
+                    # the stock gets them. Otherwise only the new one does.
+                    with self._refresh_lock:
+                        if not self._publish_vwap(stock_symbol, only_changed=True):
+                            subscription.publish(VWAP_EVENT, stock_symbol, self._vwap_update(stock_symbol))
+        logger.info('Subscribed to the prices of stocks: %s.', sorted(subscription.stock_symbols))
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        A method to stop following the stocks of a subscription.
+        :param subscription: the subscription.
+        :type subscription: Subscription
+        """
+        with self._lock:
+            for stock_symbol in subscription.stock_symbols:
+                remaining = tuple(other for other in self._subscriptions.get(stock_symbol, ())
+                                  if other is not subscription)
+                if remaining:
+                    self._subscriptions[stock_symbol] = remaining
+                else:
+                    self._subscriptions.pop(stock_symbol, None)
+        logger.info('Unsubscribed from the prices of stocks: %s.', sorted(subscription.stock_symbols))
+
+    def close(self):
+        """
+        A method to stop following the stock exchange, e.g. when it is replaced. The rolling volume weighted prices
+        are also removed from the stock exchange, if the broadcaster created them. Subscriptions get no more updates.
+        """
+        with self.stock_exchange.lock.write_locked():
+            self.stock_exchange.remove_trade_listener(self)
+            if self._owns_rolling_vwap:
+                self.stock_exchange.remove_trade_listener(self.rolling_vwap)
+        with self._lock:
+            self._subscriptions.clear()
+
+    def refresh(self):
+        """
+        A method to publish the volume weighted prices of the followed stocks that changed since they were last
+        published, because trades aged out of their windows. It can be called as often as needed, e.g. by every
+        subscriber whenever it wakes up: it does nothing if it ran less than 1 / max_rate seconds ago, or is running.
+        :return: the symbols of the stocks whose volume weighted prices were published.
+        :rtype: list(str)
+        """
+        now = self.clock()
+        if now - self._refreshed < 1.0 / self.max_rate:
+            return []
+        # Holding the read lock, so that no trade publishes newer volume weighted prices in the meantime. It is taken
+        # before the refresh lock, in the same order as in subscribe().
+        with self.stock_exchange.lock.read_locked():
+            if not self._refresh_lock.acquire(False):
+                return []
+            try:
+                self._refreshed = now
+                return [stock_symbol for stock_symbol in list(self._subscriptions)
+                        if self._publish_vwap(stock_symbol, only_changed=True)]
+            finally:
+                self._refresh_lock.release()
+
+    @property
+    def subscriptions(self):
+        """The number of subscriptions following each stock."""
+        with self._lock:
+            return dict((stock_symbol, len(subscriptions)) for stock_symbol, subscriptions in
+                        self._subscriptions.items())
+
+    @staticmethod
+    def _price_update(stock_symbol, current_price, time_stamp):
+        """
+        A helper method to make the update of a new current price of a stock.
+        """
+        return {'stock_symbol': stock_symbol, 'current_price': float(current_price),
+                'time_stamp': time_stamp.strftime(TIME_STAMP_FORMAT)}
+
+    def _vwap_update(self, stock_symbol):
+        """
+        A helper method to make the update of the volume weighted prices of a stock, over every window it is followed.
+        """
+        volume_weighted_prices = {}
+        for window in self.rolling_vwap.windows:
+            try:
+                volume_weighted_price = self.rolling_vwap.volume_weighted_price(stock_symbol, window)
+            except KeyError:
+                continue
+            volume_weighted_prices[str(window)] = None if volume_weighted_price is None else float(
+                volume_weighted_price)
+        return {'stock_symbol': stock_symbol, 'volume_weighted_prices': volume_weighted_prices}
+
+    def price_updated(self, stock_symbol, current_price, time_stamp):
+        """
+        A method to publish a new current price of a stock. See TradeListener.price_updated().
+        """
+        subscriptions = self._subscriptions.get(stock_symbol)
+        if subscriptions:
+            update = self._price_update(stock_symbol, current_price, time_stamp)
+            for subscription in subscriptions:
+                subscription.publish(PRICE_EVENT, stock_symbol, update)
+
+    def trades_added(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes):
+        """
+        A method to publish the volume weighted prices of a stock, after trades were recorded. See
+        TradeListener.trades_added().
+        """
+        self._publish_vwap(stock_symbol)
+
+    def trade_removed(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code):
+        """
+        A method to publish the volume weighted prices of a stock, after a trade was removed. See
+        TradeListener.trade_removed().
+        """
+        self._publish_vwap(stock_symbol)
+
+    def _publish_vwap(self, stock_symbol, only_changed=False):
+        """
+        A helper method to publish the volume weighted prices of a stock to its subscriptions, if it has any, and
+        optionally only if they changed since they were last published.
+        :return: whether the volume weighted prices were published.
+        :rtype: bool
+        """
+        subscriptions = self._subscriptions.get(stock_symbol)
+        if not subscriptions:
+            return False
+        update = self._vwap_update(stock_symbol)
+        if only_changed and self._published_vwaps.get(stock_symbol) == update['volume_weighted_prices']:
+            return False
+        self._published_vwaps[stock_symbol] = update['volume_weighted_prices']
+        for subscription in subscriptions:
+            subscription.publish(VWAP_EVENT, stock_symbol, update)
+        return True
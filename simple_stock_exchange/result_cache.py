@@ -0,0 +1,131 @@
+#!/usr/bin/python
+
+import logging
+import threading
+from collections import OrderedDict
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The default maximum number of results kept by a result cache.
+DEFAULT_CAPACITY = 4096
+
+# Returned by ResultCache.get() for results that are not cached, since None is a valid result.
+MISSING = object()
+
+
+class ResultCache(object):
+    """
+    A class to keep the results of the calculators of a stock exchange, so that a calculation repeated between two
+    changes to its inputs is not made again. Results are kept by (metric, stock symbol, arguments), together with the
+    version of the stock they were calculated from. The stock exchange bumps the version of a stock whenever its
+    trades or its registration change, so a cached result is only used while the stock is exactly as it was.
+    When the cache is full, the least recently used result is evicted.
+    Versions are bumped by the writers of the stock exchange while they hold its write lock, and read by the
+    calculators while they hold at least its read lock. Calculators that do not hold the lock take the version before
+    calculating, and cache their result with it. The cache itself has a lock, since readers run concurrently.
+    Example usage: result = result_cache.get('vw_price', 'TEA', (15,))
+                   if result is MISSING:
+                       result = ...
+                       result_cache.put('vw_price', 'TEA', (15,), result)
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        """
+        Constructor.
+        :param capacity: the maximum number of results to keep. With 0 no results are kept.
+        :type capacity: int
+        """
+        self.capacity = int(capacity)
+        self._results = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def version(self, stock_symbol):
+        """
+        A method to get the current version of a stock.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :rtype: int
+        """
+        return self._versions.get(stock_symbol, 0)
+
+    def invalidate(self, stock_symbol):
+        """
+        A method to bump the version of a stock, so that no result calculated before is used again. The results are
+        not removed, they are replaced when calculated again or evicted.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        """
+        self._versions[stock_symbol] = self._versions.get(stock_symbol, 0) + 1
+
+    def get(self, metric, stock_symbol, arguments):
+        """
+        A method to get a cached result, if it was calculated from the current version of the stock.
+        :param metric: the name of the calculated metric.
+        :type metric: str
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param arguments: the other arguments the result was calculated with. They must be hashable.
+        :type arguments: tuple
+        :return: the result, or MISSING.
+        """
+        key = (metric, stock_symbol, arguments)
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] == self._versions.get(stock_symbol, 0):
+                # Moving the result to the end, as the most recently used.
+                del self._results[key]
+                self._results[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return MISSING
+
+    def put(self, metric, stock_symbol, arguments, result, version=None):
+        """
+        A method to cache a result, calculated from a version of the stock.
+        :param metric: the name of the calculated metric.
+        :type metric: str
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param arguments: the other arguments the result was calculated with. They must be hashable.
+        :type arguments: tuple
+        :param result: the result to cache.
+        :param version: the version of the stock the result was calculated from, if it may have changed since. By
+                        default: the current version of the stock.
+        :type version: int
+        """
+        if not self.capacity:
+            return
+        key = (metric, stock_symbol, arguments)
+        with self._lock:
+            self._results.pop(key, None)
+            self._results[key] = (self._versions.get(stock_symbol, 0) if version is None else version, result)
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        A method to remove all cached results. The statistics are kept.
+        """
+        with self._lock:
+            self._results.clear()
+
+    def statistics(self):
+        """
+        A method to get the statistics of the cache.
+        :return: the number of hits, misses and evictions, the hit ratio, and the number of cached results and the
+                 capacity of the cache.
+        :rtype: dict
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_ratio': float(self.hits) / lookups if lookups else 0.0, 'size': len(self._results),
+                    'capacity': self.capacity}
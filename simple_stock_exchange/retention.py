@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+import logging
+import threading
+
+from rolling_vwap import RollingVWAP, current_epoch
+from stock_exchange import MINUTES_FOR_VW_PRICE
+from write_ahead_log import WriteAheadLog
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The default age, in minutes, after which trades are dropped from memory.
+DEFAULT_HORIZON = 240
+
+# The default time, in seconds, between two passes over the stocks of the stock exchange.
+DEFAULT_INTERVAL = 60
+
+
+class RetentionPolicy(object):
+    """
+    A class to stop the trades of a long running stock exchange from growing without bound, by dropping the trades
+    that are older than a horizon, in the background.
+    Each pass goes through the stocks one by one, holding the write lock of the stock exchange only while the old
+    trades of one stock are dropped, so the stock exchange is not stalled for the whole pass.
+    The horizon can not be shorter than the time frame of the volume weighted price, or the windows of the
+    RollingVWAP listeners of the stock exchange, so these stay correct. Until the policy is stopped, RollingVWAP
+    listeners with longer windows can not be added either (see StockExchange.retention_horizon). Dropped trades can be
+    kept:
+        - in an archive file, in the format of the write ahead log (see write_ahead_log.read_write_ahead_log()).
+        - as bars, by a BarBuilder listener of the stock exchange, which keeps the bars of dropped trades.
+    Example usage: retention_policy = RetentionPolicy(stock_exchange, horizon=120, archive_path='trades.archive')
+                   retention_policy.start()
+    """
+
+    def __init__(self, stock_exchange, horizon=DEFAULT_HORIZON, archive_path=None, interval=DEFAULT_INTERVAL,
+                 clock=current_epoch):
+        """
+        Constructor.
+        :param stock_exchange: the stock exchange whose trades to drop.
+        :type stock_exchange: StockExchange
+        :param horizon: the age in minutes after which trades are dropped.
+        :type horizon: int
+        :param archive_path: an optional file to append the dropped trades to.
+        :type archive_path: str
+        :param interval: the time in seconds between two passes of the background thread.
+        :type interval: float
+        :param clock: a function that returns the current time in epoch seconds.
+        :type clock: function
+        :raises ValueError: if the horizon is shorter than a time frame the volume weighted price is calculated for.
+        """
+        # Holding the write lock, so that no listener is added between checking the listeners and setting the horizon.
+        with stock_exchange.lock.write_locked():
+            minimum_horizon = max([MINUTES_FOR_VW_PRICE] + [max(listener.windows) for listener in
+                                                            stock_exchange.trade_listeners
+                                                            if isinstance(listener, RollingVWAP)])
+            if int(horizon) < minimum_horizon:
+                raise ValueError('The horizon must be at least {} minutes, to keep the volume weighted prices '
+                                 'correct. You entered: {}'.format(minimum_horizon, horizon))
+            stock_exchange.retention_horizon = int(horizon)
+        self.stock_exchange = stock_exchange
+        self.horizon = int(horizon)
+        self.interval = interval
+        self.clock = clock
+        self._archive = WriteAheadLog(archive_path) if archive_path else None
+        # Totals over all passes.
+        self.expired_trades = 0
+        self.reclaimed_bytes = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def run_once(self):
+        """
+        A method to make one pass over the stocks and drop their trades that are older than the horizon.
+        :return: the number of trades dropped and the number of bytes given back by the pass.
+        :rtype: tuple(int, int)
+        """
+        cutoff = self.clock() - 60 * self.horizon
+        expired_trades, reclaimed_bytes = 0, 0
+        for stock_symbol in list(self.stock_exchange.recorded_trades):
+            # Archiving the trades while still holding the lock, so that they are in the same order as in the log.
+            with self.stock_exchange.lock.write_locked():
+                stock_expired_trades, stock_reclaimed_bytes = self.stock_exchange.expire_trades(stock_symbol, cutoff)
+                if self._archive is not None and len(stock_expired_trades[0]):
+                    self._archive.log_add_trades(stock_symbol, *stock_expired_trades)
+            expired_trades += len(stock_expired_trades[0])
+            reclaimed_bytes += stock_reclaimed_bytes
+        if self._archive is not None:
+            self._archive.flush()
+        self.expired_trades += expired_trades
+        self.reclaimed_bytes += reclaimed_bytes
+        logger.info('Dropped %s trades older than %s minutes, reclaiming %s bytes. %s bytes reclaimed in total.',
+                    expired_trades, self.horizon, reclaimed_bytes, self.reclaimed_bytes)
+        return expired_trades, reclaimed_bytes
+
+    def _run_periodically(self):
+        """
+        A helper method, run by a background thread, that makes a pass every interval seconds, until stopped.
+        """
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Failed to drop old trades from stock exchange: %s', self.stock_exchange.name)
+
+    def start(self):
+        """
+        A method to start dropping old trades in the background.
+        :return: the retention policy itself.
+        :rtype: RetentionPolicy
+        """
+        self._thread = threading.Thread(target=self._run_periodically, name='RetentionPolicy')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        A method to stop the background thread and close the archive file. Listeners with any windows can be added
+        to the stock exchange again.
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self.stock_exchange.lock.write_locked():
+            if self.stock_exchange.retention_horizon == self.horizon:
+                self.stock_exchange.retention_horizon = None
+        if self._archive is not None:
+            self._archive.close()
@@ -0,0 +1,373 @@
+#!/usr/bin/python
+
+import logging
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from trade_listener import TradeListener
+from trade_store import to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The windows, in minutes, every stock is followed over by default.
+DEFAULT_WINDOWS = (1, 5, 15, 60)
+
+# Number of trades a window adds or drops after which its running sums are re-summed exactly, to stop rounding
+# errors from accumulating.
+WINDOW_RESUM_INTERVAL = 100000
+
+# The initial number of trades the columns of a stock have room for.
+INITIAL_CAPACITY = 64
+
+
+def current_epoch():
+    """
+    The default clock of RollingVWAP: the current time, in the epoch seconds the trades are stored with.
+    :return: the current time.
+    :rtype: int
+    """
+    return to_epoch(datetime.today())
+
+
+class _StockWindows(object):
+    """
+    A helper class to keep the volume weighted price of one stock over several time windows.
+    The trades of the largest window are kept once, sorted by timestamp, in numpy columns shared by all windows. Each
+    window only keeps the position of its oldest trade in the columns (its head) and the running sums of price *
+    quantity and quantity of the trades from its head to the end of the columns. When trades age out of a window,
+    its head moves forward, found with a binary search, and their values are subtracted from its sums.
+    """
+
+    # The names and types of the columns of the trades.
+    _COLUMNS = ('time_stamps', 'notionals', 'quantities')
+    _TYPES = (np.int64, np.float64, np.int64)
+
+    __slots__ = _COLUMNS + ('window_seconds', 'size', 'offset', 'heads', 'notional_sums', 'quantity_sums', 'updates')
+
+    def __init__(self, windows):
+        """
+        Constructor.
+        :param windows: the windows to follow the stock over, in minutes.
+        :type windows: list
+        """
+        self.window_seconds = [60 * int(window) for window in windows]
+        # The trades of the largest window, sorted by timestamp, are the first size values of the columns.
+        self.size = 0
+        for column, column_type in zip(_StockWindows._COLUMNS, _StockWindows._TYPES):
+            setattr(self, column, np.empty(INITIAL_CAPACITY, dtype=column_type))
+        # The number of trades dropped from the start of the columns. Positions of trades (heads) count them too.
+        self.offset = 0
+        self.heads = [0] * len(windows)
+        self.notional_sums = [0.0] * len(windows)
+        self.quantity_sums = [0] * len(windows)
+        self.updates = [0] * len(windows)
+
+    def _reserve(self, count):
+        """
+        A helper method to make room for a number of trades at the end of the columns, doubling their capacity if
+        needed.
+        """
+        if self.size + count > len(self.time_stamps):
+            capacity = max(self.size + count, 2 * len(self.time_stamps))
+            for column in _StockWindows._COLUMNS:
+                old_column = getattr(self, column)
+                new_column = np.empty(capacity, dtype=old_column.dtype)
+                new_column[:self.size] = old_column[:self.size]
+                setattr(self, column, new_column)
+
+    def add(self, time_stamp, notional, quantity):
+        """
+        A method to add a trade to all windows. Out of order trades are inserted in timestamp order.
+        """
+        self._reserve(1)
+        size = self.size
+        if not size or time_stamp >= self.time_stamps[size - 1]:
+            index = size
+        else:
+            index = int(np.searchsorted(self.time_stamps[:size], time_stamp, side='right'))
+        for column, value in zip(_StockWindows._COLUMNS, (time_stamp, notional, quantity)):
+            values = getattr(self, column)
+            values[index + 1:size + 1] = values[index:size]
+            values[index] = value
+        self.size += 1
+        position = self.offset + index
+        for window in range(len(self.heads)):
+            if position >= self.heads[window]:
+                self.notional_sums[window] += notional
+                self.quantity_sums[window] += quantity
+                self.updates[window] += 1
+            else:
+                # The trade is older than the window, so it only moves the window's trades one position forward.
+                self.heads[window] += 1
+
+    def extend(self, time_stamps, notionals, quantities):
+        """
+        A method to add several trades to all windows. Trades that are not older than the latest trade of the
+        windows, the usual case, are copied to the end of the columns and added to the sums in one step.
+        """
+        if not len(time_stamps):
+            return
+        order = np.argsort(time_stamps, kind='mergesort')
+        time_stamps, notionals, quantities = time_stamps[order], notionals[order], quantities[order]
+        if self.size and time_stamps[0] < self.time_stamps[self.size - 1]:
+            for time_stamp, notional, quantity in zip(time_stamps, notionals, quantities):
+                self.add(int(time_stamp), float(notional), int(quantity))
+            return
+        count = len(time_stamps)
+        self._reserve(count)
+        for column, values in zip(_StockWindows._COLUMNS, (time_stamps, notionals, quantities)):
+            getattr(self, column)[self.size:self.size + count] = values
+        self.size += count
+        notional = float(np.sum(notionals))
+        quantity = int(np.sum(quantities))
+        for window in range(len(self.heads)):
+            self.notional_sums[window] += notional
+            self.quantity_sums[window] += quantity
+            self.updates[window] += count
+
+    def remove(self, time_stamp, notional, quantity):
+        """
+        A method to remove a trade from all windows, if it has not aged out of them already.
+        """
+        time_stamps = self.time_stamps[:self.size]
+        start = int(np.searchsorted(time_stamps, time_stamp, side='left'))
+        end = int(np.searchsorted(time_stamps, time_stamp, side='right'))
+        matches = np.flatnonzero((self.quantities[start:end] == quantity) & (self.notionals[start:end] == notional))
+        if not len(matches):
+            return
+        index = start + int(matches[0])
+        for column in _StockWindows._COLUMNS:
+            values = getattr(self, column)
+            values[index:self.size - 1] = values[index + 1:self.size]
+        self.size -= 1
+        position = self.offset + index
+        for window in range(len(self.heads)):
+            if position >= self.heads[window]:
+                self.notional_sums[window] -= notional
+                self.quantity_sums[window] -= quantity
+                self.updates[window] += 1
+            else:
+                self.heads[window] -= 1
+
+    def evict(self, now, expired_before=None):
+        """
+        A method to drop the trades that are no longer in each window, i.e. happened at or before now - window, or
+        that were dropped from the stock exchange, i.e. happened before expired_before.
+        """
+        time_stamps = self.time_stamps[:self.size]
+        end = self.offset + self.size
+        for window, window_seconds in enumerate(self.window_seconds):
+            starting_time = now - window_seconds
+            if expired_before is not None:
+                starting_time = max(starting_time, expired_before - 1)
+            head = self.heads[window]
+            new_head = self.offset + int(np.searchsorted(time_stamps, starting_time, side='right'))
+            if new_head > head:
+                self.notional_sums[window] -= float(np.sum(self.notionals[head - self.offset:new_head - self.offset]))
+                self.quantity_sums[window] -= int(np.sum(self.quantities[head - self.offset:new_head - self.offset]))
+                self.updates[window] += new_head - head
+                self.heads[window] = head = new_head
+            if head == end:
+                # Starting from an exact zero when the window becomes empty.
+                self.notional_sums[window] = 0.0
+                self.updates[window] = 0
+            elif self.updates[window] >= WINDOW_RESUM_INTERVAL:
+                self.updates[window] = 0
+                self.notional_sums[window] = math.fsum(self.notionals[head - self.offset:self.size])
+
+        # Dropping the trades that have aged out of all windows, once they are at least half of the columns, so that
+        # dropping them is amortized O(1) per trade.
+        dropped = min(self.heads) - self.offset
+        if dropped and 2 * dropped >= self.size:
+            for column in _StockWindows._COLUMNS:
+                values = getattr(self, column)
+                values[:self.size - dropped] = values[dropped:self.size]
+            self.size -= dropped
+            self.offset += dropped
+
+    def volume_weighted_price(self, window):
+        """
+        A method to get the volume weighted price of a window, from its running sums.
+        :return: the volume weighted price or None, if there are no trades in the window.
+        :rtype: float | None
+        """
+        if not self.quantity_sums[window]:
+            return None
+        return np.round(np.divide(self.notional_sums[window], float(self.quantity_sums[window])), decimals=3)
+
+
+class RollingVWAP(TradeListener):
+    """
+    A class to keep the volume weighted price of stocks over several rolling time windows (e.g. 1, 5, 15 and 60
+    minutes) up to date as trades are recorded, so that reading it is O(1) instead of going through the trades.
+    Each trade is added to the running sums of the windows when it is recorded, and subtracted when it ages out.
+    The trades already recorded in the windows are taken when it is added to a stock exchange, so it gives the same
+    result as StockExchange.vw_stock_price_calculator(stock_symbol, window).
+    Example usage: rolling_vwap = RollingVWAP()
+                   stock_exchange.add_trade_listener(rolling_vwap)
+                   rolling_vwap.volume_weighted_price('TEA', 5)
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, subscribe_all=True, clock=current_epoch):
+        """
+        Constructor.
+        :param windows: the default windows to follow stocks over, in minutes.
+        :type windows: tuple
+        :param subscribe_all: whether to follow every stock that is traded over the default windows, or only the
+                              stocks subscribed with subscribe().
+        :type subscribe_all: bool
+        :param clock: a function that returns the current time in epoch seconds.
+        :type clock: function
+        """
+        self.windows = tuple(windows)
+        self.subscribe_all = subscribe_all
+        self.clock = clock
+        # The stock exchange the object was added to, whose recorded trades start the windows of a stock.
+        self.stock_exchange = None
+        self._stocks = {}
+        self._lock = threading.Lock()
+
+    def _follow(self, stock_symbol, windows):
+        """
+        A helper method to start the windows of a stock, with the trades of the stock exchange that are in them.
+        It is called with the lock held.
+        """
+        stock_windows = _StockWindows(windows)
+        self._stocks[stock_symbol] = (tuple(windows), stock_windows)
+        trade_store = None if self.stock_exchange is None else self.stock_exchange.recorded_trades.get(stock_symbol)
+        if trade_store is not None:
+            now = self.clock()
+            time_stamps, traded_prices, quantities = trade_store.trades_between(
+                now - max(stock_windows.window_seconds) + 1, np.iinfo(np.int64).max)[:3]
+            stock_windows.extend(time_stamps, traded_prices * quantities, quantities)
+            stock_windows.evict(now)
+
+    def subscribe(self, stock_symbol, windows=None):
+        """
+        A method to follow a stock over some windows, starting with the trades of the stock exchange that are in
+        them. Subscribing again replaces the windows.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param windows: the windows to follow the stock over, in minutes. By default the windows of the object.
+        :type windows: tuple
+        """
+        if self.stock_exchange is None:
+            with self._lock:
+                self._follow(stock_symbol, windows or self.windows)
+            return
+        # Holding the read lock, so that no trade is recorded between reading the trades and following the stock.
+        with self.stock_exchange.lock.read_locked():
+            with self._lock:
+                self._follow(stock_symbol, windows or self.windows)
+
+    def unsubscribe(self, stock_symbol):
+        """
+        A method to stop following a stock.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        """
+        with self._lock:
+            self._stocks.pop(stock_symbol, None)
+
+    def added_to(self, stock_exchange):
+        """
+        A method to start the windows of the stocks followed with the trades already recorded in the stock exchange.
+        See TradeListener.added_to().
+        :raises ValueError: if a window is longer than the horizon after which the stock exchange drops trades, since
+                            the window would then miss trades.
+        """
+        retention_horizon = stock_exchange.retention_horizon
+        if retention_horizon is not None and max(self.windows) > retention_horizon:
+            raise ValueError('The windows can not be longer than the {} minutes after which the stock exchange drops '
+                             'trades. You entered: {}'.format(retention_horizon, list(self.windows)))
+        with self._lock:
+            self.stock_exchange = stock_exchange
+            stock_symbols = set(stock_exchange.recorded_trades) if self.subscribe_all else set()
+            for stock_symbol in stock_symbols | set(self._stocks):
+                self._follow(stock_symbol, self._stocks[stock_symbol][0] if stock_symbol in self._stocks
+                             else self.windows)
+
+    def trades_added(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes):
+        """
+        A method to add recorded trades to the windows of their stock. See TradeListener.trades_added().
+        """
+        with self._lock:
+            if stock_symbol not in self._stocks:
+                if not self.subscribe_all:
+                    return
+                self._follow(stock_symbol, self.windows)
+                if self.stock_exchange is not None:
+                    # The trades are already recorded, so the windows started with them.
+                    return
+            stock_windows = self._stocks[stock_symbol][1]
+            time_stamps = np.asarray(time_stamps, dtype=np.int64)
+            quantities = np.asarray(quantities, dtype=np.int64)
+            if len(time_stamps) == 1:
+                quantity = int(quantities[0])
+                stock_windows.add(int(time_stamps[0]), float(traded_prices[0]) * quantity, quantity)
+            else:
+                stock_windows.extend(time_stamps, np.asarray(traded_prices, dtype=np.float64) * quantities, quantities)
+            stock_windows.evict(self.clock())
+
+    def trade_removed(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code):
+        """
+        A method to remove a trade from the windows of its stock. See TradeListener.trade_removed().
+        """
+        with self._lock:
+            if stock_symbol in self._stocks:
+                self._stocks[stock_symbol][1].remove(int(time_stamp), float(traded_price) * int(quantity),
+                                                     int(quantity))
+
+    def trades_expired(self, stock_symbol, time_stamp):
+        """
+        A method to drop the trades that were dropped from the stock exchange from the windows of their stock, so that
+        the windows keep matching the trades of the stock exchange. See TradeListener.trades_expired().
+        """
+        with self._lock:
+            if stock_symbol in self._stocks:
+                self._stocks[stock_symbol][1].evict(self.clock(), int(time_stamp))
+
+    def volume_weighted_price(self, stock_symbol, window):
+        """
+        A method to get the current volume weighted price of a stock over a window.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param window: the window, in minutes. It must be one of the windows the stock is followed over.
+        :type window: int
+        :return: the volume weighted price or None, if no trades happened in the window.
+        :rtype: float | None
+        :raises KeyError: if the stock is not followed over the window.
+        """
+        with self._lock:
+            if stock_symbol not in self._stocks:
+                if self.subscribe_all and int(window) in self.windows:
+                    return None
+                raise KeyError('Stock: {} is not followed over a window of {} minutes.'.format(stock_symbol, window))
+            windows, stock_windows = self._stocks[stock_symbol]
+            if int(window) not in windows:
+                raise KeyError('Stock: {} is not followed over a window of {} minutes.'.format(stock_symbol, window))
+            stock_windows.evict(self.clock())
+            return stock_windows.volume_weighted_price(windows.index(int(window)))
+
+    def volume_weighted_prices(self, window):
+        """
+        A method to get the current volume weighted price of every stock followed over a window.
+        :param window: the window, in minutes.
+        :type window: int
+        :return: the volume weighted price of each stock, or None for stocks without trades in the window.
+        :rtype: dict
+        """
+        now = self.clock()
+        volume_weighted_prices = {}
+        with self._lock:
+            for stock_symbol, (windows, stock_windows) in self._stocks.items():
+                if int(window) in windows:
+                    stock_windows.evict(now)
+                    volume_weighted_prices[stock_symbol] = stock_windows.volume_weighted_price(
+                        windows.index(int(window)))
+        return volume_weighted_prices
@@ -0,0 +1,454 @@
+#!/usr/bin/python
+
+import logging
+import math
+import multiprocessing
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+
+from log_handlers import QueueFileHandler
+from stock import Stock
+from stock_exchange import StockExchange, merge_trades
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The values of a trade, as sent to the shards.
+TradeValues = namedtuple('TradeValues', ['stock_symbol', 'quantity', 'trade_type', 'traded_price', 'time_stamp',
+                                         'trade_id'])
+
+
+def shard_of(stock_symbol, shards_count):
+    """
+    A method to get the shard that owns a stock. It is the same in every process and every run.
+    :param stock_symbol: the symbol (abbreviated name) of the stock.
+    :type stock_symbol: str
+    :param shards_count: the number of shards.
+    :type shards_count: int
+    :return: the number of the shard.
+    :rtype: int
+    """
+    if not isinstance(stock_symbol, bytes):
+        stock_symbol = stock_symbol.encode('utf8')
+    return (zlib.crc32(stock_symbol) & 0xffffffff) % shards_count
+
+
+def _add_stock(stock_exchange, stock_symbol, stock_type, last_dividend, par_value, fixed_dividend, current_price,
+               current_price_timestamp):
+    """
+    A helper method, run by a shard, to add a stock from its values.
+    """
+    return stock_exchange.add_new_stock(Stock.restore(stock_symbol, stock_type, last_dividend, par_value,
+                                                      fixed_dividend, current_price, current_price_timestamp))
+
+
+def _add_trade(stock_exchange, trade):
+    """
+    A helper method, run by a shard, to add a trade and return the ID it was given, or None if it was not recorded.
+    """
+    if stock_exchange.add_trades_bulk([trade])[0]:
+        return stock_exchange.next_trade_id - 1
+    return None
+
+
+def _add_trades(stock_exchange, trades):
+    """
+    A helper method, run by a shard, to add many trades and return which ones were recorded as a list.
+    """
+    return stock_exchange.add_trades_bulk(trades).tolist()
+
+
+# The operations a shard runs that are not methods of StockExchange.
+_SHARD_OPERATIONS = {'add_stock': _add_stock, 'add_trade': _add_trade, 'add_trades': _add_trades}
+
+
+def _run_shard(name, connection):
+    """
+    A method, run by every shard process, that owns a stock exchange and runs the operations sent by the router
+    until it receives None.
+    :param name: the name of the stock exchange of the shard.
+    :type name: str
+    :param connection: the connection to the router.
+    :type connection: multiprocessing.Connection
+    """
+    for logger_to_check in [logging.getLogger()] + list(logging.Logger.manager.loggerDict.values()):
+        for handler in getattr(logger_to_check, 'handlers', []):
+            if isinstance(handler, QueueFileHandler):
+                handler.restart_writer()
+    stock_exchange = StockExchange(name)
+    while True:
+        message = connection.recv()
+        if message is None:
+            break
+        operation, arguments = message
+        try:
+            if operation in _SHARD_OPERATIONS:
+                result = _SHARD_OPERATIONS[operation](stock_exchange, *arguments)
+            else:
+                result = getattr(stock_exchange, operation)(*arguments)
+            connection.send((True, result))
+        except Exception as error:
+            logger.exception('Shard of stock exchange: %s could not run: %s', name, operation)
+            connection.send((False, error))
+    connection.close()
+
+
+class ShardedStockExchange(StockExchange):
+    """
+    A class for a stock exchange whose stocks are partitioned by their symbol across worker processes (shards), so
+    that it is not limited to one core. Every shard is a StockExchange that owns its stocks and their trades. This
+    object only routes each call to the shard that owns the stock, and combines the results of all shards for the
+    calculations that involve every stock (the all share index and the batch calculator).
+    It has the methods of StockExchange, but the stocks and trades are kept in the shards, so registered_stocks and
+    recorded_trades are always empty here, and all_share_index is combined from the shards whenever it is read.
+    Arguments and results are sent between processes, so stocks and trades added are copied to their shard, and stock
+    objects are not updated with the prices set in the shard. Trades are given their ID by their shard, so trade IDs
+    are only unique per stock. Trade listeners (e.g. RollingVWAP, BarBuilder, PriceBroadcaster) can not be added, since
+    the trades are recorded in other processes.
+    Example usage: stock_exchange = ShardedStockExchange('example', 4)
+                   Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+                   TradeRecord(stock_exchange, 'TEA', '500', 'sell', '150')
+                   stock_exchange.close()
+    """
+
+    def __init__(self, name, shards_count=None):
+        """
+        Constructor.
+        :param name: The name to give to the stock exchange when creating it
+        :type name: str
+        :param shards_count: the number of shard processes. By default the number of CPUs.
+        :type shards_count: int
+        """
+        StockExchange.__init__(self, name)
+        self.shards_count = shards_count or multiprocessing.cpu_count()
+        self._connections = []
+        self._connection_locks = []
+        self._shards = []
+        for shard in range(self.shards_count):
+            router_connection, shard_connection = multiprocessing.Pipe()
+            shard_process = multiprocessing.Process(target=_run_shard, args=(name, shard_connection),
+                                                    name='{}-shard-{}'.format(name, shard))
+            shard_process.daemon = True
+            shard_process.start()
+            shard_connection.close()
+            self._connections.append(router_connection)
+            self._connection_locks.append(threading.Lock())
+            self._shards.append(shard_process)
+        logger.info('Started %s shards for stock exchange: %s.', self.shards_count, name)
+
+    def _call(self, shards, operation, arguments):
+        """
+        A helper method to run an operation in many shards in parallel and wait for all their results.
+        :param shards: the shards to run the operation in.
+        :type shards: list
+        :param operation: the name of the operation (a method of StockExchange or a shard operation).
+        :type operation: str
+        :param arguments: the arguments of the operation for each shard.
+        :type arguments: list
+        :return: the result of each shard.
+        :rtype: list
+        """
+        # Locking the connections in a fixed order, so that concurrent calls can not deadlock.
+        locked_shards = sorted(set(shards))
+        for shard in locked_shards:
+            self._connection_locks[shard].acquire()
+        try:
+            for shard, shard_arguments in zip(shards, arguments):
+                self._connections[shard].send((operation, shard_arguments))
+            replies = [self._connections[shard].recv() for shard in shards]
+        finally:
+            for shard in locked_shards:
+                self._connection_locks[shard].release()
+        for succeeded, result in replies:
+            if not succeeded:
+                raise result
+        return [result for _, result in replies]
+
+    def _call_owner(self, stock_symbol, operation, *arguments):
+        """
+        A helper method to run an operation in the shard that owns a stock.
+        """
+        return self._call([shard_of(stock_symbol, self.shards_count)], operation, [arguments])[0]
+
+    def add_new_stock(self, stock_to_add):
+        """
+        A method to add a stock to the shard that owns it.
+        :param stock_to_add: The stock object to add to the stock exchange
+        :type stock_to_add: Stock
+        :return: True || False, whether the stock was added successfully in the stock exchange.
+        :rtype: bool
+        """
+        return self._call_owner(stock_to_add.stock_symbol, 'add_stock', stock_to_add.stock_symbol,
+                                stock_to_add.stock_type, stock_to_add.last_dividend, stock_to_add.par_value,
+                                stock_to_add.fixed_dividend, stock_to_add.current_price,
+                                stock_to_add.current_price_timestamp)
+
+    def remove_existing_stock(self, stock_to_remove):
+        """
+        A method to remove a stock from the shard that owns it.
+        :param stock_to_remove: The stock object to remove from the stock exchange
+        :type stock_to_remove: Stock
+        :return: True || False, whether the stock was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        return self.remove_existing_stock_by_symbol(stock_to_remove.stock_symbol)
+
+    def remove_existing_stock_by_symbol(self, stock_symbol):
+        """
+        A method to remove a stock from the shard that owns it, using its symbol as a unique identifier.
+        :param stock_symbol: The symbol of the stock to remove from the stock exchange.
+        :type stock_symbol: str
+        :return: True || False, whether the stock was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        return self._call_owner(stock_symbol, 'remove_existing_stock_by_symbol', stock_symbol)
+
+    def is_stock_registered(self, stock_symbol_to_check, adding_created_stock=False):
+        """
+        A method to check if a stock is registered in the shard that owns it.
+        :param stock_symbol_to_check: the symbol (abbreviated name) of the stock.
+        :type stock_symbol_to_check: str
+        :param adding_created_stock: Whether to skip logging a warning if the stock is not registered.
+        :type adding_created_stock: bool
+        :return: True || False, whether the stock is registered or not.
+        :rtype: bool
+        """
+        return self._call_owner(stock_symbol_to_check, 'is_stock_registered', stock_symbol_to_check,
+                                adding_created_stock)
+
+    def add_trade_listener(self, listener):
+        """
+        Trade listeners are not supported, since the trades are recorded in the shard processes.
+        :raises NotImplementedError: always.
+        """
+        raise NotImplementedError('Trade listeners can not be added to a sharded stock exchange.')
+
+    def add_new_trade(self, trade_to_add):
+        """
+        A method to record a trade in the shard that owns its stock, and give the trade the ID the shard gave it.
+        :param trade_to_add: The trade object to add to the stock exchange
+        :type trade_to_add: TradeRecord
+        :return: True || False, whether the trade was recorded successfully in the stock exchange.
+        :rtype: bool
+        """
+        trade_to_add.trade_id = self._call_owner(trade_to_add.stock_symbol, 'add_trade', (
+            trade_to_add.stock_symbol, trade_to_add.quantity, trade_to_add.trade_type, trade_to_add.traded_price,
+            str(trade_to_add.time_stamp)))
+        return trade_to_add.trade_id is not None
+
+    def add_trades_bulk(self, trades=None, stock_symbols=None, quantities=None, trade_types=None, traded_prices=None,
+                        time_stamps=None):
+        """
+        A method to record many trades at once. The trades are split by the shard that owns their stock, and all
+        shards record their part in parallel. See StockExchange.add_trades_bulk() for the parameters.
+        :return: a mask of the trades that were recorded successfully in the stock exchange.
+        :rtype: numpy.ndarray
+        """
+        if trades is None:
+            if time_stamps is None:
+                time_stamps = [None] * len(stock_symbols)
+            trades = zip(stock_symbols, quantities, trade_types, traded_prices, time_stamps)
+        trades = [tuple(trade) for trade in trades]
+        positions_of_shards = {}
+        for position, trade in enumerate(trades):
+            positions_of_shards.setdefault(shard_of(trade[0], self.shards_count), []).append(position)
+
+        recorded = np.zeros(len(trades), dtype=np.bool_)
+        shards = list(positions_of_shards)
+        results = self._call(shards, 'add_trades', [([trades[position] for position in positions_of_shards[shard]],)
+                                                    for shard in shards])
+        for shard, shard_recorded in zip(shards, results):
+            recorded[positions_of_shards[shard]] = shard_recorded
+        return recorded
+
+    def remove_trade(self, trade_to_remove):
+        """
+        A method to remove a trade from the shard that owns its stock.
+        :param trade_to_remove: The trade object to remove from the stock exchange
+        :type trade_to_remove: TradeRecord
+        :return: True || False, whether the trade was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        return self._call_owner(trade_to_remove.stock_symbol, 'remove_trade', TradeValues(
+            trade_to_remove.stock_symbol, trade_to_remove.quantity, trade_to_remove.trade_type,
+            trade_to_remove.traded_price, trade_to_remove.time_stamp, trade_to_remove.trade_id))
+
+    def remove_trade_by_symbol_date(self, trade_stock_symbol, trade_timestamp):
+        """
+        A method to remove a trade from the shard that owns its stock, using the stock symbol and timestamp.
+        :param trade_stock_symbol: the symbol (abbreviated name) of the stock.
+        :type trade_stock_symbol: str
+        :param trade_timestamp: the timestamp when the trade occurred.
+        :type trade_timestamp: str
+        :return: True || False, whether the trade was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        return self._call_owner(trade_stock_symbol, 'remove_trade_by_symbol_date', trade_stock_symbol,
+                                trade_timestamp)
+
+    def remove_trade_by_id(self, stock_symbol, trade_id):
+        """
+        A method to remove a trade from the shard that owns its stock, using the ID the shard gave to the trade.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param trade_id: the ID of the trade.
+        :type trade_id: int
+        :return: True || False, whether the trade was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        return self._call_owner(stock_symbol, 'remove_trade_by_id', stock_symbol, trade_id)
+
+    def update_stock_price(self, trade_to_add):
+        """
+        A method to update the price of a stock in the shard that owns it, if the trade is more recent than the
+        existing price.
+        :param trade_to_add: The trade object to get the stock price from.
+        :type trade_to_add: TradeRecord
+        :return: True || False, whether the stock price was successfully assigned to the stock.
+        :rtype: bool
+        """
+        return self._call_owner(trade_to_add.stock_symbol, 'update_stock_price', TradeValues(
+            trade_to_add.stock_symbol, trade_to_add.quantity, trade_to_add.trade_type, trade_to_add.traded_price,
+            trade_to_add.time_stamp, trade_to_add.trade_id))
+
+    def dividend_yield_calculator(self, stock_symbol, stock_price):
+        """
+        A method to calculate the dividend yield of a stock in the shard that owns it, given its price.
+        See StockExchange.dividend_yield_calculator().
+        """
+        return self._call_owner(stock_symbol, 'dividend_yield_calculator', stock_symbol, stock_price)
+
+    def p_e_ratio_calculator(self, stock_symbol, stock_price):
+        """
+        A method to calculate the P/E ratio of a stock in the shard that owns it, given its price.
+        See StockExchange.p_e_ratio_calculator().
+        """
+        return self._call_owner(stock_symbol, 'p_e_ratio_calculator', stock_symbol, stock_price)
+
+    def vw_stock_price_calculator(self, stock_symbol, time_span=None):
+        """
+        A method to calculate the volume weighted price of a stock in the shard that owns it.
+        See StockExchange.vw_stock_price_calculator().
+        """
+        return self._call_owner(stock_symbol, 'vw_stock_price_calculator', stock_symbol, time_span)
+
+    def batch_calculator(self, stock_symbols=None, stock_prices=None):
+        """
+        A method to calculate the dividend yield and the P/E ratio of many stocks at once. Every shard calculates
+        the values of its own stocks in parallel. See StockExchange.batch_calculator() for the parameters.
+        :return: the stock symbols, their dividend yields and their P/E ratios.
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        all_shards = list(range(self.shards_count))
+        if stock_symbols is None:
+            results = self._call(all_shards, 'batch_calculator', [(None, stock_prices)] * self.shards_count)
+            return tuple(np.concatenate([result[column] for result in results]) for column in range(3))
+
+        stock_symbols = np.asarray(stock_symbols)
+        stock_prices = None if stock_prices is None else np.asarray(stock_prices)
+        shards_of_stocks = np.array([shard_of(stock_symbol, self.shards_count) for stock_symbol in stock_symbols],
+                                    dtype=np.intp)
+        shards = [shard for shard in all_shards if (shards_of_stocks == shard).any()]
+        results = self._call(shards, 'batch_calculator', [
+            (stock_symbols[shards_of_stocks == shard],
+             None if stock_prices is None else stock_prices[shards_of_stocks == shard]) for shard in shards])
+        dividend_yields = np.full(len(stock_symbols), np.nan)
+        p_e_ratios = np.full(len(stock_symbols), np.nan)
+        for shard, (_, shard_dividend_yields, shard_p_e_ratios) in zip(shards, results):
+            dividend_yields[shards_of_stocks == shard] = shard_dividend_yields
+            p_e_ratios[shards_of_stocks == shard] = shard_p_e_ratios
+        return stock_symbols, dividend_yields, p_e_ratios
+
+    def query_trades(self, stock_symbols, starting_time=None, ending_time=None, trade_type=None, min_quantity=None,
+                     max_quantity=None, offset=0, limit=None):
+        """
+        A method to get the trades of one or many stocks that happened between two times. Every shard finds the
+        trades of its own stocks in parallel, up to offset + limit trades, and their trades are merged.
+        See StockExchange.query_trades() for the parameters.
+        :return: the trades, sorted by timestamp and ID, as a numpy array of TRADE_QUERY_TYPE.
+        :rtype: numpy.ndarray
+        """
+        if isinstance(stock_symbols, basestring):
+            stock_symbols = [stock_symbols]
+        stocks_of_shards = {}
+        for stock_symbol in stock_symbols:
+            stocks_of_shards.setdefault(shard_of(stock_symbol, self.shards_count), []).append(stock_symbol)
+        shards = sorted(stocks_of_shards)
+        read_limit = None if limit is None else int(offset) + int(limit)
+        results = self._call(shards, 'query_trades', [
+            (stocks_of_shards[shard], starting_time, ending_time, trade_type, min_quantity, max_quantity, 0,
+             read_limit) for shard in shards])
+        return merge_trades(results, offset, limit)
+
+    def share_index_components(self):
+        """
+        A method to combine the parts of the all share index of all shards.
+        See StockExchange.share_index_components().
+        """
+        components = self._call(list(range(self.shards_count)), 'share_index_components',
+                                [()] * self.shards_count)
+        log_price_sum = math.fsum(component[0] for component in components)
+        stocks_count = sum(component[1] for component in components)
+        non_positive_prices = sum(component[2] for component in components)
+        prices_product = None
+        if non_positive_prices:
+            # Shards without non positive prices only have their log-prices.
+            prices_product = float(np.prod([component[3] if component[3] is not None else math.exp(component[0])
+                                            for component in components]))
+        return log_price_sum, stocks_count, non_positive_prices, prices_product
+
+    def _combined_all_share_index(self):
+        """
+        A helper method to combine the all share index of all shards, from their partial log-sums.
+        :return: the all share index value or None, if there are no stocks.
+        :rtype: float | None
+        """
+        log_price_sum, stocks_count, non_positive_prices, prices_product = self.share_index_components()
+        if not stocks_count:
+            return None
+        if not non_positive_prices:
+            return np.round(math.exp(log_price_sum / stocks_count), decimals=3)
+        return np.round(np.power(prices_product, np.divide(1, float(stocks_count))), decimals=3)
+
+    @property
+    def all_share_index(self):
+        """The all share index of all shards, or '' if there are no stocks, like StockExchange.all_share_index."""
+        all_share_index = self._combined_all_share_index()
+        return '' if all_share_index is None else all_share_index
+
+    @all_share_index.setter
+    def all_share_index(self, value):
+        """The all share index is only kept by the shards, so it is not set here (e.g. by StockExchange.__init__)."""
+        pass
+
+    def all_share_index_calculator(self):
+        """
+        A method to calculate the all share index for all stocks in all shards, from the partial log-sums of the
+        shards.
+        :return: the all share index value or None, if there are no stocks.
+        :rtype: float | None
+        """
+        all_share_index = self._combined_all_share_index()
+        if all_share_index is None:
+            logger.warning(
+                'Stock exchange is empty. Please register some stocks first, record some trades and then retry.')
+            return None
+        logger.info('Successfully calculated the all share index: %s', all_share_index)
+        return all_share_index
+
+    def close(self):
+        """
+        A method to stop all shard processes. Their stocks and trades are lost.
+        """
+        for connection, connection_lock in zip(self._connections, self._connection_locks):
+            with connection_lock:
+                if not connection.closed:
+                    connection.send(None)
+                    connection.close()
+        for shard_process in self._shards:
+            shard_process.join()
+        logger.info('Stopped the shards of stock exchange: %s.', self.name)
@@ -0,0 +1,252 @@
+#!/usr/bin/python
+
+import logging
+import os
+import struct
+
+import numpy as np
+
+from stock import Stock
+from stock_exchange import StockExchange
+from trade_store import TradeStore, from_epoch, to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+"""
+A point in time snapshot of a stock exchange, in a fixed little endian binary layout:
+- A header: magic bytes, format version, length of the exchange name, width of the stock symbols, number of stocks,
+  number of stocks with trades, the ID of the next trade and the length of the write ahead log when the snapshot was
+  saved, followed by the exchange name.
+- The stock table: one fixed size record per registered stock.
+- The trade directory: one fixed size record per stock with trades, holding the number of its trades, the file
+  offset of its columns and whether its trade IDs are in increasing order.
+- The trade columns of each stock: timestamps, prices, quantities, running sums of price * quantity, running sums of
+  quantity, trade IDs (8 bytes each) and trade types (1 byte).
+Every section starts at an 8 byte aligned offset, so the trade columns can be memory mapped directly.
+"""
+
+SNAPSHOT_MAGIC = b'SSXSNAP\x00'
+SNAPSHOT_VERSION = 3
+# The older versions that can still be read. Version 2 has no order of the trade IDs in the trade directory.
+_READABLE_VERSIONS = (2, SNAPSHOT_VERSION)
+
+_HEADER = struct.Struct('<8sIIIII4xqq')
+# The position of the write ahead log length in the header.
+_LOG_OFFSET_POSITION = _HEADER.size - 8
+_STOCK_TYPE_CODES = {'common': 1, 'preferred': 2}
+_STOCK_TYPE_NAMES = dict((code, name) for name, code in _STOCK_TYPE_CODES.items())
+# The types of the trade columns, in the order they are stored (the order of TradeStore.columns()).
+_COLUMN_TYPES = ('<i8', '<f8', '<i8', 'u1', '<f8', '<i8', '<i8')
+# The order the trade columns are stored in, keeping the 1 byte trade types last for alignment.
+_COLUMN_ORDER = (0, 1, 2, 4, 5, 6, 3)
+
+
+def _stock_table_type(symbol_width):
+    """
+    A helper method to get the record type of the stock table.
+    :param symbol_width: the maximum length of the stock symbols in bytes.
+    :type symbol_width: int
+    :return: the record type.
+    :rtype: numpy.dtype
+    """
+    return np.dtype([('stock_symbol', 'S{}'.format(symbol_width)), ('stock_type', 'u1'),
+                     ('last_dividend', '<f8'), ('par_value', '<f8'), ('fixed_dividend', '<f8'),
+                     ('current_price', '<f8'), ('current_price_timestamp', '<i8')])
+
+
+def _trade_directory_type(symbol_width, version=SNAPSHOT_VERSION):
+    """
+    A helper method to get the record type of the trade directory.
+    :param symbol_width: the maximum length of the stock symbols in bytes.
+    :type symbol_width: int
+    :param version: the format version of the snapshot.
+    :type version: int
+    :return: the record type.
+    :rtype: numpy.dtype
+    """
+    fields = [('stock_symbol', 'S{}'.format(symbol_width)), ('size', '<i8'), ('offset', '<i8')]
+    if version >= 3:
+        fields.append(('ids_sorted', 'u1'))
+    return np.dtype(fields)
+
+
+def _aligned(offset):
+    """
+    A helper method to round an offset up to the next multiple of 8.
+    """
+    return (offset + 7) // 8 * 8
+
+
+def _encode(text):
+    """
+    A helper method to encode a name or symbol to utf8 bytes.
+    """
+    return text if isinstance(text, bytes) else text.encode('utf8')
+
+
+def write_snapshot(stock_exchange, path, log_offset=0):
+    """
+    A method to save the stocks and trades of a stock exchange in a snapshot file. The snapshot is first written to
+    a temporary file, which then replaces the snapshot file, so a crash never leaves a partially written snapshot.
+    Example usage: write_snapshot(stock_exchange, 'exchange.snapshot')
+    :param stock_exchange: the stock exchange to save.
+    :type stock_exchange: StockExchange
+    :param path: the path of the snapshot file.
+    :type path: str
+    :param log_offset: the length of the write ahead log of the stock exchange, whose records the snapshot contains.
+    :type log_offset: int
+    """
+    # Holding the read lock, so that the snapshot is not changed while it is saved.
+    with stock_exchange.lock.read_locked():
+        stocks = list(stock_exchange.registered_stocks.values())
+        trade_stores = [trade_store for trade_store in stock_exchange.recorded_trades.values() if len(trade_store)]
+        symbol_width = max([len(_encode(stock.stock_symbol)) for stock in stocks] +
+                           [len(_encode(trade_store.stock_symbol)) for trade_store in trade_stores] + [1])
+        name = _encode(stock_exchange.name)
+
+        # The stock table.
+        stock_table = np.zeros(len(stocks), dtype=_stock_table_type(symbol_width))
+        for row, stock in zip(stock_table, stocks):
+            row['stock_symbol'] = _encode(stock.stock_symbol)
+            row['stock_type'] = _STOCK_TYPE_CODES[stock.stock_type]
+            row['last_dividend'] = stock.last_dividend
+            row['par_value'] = stock.par_value
+            row['fixed_dividend'] = stock.fixed_dividend if stock.fixed_dividend is not None else np.nan
+            row['current_price'] = stock.current_price if stock.current_price != '' else np.nan
+            row['current_price_timestamp'] = to_epoch(stock.current_price_timestamp) \
+                if stock.current_price_timestamp else -1
+
+        # The trade directory, with the offsets of the trade columns of each stock.
+        trade_directory = np.zeros(len(trade_stores), dtype=_trade_directory_type(symbol_width))
+        offset = _aligned(_aligned(_aligned(_HEADER.size + len(name)) + stock_table.nbytes) + trade_directory.nbytes)
+        for row, trade_store in zip(trade_directory, trade_stores):
+            row['stock_symbol'] = _encode(trade_store.stock_symbol)
+            row['size'] = len(trade_store)
+            row['offset'] = offset
+            offset = _aligned(offset + len(trade_store) * sum(np.dtype(column_type).itemsize
+                                                              for column_type in _COLUMN_TYPES))
+
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'wb') as snapshot_file:
+            snapshot_file.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(name), symbol_width, len(stocks),
+                                             len(trade_stores), stock_exchange.next_trade_id, log_offset))
+            snapshot_file.write(name)
+            for section in (stock_table, trade_directory):
+                snapshot_file.seek(_aligned(snapshot_file.tell()))
+                snapshot_file.write(section.tobytes())
+            for row, trade_store in zip(trade_directory, trade_stores):
+                snapshot_file.seek(row['offset'])
+                columns = trade_store.columns()
+                for column in _COLUMN_ORDER:
+                    snapshot_file.write(np.ascontiguousarray(columns[column], dtype=_COLUMN_TYPES[column]).tobytes())
+                # Recording the order of the trade IDs, so that loading does not read the whole ID column for it.
+                row['ids_sorted'] = np.all(columns[6][1:] > columns[6][:-1])
+            # The trade directory is written again, with the order of the trade IDs of each stock.
+            snapshot_file.seek(_aligned(_aligned(_HEADER.size + len(name)) + stock_table.nbytes))
+            snapshot_file.write(trade_directory.tobytes())
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+    os.rename(temporary_path, path)
+    logger.info('Saved snapshot of stock exchange: %s with %s stocks and %s stocks with trades in: %s',
+                stock_exchange.name, len(stocks), len(trade_stores), path)
+
+
+def read_snapshot(path, mode='c'):
+    """
+    A method to load a stock exchange from a snapshot file. The trade columns are memory mapped, not read, so
+    loading takes the same time regardless of the number of trades, and their pages are read from disk only when
+    used. The file is mapped once, and the columns are views of the map, so the number of stocks does not count
+    against the limit of memory maps of a process. Processes that map the same snapshot read-only share these
+    pages.
+    Example usage: stock_exchange = read_snapshot('exchange.snapshot', mode='r')
+    :param path: the path of the snapshot file.
+    :type path: str
+    :param mode: 'c' (copy on write) for a stock exchange that can be changed (changes are not written back to the
+                 file), or 'r' (read only) for read only analytics.
+    :type mode: str
+    :return: the loaded stock exchange.
+    :rtype: StockExchange
+    """
+    with open(path, 'rb') as snapshot_file:
+        magic, version, name_length, symbol_width, stocks_count, trade_stores_count, next_trade_id, _ = \
+            _HEADER.unpack(snapshot_file.read(_HEADER.size))
+        if magic != SNAPSHOT_MAGIC or version not in _READABLE_VERSIONS:
+            raise ValueError('File: {} is not a version {} stock exchange snapshot.'.format(path, SNAPSHOT_VERSION))
+        name = snapshot_file.read(name_length).decode('utf8')
+        snapshot_file.seek(_aligned(snapshot_file.tell()))
+        stock_table = np.fromfile(snapshot_file, dtype=_stock_table_type(symbol_width), count=stocks_count)
+        snapshot_file.seek(_aligned(snapshot_file.tell()))
+        trade_directory = np.fromfile(snapshot_file, dtype=_trade_directory_type(symbol_width, version),
+                                      count=trade_stores_count)
+
+    stock_exchange = StockExchange(name)
+    stock_exchange.next_trade_id = next_trade_id
+    for row in stock_table:
+        stock_exchange.add_new_stock(Stock.restore(
+            row['stock_symbol'].decode('utf8'), _STOCK_TYPE_NAMES[int(row['stock_type'])],
+            float(row['last_dividend']), float(row['par_value']),
+            None if np.isnan(row['fixed_dividend']) else float(row['fixed_dividend']),
+            '' if np.isnan(row['current_price']) else float(row['current_price']),
+            from_epoch(row['current_price_timestamp']) if row['current_price_timestamp'] >= 0 else ''))
+
+    snapshot_map = np.memmap(path, dtype=np.uint8, mode=mode) if trade_stores_count else None
+    for row in trade_directory:
+        size, offset = int(row['size']), int(row['offset'])
+        columns = [None] * len(_COLUMN_TYPES)
+        for column in _COLUMN_ORDER:
+            length = size * np.dtype(_COLUMN_TYPES[column]).itemsize
+            columns[column] = snapshot_map[offset:offset + length].view(_COLUMN_TYPES[column])
+            offset += length
+        stock_symbol = row['stock_symbol'].decode('utf8')
+        ids_sorted = bool(row['ids_sorted']) if version >= 3 else None
+        stock_exchange.recorded_trades[stock_symbol] = TradeStore.from_columns(stock_symbol, columns, ids_sorted)
+
+    logger.info('Loaded snapshot of stock exchange: %s with %s stocks and %s stocks with trades from: %s', name,
+                stocks_count, trade_stores_count, path)
+    return stock_exchange
+
+
+def read_snapshot_log_offset(path):
+    """
+    A method to get the length the write ahead log had when a snapshot was saved. The records up to that position
+    are already contained in the snapshot.
+    :param path: the path of the snapshot file.
+    :type path: str
+    :return: the length of the write ahead log.
+    :rtype: int
+    """
+    with open(path, 'rb') as snapshot_file:
+        return _HEADER.unpack(snapshot_file.read(_HEADER.size))[-1]
+
+
+def checkpoint(stock_exchange, path):
+    """
+    A method to save a snapshot of a stock exchange and then discard the records of its write ahead log, which the
+    snapshot already contains. The stock exchange can then be recovered with
+    recover_stock_exchange(name, log_path, snapshot_path=path).
+    The snapshot first records the length of the log, so if the process stops before the log is discarded, recovery
+    skips the records that are already in the snapshot. If it stops after the log is discarded, the log is shorter
+    than the recorded length, so recovery replays all of it. The recorded length is then set to 0, before any new
+    record can be logged, so that recovery never starts in the middle of the new records.
+    :param stock_exchange: the stock exchange to save.
+    :type stock_exchange: StockExchange
+    :param path: the path of the snapshot file.
+    :type path: str
+    """
+    write_ahead_log = stock_exchange.write_ahead_log
+    if write_ahead_log is None:
+        write_snapshot(stock_exchange, path)
+        return
+    # Holding the write lock until the recorded length is reset, so that no changes are logged in between.
+    with stock_exchange.lock.write_locked():
+        write_ahead_log.flush()
+        write_snapshot(stock_exchange, path, os.path.getsize(write_ahead_log.path))
+        write_ahead_log.truncate()
+        # The log is empty now, so all of its future records must be replayed.
+        with open(path, 'r+b') as snapshot_file:
+            snapshot_file.seek(_LOG_OFFSET_POSITION)
+            snapshot_file.write(struct.pack('<q', 0))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
@@ -18,6 +18,11 @@ class Stock(object):
     # An enum to save the stock type.
     StockType = Enum('StockType', 'common preferred')
 
+    # Using slots instead of a per instance __dict__, to keep stock objects compact.
+    __slots__ = ('created_successfully', 'stock_symbol', 'stock_type', 'last_dividend', 'fixed_dividend',
+                 'par_value', 'current_stock_exchange', 'current_price', 'current_price_timestamp', 'dividend_yield',
+                 'p_e_ratio')
+
     def __init__(self, stock_symbol, stock_type, last_dividend, par_value, fixed_dividend=None,
                  current_stock_exchange=None):
         """
@@ -36,7 +41,8 @@ class Stock(object):
         :param current_stock_exchange: An optional StockExchange object, in which to register the stock.
         :type current_stock_exchange: StockExchange
         """
-        logger.debug('Creating a new stock')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Creating a new stock')
         # boolean to check if everything went OK.
         self.created_successfully = True
 
@@ -47,15 +53,15 @@ class Stock(object):
         try:
             self.stock_type = Stock.StockType[stock_type].name
         except KeyError:
-            logger.error('Attempted to add stock with invalid type: {}. Valid types are: {}'
-                         .format(stock_type, Stock.StockType.__members__.keys()))  # , exc_info=True)
+            logger.error('Attempted to add stock with invalid type: %s. Valid types are: %s',
+                         stock_type, Stock.StockType.__members__.keys())  # , exc_info=True)
             self.created_successfully = False
 
         # Assigning last dividend.
         try:
             self.last_dividend = float(last_dividend)
         except ValueError:
-            logger.error('Last dividend must be a numerical value. You entered: {}'.format(last_dividend))
+            logger.error('Last dividend must be a numerical value. You entered: %s', last_dividend)
             self.created_successfully = False
 
         # Assigning fixed dividend.
@@ -65,15 +71,15 @@ class Stock(object):
                 if fixed_dividend[-1] is '%':
                     self.fixed_dividend = float(fixed_dividend[:-1]) / 100
                 elif '.' not in fixed_dividend:
-                    logger.error('Fixed dividend must be a percentage or decimal number value. You entered: {}'.format(
-                        fixed_dividend))
+                    logger.error('Fixed dividend must be a percentage or decimal number value. You entered: %s',
+                                 fixed_dividend)
                     self.created_successfully = False
                 else:
                     self.fixed_dividend = float(fixed_dividend)
             else:
                 self.fixed_dividend = fixed_dividend
         except ValueError:
-            logger.error('Fixed dividend must be a numerical value. You entered: {}'.format(fixed_dividend))
+            logger.error('Fixed dividend must be a numerical value. You entered: %s', fixed_dividend)
             self.created_successfully = False
 
         # If the type is preferred, a fixed dividend must be always provided.
@@ -82,15 +88,15 @@ class Stock(object):
                 logger.error("You provided a 'preferred' stock type. You must also provided a fixed_dividend")
                 self.created_successfully = False
         except AttributeError:
-            logger.error('Attempted to add stock with invalid type: {}. Valid types are: {}'
-                         .format(stock_type, Stock.StockType.__members__.keys()))  # , exc_info=True)
+            logger.error('Attempted to add stock with invalid type: %s. Valid types are: %s',
+                         stock_type, Stock.StockType.__members__.keys())  # , exc_info=True)
             self.created_successfully = False
 
         # Assigning par value.
         try:
             self.par_value = float(par_value)
         except ValueError:
-            logger.error('Par value must be a numerical value. You entered: {}'.format(par_value))
+            logger.error('Par value must be a numerical value. You entered: %s', par_value)
             self.created_successfully = False
 
         # Assigning current_stock_exchange value.
@@ -98,9 +104,8 @@ class Stock(object):
             if isinstance(current_stock_exchange, StockExchange):
                 self.current_stock_exchange = current_stock_exchange
             else:
-                logger.error(
-                    'Argument "current_stock_exchange" must be of type stock_exchange.StockExchange. '
-                    'You provided: {}'.format(current_stock_exchange))
+                logger.error('Argument "current_stock_exchange" must be of type stock_exchange.StockExchange. '
+                             'You provided: %s', current_stock_exchange)
                 self.created_successfully = False
 
         # Initializing dividend_yield and P/E ratio.
@@ -110,10 +115,55 @@ class Stock(object):
         self.p_e_ratio = ''
 
         if self.created_successfully:
-            logger.info(
-                'Successfully created new stock with attributes stock_symbol: {},stock_type: {}, last_dividend: {}, '
-                'fixed_dividend: {}, par_value: {}'.format(self.stock_symbol, self.stock_type, self.last_dividend,
-                                                           self.fixed_dividend, self.par_value))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('Successfully created new stock with attributes stock_symbol: %s,stock_type: %s, '
+                            'last_dividend: %s, fixed_dividend: %s, par_value: %s', self.stock_symbol, self.stock_type,
+                            self.last_dividend, self.fixed_dividend, self.par_value)
             # After creation, adding the stock to the stock exchange
             if current_stock_exchange:
                 self.current_stock_exchange.add_new_stock(self)
+
+    @classmethod
+    def restore(cls, stock_symbol, stock_type, last_dividend, par_value, fixed_dividend=None, current_price='',
+                current_price_timestamp=''):
+        """
+        A method to recreate a stock from already validated values, e.g. when loading a stock exchange from disk.
+        Unlike the constructor, the values are not parsed or validated and nothing is logged.
+        :param stock_symbol: the symbol (abbreviated name) of the stock
+        :type stock_symbol: str
+        :param stock_type: the type of the stock: common | preferred
+        :type stock_type: str
+        :param last_dividend: the last dividend of the stock
+        :type last_dividend: float
+        :param par_value: the par value of the stock
+        :type par_value: float
+        :param fixed_dividend: the fixed dividend of the stock, if any
+        :type fixed_dividend: float
+        :param current_price: the current price of the stock, if any
+        :type current_price: float
+        :param current_price_timestamp: the time the current price was set, if any
+        :type current_price_timestamp: datetime
+        :return: the recreated stock.
+        :rtype: Stock
+        """
+        restored_stock = cls.__new__(cls)
+        restored_stock.created_successfully = True
+        restored_stock.stock_symbol = stock_symbol
+        restored_stock.stock_type = stock_type
+        restored_stock.last_dividend = last_dividend
+        restored_stock.fixed_dividend = fixed_dividend
+        restored_stock.par_value = par_value
+        restored_stock.current_price = current_price
+        restored_stock.current_price_timestamp = current_price_timestamp
+        restored_stock.dividend_yield = ''
+        restored_stock.p_e_ratio = ''
+        return restored_stock
+
+    def to_dict(self):
+        """
+        A method to get the attributes of the stock in a dictionary, e.g. to serialize it as json.
+        :return: the attributes of the stock, except for the stock exchange it is registered in.
+        :rtype: dict
+        """
+        return dict((attribute, getattr(self, attribute)) for attribute in Stock.__slots__
+                    if attribute != 'current_stock_exchange' and hasattr(self, attribute))
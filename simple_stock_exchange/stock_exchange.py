@@ -1,10 +1,17 @@
 #!/usr/bin/python
 
 import logging
+import math
 from datetime import datetime, timedelta
 
 import numpy as np
 
+from concurrency import ReadWriteLock, reads, writes
+from result_cache import DEFAULT_CAPACITY, MISSING, ResultCache
+from stock_table import StockTable
+from time_stamp_parser import current_time_stamp, parse_time_stamp, parse_time_stamps
+from trade_store import TradeStore, TRADE_TYPE_CODES, TRADE_TYPE_NAMES, from_epoch, to_epoch
+
 __author__ = 'Nikitas Papangelopoulos'
 
 logger = logging.getLogger(__name__)
@@ -12,26 +19,95 @@ logger = logging.getLogger(__name__)
 # Constant to use for time frame when calculating the volume weighted stock price.
 MINUTES_FOR_VW_PRICE = 15
 
+# Number of price updates after which the running sum of log-prices is re-summed exactly, to stop rounding errors
+# from accumulating.
+INDEX_RESUM_INTERVAL = 100000
+
+# The number of stored trades of a stock a filtered trade query reads and filters at a time.
+QUERY_BLOCK_SIZE = 10000
+
+# The number of trades StockExchange.query_trade_rows() finds at a time, each time holding the read lock.
+QUERY_PAGE_SIZE = 1000
+
+# The fields of the trades returned by StockExchange.query_trades().
+TRADE_QUERY_TYPE = np.dtype([('stock_symbol', object), ('time_stamp', np.int64), ('traded_price', np.float64),
+                             ('quantity', np.int64), ('trade_type', np.uint8), ('trade_id', np.int64)])
+
+
+def merge_trades(results, offset=0, limit=None):
+    """
+    A method to merge the trades of many stocks, each sorted by timestamp, into one array sorted by timestamp and ID,
+    and to keep only a slice of them.
+    :param results: the trades of every stock, as numpy arrays of TRADE_QUERY_TYPE.
+    :type results: list(numpy.ndarray)
+    :param offset: the number of trades to skip.
+    :type offset: int
+    :param limit: the maximum number of trades to keep. By default: all trades.
+    :type limit: int
+    :return: the trades, as a numpy array of TRADE_QUERY_TYPE.
+    :rtype: numpy.ndarray
+    """
+    results = [result for result in results if len(result)]
+    if not results:
+        return np.empty(0, dtype=TRADE_QUERY_TYPE)
+    if len(results) == 1:
+        # The trades of a stock are already sorted.
+        trades = results[0]
+    else:
+        trades = np.concatenate(results)
+        trades = trades[np.lexsort((trades['trade_id'], trades['time_stamp']))]
+    offset = int(offset)
+    return trades[offset:] if limit is None else trades[offset:offset + int(limit)]
+
 
 class StockExchange(object):
     """
     A class to model a simple stock exchange. Can contain stocks and trades for these stocks.
     It also includes methods for calculating various metrics for the stocks and trades.
+    It can be used from many threads: the methods that change it hold the write lock of the stock exchange, and the
+    calculators that read its trades hold the read lock, so they run concurrently with each other but never with a
+    change. The all share index and the P/E ratio are read without locking, from values that are replaced as a
+    whole by the writers.
     """
 
-    def __init__(self, name):
+    def __init__(self, name, write_ahead_log=None, result_cache_size=DEFAULT_CAPACITY):
         # Creating a new stock exchange:
         """
         Constructor.
         :param name: The name to give to the stock exchange when creating it
         :type name: str
+        :param write_ahead_log: An optional write ahead log, in which to record all changes to the stock exchange.
+        :type write_ahead_log: WriteAheadLog
+        :param result_cache_size: The maximum number of calculator results to cache. With 0 none are cached.
+        :type result_cache_size: int
         """
         self.name = name
+        self.write_ahead_log = write_ahead_log
+        # The age in minutes after which trades are dropped, while a retention policy is active (see RetentionPolicy).
+        self.retention_horizon = None
+        # Held by the methods that change the stock exchange (writes) and by the calculators that read its trades.
+        self.lock = ReadWriteLock()
         self.registered_stocks = {}
+        # The trades of each stock symbol, stored in columns by a TradeStore.
         self.recorded_trades = {}
+        # The ID to give to the next recorded trade. IDs are unique within the stock exchange.
+        self.next_trade_id = 0
         self.all_share_index = ''
-        logger.info('Successfully created new stock exchange with attributes name: {}.'.format(self.name))
+        # State to maintain the all share index incrementally: the log-price each stock contributes to the index
+        # (None for non positive prices), their running sum and the number of non positive prices.
+        self._index_log_prices = {}
+        self._log_price_sum = 0.0
+        self._non_positive_prices = 0
+        self._log_price_updates = 0
+        # The parameters of all registered stocks in numpy arrays, for the batch calculators.
+        self._stock_table = StockTable()
+        # The objects that follow the recorded and removed trades (see TradeListener).
+        self.trade_listeners = []
+        # The results of the calculators, used again until the trades or the registration of their stock change.
+        self.result_cache = ResultCache(result_cache_size)
+        logger.info('Successfully created new stock exchange with attributes name: %s.', self.name)
 
+    @writes
     def add_new_stock(self, stock_to_add):
         """
         A method to add a stock to the stock exchange.
@@ -43,12 +119,19 @@ class StockExchange(object):
         # Checking if the stock is already registered.
         if not self.is_stock_registered(stock_to_add.stock_symbol, True):
             self.registered_stocks[stock_to_add.stock_symbol] = stock_to_add
-            logger.info('Added new stock: {}, to stock_exchange'.format(stock_to_add.stock_symbol))
+            self._stock_table.add(stock_to_add)
+            self.result_cache.invalidate(stock_to_add.stock_symbol)
+            self._add_to_share_index(stock_to_add)
+            self._refresh_all_share_index()
+            if self.write_ahead_log is not None:
+                self.write_ahead_log.log_add_stock(stock_to_add)
+            logger.info('Added new stock: %s, to stock_exchange', stock_to_add.stock_symbol)
             return True
         else:
             logger.debug('Please remove it first.')
             return False
 
+    @writes
     def remove_existing_stock(self, stock_to_remove):
         """
         A method to remove a stock from the stock exchange.
@@ -59,10 +142,17 @@ class StockExchange(object):
         """
         if self.is_stock_registered(stock_to_remove.stock_symbol):
             self.registered_stocks.pop(stock_to_remove.stock_symbol)
-            logger.info('Removed stock: {}, from stock_exchange'.format(stock_to_remove.stock_symbol))
+            self._stock_table.remove(stock_to_remove.stock_symbol)
+            self.result_cache.invalidate(stock_to_remove.stock_symbol)
+            self._remove_from_share_index(stock_to_remove.stock_symbol)
+            self._refresh_all_share_index()
+            if self.write_ahead_log is not None:
+                self.write_ahead_log.log_remove_stock(stock_to_remove.stock_symbol)
+            logger.info('Removed stock: %s, from stock_exchange', stock_to_remove.stock_symbol)
             return True
         return False
 
+    @writes
     def remove_existing_stock_by_symbol(self, stock_symbol):
         """
         A method to remove a stock from the stock exchange using its symbol as a unique identifier.
@@ -73,10 +163,37 @@ class StockExchange(object):
         """
         if self.is_stock_registered(stock_symbol):
             self.registered_stocks.pop(stock_symbol)
-            logger.info('Removed stock: {}, from stock_exchange'.format(stock_symbol))
+            self._stock_table.remove(stock_symbol)
+            self.result_cache.invalidate(stock_symbol)
+            self._remove_from_share_index(stock_symbol)
+            self._refresh_all_share_index()
+            if self.write_ahead_log is not None:
+                self.write_ahead_log.log_remove_stock(stock_symbol)
+            logger.info('Removed stock: %s, from stock_exchange', stock_symbol)
             return True
         return False
 
+    @writes
+    def add_trade_listener(self, listener):
+        """
+        A method to register an object to be notified of every trade recorded in or removed from the stock exchange.
+        :param listener: the object to notify.
+        :type listener: TradeListener
+        """
+        listener.added_to(self)
+        self.trade_listeners.append(listener)
+
+    @writes
+    def remove_trade_listener(self, listener):
+        """
+        A method to stop notifying an object of the trades of the stock exchange.
+        :param listener: the object to stop notifying.
+        :type listener: TradeListener
+        """
+        if listener in self.trade_listeners:
+            self.trade_listeners.remove(listener)
+
+    @writes
     def add_new_trade(self, trade_to_add):
         """
         A method to record a trade for a specific stock to the stock exchange.
@@ -91,20 +208,158 @@ class StockExchange(object):
             # Updating the stock price and timestamp only if it is newer than the existing.
             self.update_stock_price(trade_to_add)
 
-            if trade_to_add.stock_symbol in self.recorded_trades:
-                self.recorded_trades[trade_to_add.stock_symbol].append(trade_to_add)
-            else:
-                self.recorded_trades[trade_to_add.stock_symbol] = [trade_to_add]
-            logger.info('Recorded new trade: {}, in stock_exchange with timestamp {}.'.format(trade_to_add.stock_symbol,
-                                                                                              trade_to_add.time_stamp))
+            if trade_to_add.stock_symbol not in self.recorded_trades:
+                self.recorded_trades[trade_to_add.stock_symbol] = TradeStore(trade_to_add.stock_symbol)
+            time_stamp = to_epoch(trade_to_add.time_stamp)
+            trade_to_add.trade_id = self.next_trade_id
+            self.next_trade_id += 1
+            self.recorded_trades[trade_to_add.stock_symbol].append(time_stamp, trade_to_add.traded_price,
+                                                                   trade_to_add.quantity, trade_to_add.trade_type,
+                                                                   trade_to_add.trade_id)
+            self.result_cache.invalidate(trade_to_add.stock_symbol)
+            if self.write_ahead_log is not None:
+                self.write_ahead_log.log_add_trade(trade_to_add.stock_symbol, time_stamp, trade_to_add.traded_price,
+                                                   trade_to_add.quantity, TRADE_TYPE_CODES[trade_to_add.trade_type],
+                                                   trade_to_add.trade_id)
+            for listener in self.trade_listeners:
+                listener.trades_added(trade_to_add.stock_symbol, (time_stamp,), (trade_to_add.traded_price,),
+                                      (trade_to_add.quantity,), (TRADE_TYPE_CODES[trade_to_add.trade_type],))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('Recorded new trade: %s, in stock_exchange with timestamp %s.', trade_to_add.stock_symbol,
+                            trade_to_add.time_stamp)
             return True
         else:
             logger.info('Then retry recording the trade.')
             return False
 
+    @writes
+    def add_trades_bulk(self, trades=None, stock_symbols=None, quantities=None, trade_types=None, traded_prices=None,
+                        time_stamps=None):
+        """
+        A method to record many trades at once, either from an iterable of trades or from columns.
+        All trades are validated in vectorized form, the trades of each stock are stored in one step and the price of
+        each stock is updated once per batch.
+        Example usage: stock_exchange.add_trades_bulk([('TEA', '500', 'sell', '150', '2017-02-05 22:14:39'),
+                                                       ('GIN', '300', 'buy', '130', '2017-02-05 22:14:40')])
+        :param trades: the trades as (stock_symbol, quantity, trade_type, traded_price, time_stamp) tuples. The
+                       time_stamp can be omitted or None, in which case the current time is used.
+        :type trades: iterable
+        :param stock_symbols: the symbol (abbreviated name) of the stock of each trade, if trades is not provided.
+        :type stock_symbols: list | numpy.ndarray
+        :param quantities: the number of stocks traded in each trade, if trades is not provided.
+        :type quantities: list | numpy.ndarray
+        :param trade_types: the type of each trade (buy | sell), if trades is not provided.
+        :type trade_types: list | numpy.ndarray
+        :param traded_prices: the price of the stock for each trade, if trades is not provided.
+        :type traded_prices: list | numpy.ndarray
+        :param time_stamps: the time stamp of each trade in the format: Y-m-d H:M:S, if trades is not provided.
+                            If none are provided .now() is used.
+        :type time_stamps: list | numpy.ndarray
+        :return: a mask of the trades that were recorded successfully in the stock exchange.
+        :rtype: numpy.ndarray
+        """
+        if trades is not None:
+            trades = [tuple(trade) + (None,) * (5 - len(trade)) for trade in trades]
+            stock_symbols, quantities, trade_types, traded_prices, time_stamps = zip(*trades) if trades else \
+                ((),) * 5
+        trades_count = len(stock_symbols)
+        if time_stamps is None:
+            time_stamps = [None] * trades_count
+
+        # Validating all trades.
+        stock_symbols = np.asarray(stock_symbols)
+        registered = np.array([stock_symbol in self.registered_stocks for stock_symbol in stock_symbols],
+                              dtype=np.bool_)
+        quantities, valid_quantities = StockExchange._to_quantity_array(quantities)
+        trade_types = np.asarray(trade_types)
+        trade_type_codes = np.zeros(trades_count, dtype=np.uint8)
+        for trade_type, code in TRADE_TYPE_CODES.items():
+            trade_type_codes[trade_types == trade_type] = code
+        traded_prices = StockExchange._to_float_array(traded_prices)
+        time_stamps, valid_time_stamps = parse_time_stamps(time_stamps)
+        recorded = registered & valid_quantities & (trade_type_codes > 0) & ~np.isnan(traded_prices) & \
+            valid_time_stamps
+        if not recorded.all():
+            logger.warning('Could not record %s of %s trades. Their stock is not registered or they are not valid.',
+                           trades_count - np.count_nonzero(recorded), trades_count)
+
+        # Storing the trades of each stock in one step.
+        recorded_positions = np.flatnonzero(recorded)
+        symbols_of_recorded, symbol_indices = np.unique(stock_symbols[recorded_positions], return_inverse=True)
+        for index in range(len(symbols_of_recorded)):
+            positions = recorded_positions[symbol_indices == index]
+            self._record_trades(stock_symbols[positions[0]], time_stamps[positions], traded_prices[positions],
+                                quantities[positions], trade_type_codes[positions])
+
+        logger.info('Recorded %s new trades for %s stocks in stock_exchange.', len(recorded_positions),
+                    len(symbols_of_recorded))
+        return recorded
+
+    def _record_trades(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes, trade_ids=None):
+        """
+        A helper method to store many validated trades of a registered stock in one step and update its price once.
+        The trades are given consecutive IDs, unless their IDs are provided (e.g. when replaying a write ahead log).
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamps: the epoch timestamps of the trades.
+        :type time_stamps: numpy.ndarray
+        :param traded_prices: the prices of the stock for the trades.
+        :type traded_prices: numpy.ndarray
+        :param quantities: The number of stocks traded in each trade.
+        :type quantities: numpy.ndarray
+        :param trade_type_codes: the codes of the types of the trades.
+        :type trade_type_codes: numpy.ndarray
+        :param trade_ids: the IDs of the trades.
+        :type trade_ids: numpy.ndarray
+        """
+        if trade_ids is None:
+            trade_ids = np.arange(self.next_trade_id, self.next_trade_id + len(time_stamps), dtype=np.int64)
+        self.next_trade_id = max(self.next_trade_id, int(trade_ids.max()) + 1)
+        if stock_symbol not in self.recorded_trades:
+            self.recorded_trades[stock_symbol] = TradeStore(stock_symbol, max(len(time_stamps), 64))
+        self.recorded_trades[stock_symbol].extend(time_stamps, traded_prices, quantities, trade_type_codes, trade_ids)
+        self.result_cache.invalidate(stock_symbol)
+        if self.write_ahead_log is not None:
+            self.write_ahead_log.log_add_trades(stock_symbol, time_stamps, traded_prices, quantities,
+                                                trade_type_codes, trade_ids)
+        for listener in self.trade_listeners:
+            listener.trades_added(stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes)
+
+        # Updating the stock price once, with the earliest recorded of the latest trades.
+        latest_position = np.argmax(time_stamps)
+        self._update_stock_price(stock_symbol, float(traded_prices[latest_position]),
+                                 from_epoch(time_stamps[latest_position]))
+
+    @staticmethod
+    def _to_quantity_array(quantities):
+        """
+        A helper method to convert user provided quantities to an integer array.
+        :param quantities: the quantities to convert.
+        :type quantities: list | numpy.ndarray
+        :return: the converted quantities and a mask of the valid ones (non negative whole numbers).
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        quantities = np.asarray(quantities)
+        try:
+            if quantities.dtype.kind == 'f':
+                raise ValueError('Quantities must be whole numbers.')
+            converted_quantities = quantities.astype(np.int64)
+            return converted_quantities, converted_quantities >= 0
+        except (TypeError, ValueError):
+            # Slow path, converting the quantities one by one, like TradeRecord does.
+            converted_quantities = np.zeros(len(quantities), dtype=np.int64)
+            valid_quantities = np.zeros(len(quantities), dtype=np.bool_)
+            for index, quantity in enumerate(quantities):
+                if str(quantity).isdigit():
+                    converted_quantities[index] = int(quantity)
+                    valid_quantities[index] = True
+            return converted_quantities, valid_quantities
+
+    @writes
     def remove_trade(self, trade_to_remove):
         """
-        A method to remove a trade for a specific stock from the stock exchange.
+        A method to remove a trade for a specific stock from the stock exchange. A trade that was recorded is found
+        by its ID, any other trade by its attributes.
         :param trade_to_remove: The trade object to remove from the stock exchange
         :type trade_to_remove: TradeRecord
         :return: True || False, whether the trade was removed successfully from the stock exchange.
@@ -112,21 +367,23 @@ class StockExchange(object):
         """
         # Checking if trade of that symbol exist in the stock exchange.
         if trade_to_remove.stock_symbol in self.recorded_trades:
-            try:
-                self.recorded_trades[trade_to_remove.stock_symbol].remove(trade_to_remove)
-                # If no trades are left for the specific stock, remove the key:value completely.
-                if len(self.recorded_trades[trade_to_remove.stock_symbol]) == 0:
-                    self.recorded_trades.pop(trade_to_remove.stock_symbol)
-                logger.info('Removed trade for stock: {}, from stock_exchange.'.format(trade_to_remove.stock_symbol))
-                return True
-            except ValueError:
+            trade_store = self.recorded_trades[trade_to_remove.stock_symbol]
+            if trade_to_remove.trade_id is not None:
+                position = trade_store.find_by_id(trade_to_remove.trade_id)
+            else:
+                position = trade_store.find(to_epoch(trade_to_remove.time_stamp), trade_to_remove.traded_price,
+                                            trade_to_remove.quantity, trade_to_remove.trade_type)
+            if position is None:
                 logger.warning('Could not remove trade. It was not found in the stock_exchange.')
                 return False
+            self._remove_stored_trade(trade_store, position)
+            return True
         else:
-            logger.warning('Could not remove trade. No trades in the stock_exchange for stock: {}.'.format(
-                trade_to_remove.stock_symbol))
+            logger.warning('Could not remove trade. No trades in the stock_exchange for stock: %s.',
+                           trade_to_remove.stock_symbol)
             return False
 
+    @writes
     def remove_trade_by_symbol_date(self, trade_stock_symbol, trade_timestamp):
         """
         A method to remove a specific trade from the exchange, by using the stock symbol and timestamp as unique
@@ -142,21 +399,101 @@ class StockExchange(object):
         # Checking if trade of that symbol exist in the stock exchange.
         if trade_stock_symbol in self.recorded_trades:
             # Using the date to match the trade for removal.
-            matched_trades = [trade for trade in self.recorded_trades[trade_stock_symbol] if
-                              str(trade.time_stamp) == trade_timestamp]
-            if matched_trades:
-                self.remove_trade(matched_trades[0])
+            try:
+                position = self.recorded_trades[trade_stock_symbol].find_by_time_stamp(
+                    to_epoch(parse_time_stamp(trade_timestamp)))
+            except (TypeError, ValueError):
+                position = None
+            if position is not None:
+                self._remove_stored_trade(self.recorded_trades[trade_stock_symbol], position)
                 return True
             else:
-                logger.warning(
-                    'Could not remove trade. No trades in the stock_exchange for stock: {} and timestamp.'.format(
-                        trade_stock_symbol, trade_timestamp))
+                logger.warning('Could not remove trade. No trades in the stock_exchange for stock: %s and '
+                               'timestamp: %s.', trade_stock_symbol, trade_timestamp)
             return False
         else:
-            logger.warning(
-                'Could not remove trade. No trades in the stock_exchange for stock: {}.'.format(trade_stock_symbol))
+            logger.warning('Could not remove trade. No trades in the stock_exchange for stock: %s.', trade_stock_symbol)
             return False
 
+    @writes
+    def remove_trade_by_id(self, stock_symbol, trade_id):
+        """
+        A method to remove a specific trade from the exchange, by the ID it was given when it was recorded (see
+        TradeRecord.trade_id).
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param trade_id: the ID of the trade.
+        :type trade_id: int
+        :return: True || False, whether the trade was removed successfully from the stock exchange.
+        :rtype: bool
+        """
+        if stock_symbol in self.recorded_trades:
+            try:
+                position = self.recorded_trades[stock_symbol].find_by_id(int(trade_id))
+            except (TypeError, ValueError):
+                position = None
+            if position is not None:
+                self._remove_stored_trade(self.recorded_trades[stock_symbol], position)
+                return True
+            logger.warning('Could not remove trade. No trade in the stock_exchange for stock: %s with id: %s.',
+                           stock_symbol, trade_id)
+            return False
+        else:
+            logger.warning('Could not remove trade. No trades in the stock_exchange for stock: %s.', stock_symbol)
+            return False
+
+    def _remove_stored_trade(self, trade_store, position):
+        """
+        A helper method to remove a trade from the trade store of its stock.
+        :param trade_store: the trade store of the stock the trade belongs to.
+        :type trade_store: TradeStore
+        :param position: the position of the trade in the trade store.
+        :type position: int
+        """
+        removed_trade = trade_store.trade_at(position)
+        if self.write_ahead_log is not None:
+            self.write_ahead_log.log_remove_trade(trade_store.stock_symbol, *removed_trade)
+        trade_store.remove_at(position)
+        self.result_cache.invalidate(trade_store.stock_symbol)
+        for listener in self.trade_listeners:
+            listener.trade_removed(trade_store.stock_symbol, *removed_trade[:4])
+        # If no trades are left for the specific stock, remove the key:value completely.
+        if len(trade_store) == 0:
+            self.recorded_trades.pop(trade_store.stock_symbol)
+        logger.info('Removed trade for stock: %s, from stock_exchange.', trade_store.stock_symbol)
+
+    @writes
+    def expire_trades(self, stock_symbol, time_stamp):
+        """
+        A method to remove all the trades of a stock that happened before a time, e.g. because they are too old to
+        keep in memory (see RetentionPolicy). Unlike a removed trade, the price of the stock is not affected.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp before which trades are removed.
+        :type time_stamp: int
+        :return: the timestamps, prices, quantities, trade type codes and IDs of the removed trades, and the number of
+                 bytes given back by the trade store of the stock.
+        :rtype: tuple(list(numpy.ndarray), int)
+        """
+        trade_store = self.recorded_trades.get(stock_symbol)
+        if trade_store is None or not len(trade_store) or trade_store.trade_at(0)[0] >= time_stamp:
+            return [np.empty(0, dtype=dtype) for dtype in (np.int64, np.float64, np.int64, np.uint8, np.int64)], 0
+        if self.write_ahead_log is not None:
+            self.write_ahead_log.log_expire_trades(stock_symbol, time_stamp)
+        allocated_bytes = trade_store.nbytes
+        expired_trades = trade_store.drop_before(time_stamp)
+        reclaimed_bytes = allocated_bytes - trade_store.nbytes
+        self.result_cache.invalidate(stock_symbol)
+        for listener in self.trade_listeners:
+            listener.trades_expired(stock_symbol, time_stamp)
+        # If no trades are left for the specific stock, remove the key:value completely.
+        if len(trade_store) == 0:
+            self.recorded_trades.pop(stock_symbol)
+            reclaimed_bytes = allocated_bytes
+        logger.info('Expired %s trades for stock: %s, from stock_exchange.', len(expired_trades[0]), stock_symbol)
+        return expired_trades, reclaimed_bytes
+
+    @writes
     def update_stock_price(self, trade_to_add):
         """
         A helper method to assign or update the price of a stock each time a trade is recorded.
@@ -166,26 +503,114 @@ class StockExchange(object):
         :return: True || False, whether the stock price was successfully assigned to the stock.
         :rtype: bool
         """
+        return self._update_stock_price(trade_to_add.stock_symbol, trade_to_add.traded_price, trade_to_add.time_stamp)
+
+    def _update_stock_price(self, stock_symbol, traded_price, time_stamp):
+        """
+        A helper method to update the price of a stock, if the given price is more recent than the existing one.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param traded_price: the traded price of the stock.
+        :type traded_price: float
+        :param time_stamp: the time the stock was traded at this price.
+        :type time_stamp: datetime
+        :return: True || False, whether the stock price was successfully assigned to the stock.
+        :rtype: bool
+        """
+        current_stock = self.registered_stocks[stock_symbol]
         # Checking if a price has already been set.
-        if self.registered_stocks[trade_to_add.stock_symbol].current_price_timestamp:
-            if trade_to_add.time_stamp > self.registered_stocks[trade_to_add.stock_symbol].current_price_timestamp:
+        if current_stock.current_price_timestamp:
+            if time_stamp > current_stock.current_price_timestamp:
                 # Only updating the price if it is more recent than the existing one
-                self.registered_stocks[trade_to_add.stock_symbol].current_price = trade_to_add.traded_price
-                self.registered_stocks[trade_to_add.stock_symbol].current_price_timestamp = trade_to_add.time_stamp
-                logger.debug(
-                    "Successfully updated stock price, for stock: {}. New price: {}".format(trade_to_add.stock_symbol,
-                                                                                            trade_to_add.traded_price))
+                self._set_stock_price(current_stock, traded_price, time_stamp)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Successfully updated stock price, for stock: %s. New price: %s", stock_symbol,
+                                 traded_price)
                 return True
         else:
             # Case when this is the first time a stock price is set.
-            self.registered_stocks[trade_to_add.stock_symbol].current_price = trade_to_add.traded_price
-            self.registered_stocks[trade_to_add.stock_symbol].current_price_timestamp = trade_to_add.time_stamp
-            logger.debug(
-                "Successfully updated stock price, for stock: {}. New price: {}".format(trade_to_add.stock_symbol,
-                                                                                        trade_to_add.traded_price))
+            self._set_stock_price(current_stock, traded_price, time_stamp)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Successfully updated stock price, for stock: %s. New price: %s", stock_symbol,
+                             traded_price)
             return True
         return False
 
+    def _set_stock_price(self, current_stock, stock_price, time_stamp):
+        """
+        A helper method to assign a new price to a registered stock, keeping the all share index up to date, and to
+        notify the listeners of the stock exchange.
+        :param current_stock: the registered stock whose price changed.
+        :type current_stock: Stock
+        :param stock_price: the new price of the stock.
+        :type stock_price: float
+        :param time_stamp: the time the price was set.
+        :type time_stamp: datetime
+        """
+        self._remove_from_share_index(current_stock.stock_symbol)
+        current_stock.current_price = stock_price
+        current_stock.current_price_timestamp = time_stamp
+        self._stock_table.set_price(current_stock.stock_symbol, stock_price)
+        self._add_to_share_index(current_stock)
+        self._refresh_all_share_index()
+        for listener in self.trade_listeners:
+            listener.price_updated(current_stock.stock_symbol, stock_price, time_stamp)
+
+    def _add_to_share_index(self, current_stock):
+        """
+        A helper method to add the price of a stock to the running sum of log-prices. Stocks without a price yet
+        contribute their par value.
+        :param current_stock: the registered stock to add.
+        :type current_stock: Stock
+        """
+        stock_price = current_stock.current_price if current_stock.current_price != '' else current_stock.par_value
+        if stock_price > 0:
+            log_price = math.log(stock_price)
+            self._log_price_sum += log_price
+        else:
+            log_price = None
+            self._non_positive_prices += 1
+        self._index_log_prices[current_stock.stock_symbol] = log_price
+
+        # Re-summing every now and then, so that rounding errors of the running sum do not build up.
+        self._log_price_updates += 1
+        if self._log_price_updates >= INDEX_RESUM_INTERVAL:
+            self._log_price_updates = 0
+            self._log_price_sum = math.fsum(log_price for log_price in self._index_log_prices.values()
+                                            if log_price is not None)
+
+    def _remove_from_share_index(self, stock_symbol):
+        """
+        A helper method to remove the price of a stock from the running sum of log-prices.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        """
+        if stock_symbol in self._index_log_prices:
+            log_price = self._index_log_prices.pop(stock_symbol)
+            if log_price is None:
+                self._non_positive_prices -= 1
+            else:
+                self._log_price_sum -= log_price
+        if not self._index_log_prices:
+            # Starting from an exact zero when the stock exchange becomes empty.
+            self._log_price_sum = 0.0
+
+    def _refresh_all_share_index(self):
+        """
+        A helper method to update the cached all share index, i.e. the geometric mean of all stock prices.
+        It is O(1), unless some stock has a non positive price, in which case the product of all prices is used.
+        """
+        stocks_count = len(self._index_log_prices)
+        if not stocks_count:
+            self.all_share_index = ''
+        elif not self._non_positive_prices:
+            self.all_share_index = np.round(math.exp(self._log_price_sum / stocks_count), decimals=3)
+        else:
+            all_stock_prices = [current_stock.current_price if current_stock.current_price != ''
+                                else current_stock.par_value for current_stock in self.registered_stocks.values()]
+            self.all_share_index = np.round(np.power(np.prod(all_stock_prices), np.divide(1, float(stocks_count))),
+                                            decimals=3)
+
     def is_stock_registered(self, stock_symbol_to_check, adding_created_stock=False):
         """
         A helper method to check if a stock is already in the stock exchange.
@@ -198,13 +623,14 @@ class StockExchange(object):
         :rtype: bool
         """
         if stock_symbol_to_check in self.registered_stocks.keys():
-            logger.debug('Stock symbol: {}, has already been registered in the current stock exchange.'.format(
-                stock_symbol_to_check))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Stock symbol: %s, has already been registered in the current stock exchange.',
+                             stock_symbol_to_check)
             return True
         else:
             if not adding_created_stock:
-                logger.warning('Stock symbol: {}, has not been registered yet in the current stock exchange. '
-                               'Please add it first'.format(stock_symbol_to_check))
+                logger.warning('Stock symbol: %s, has not been registered yet in the current stock exchange. '
+                               'Please add it first', stock_symbol_to_check)
             return False
 
     @staticmethod
@@ -221,11 +647,12 @@ class StockExchange(object):
             if stock_price != 0.0:
                 return stock_price
             else:
-                logger.error('Stock price must be a non zero numerical value. You entered: {}'.format(price_to_check))
+                logger.error('Stock price must be a non zero numerical value. You entered: %s', price_to_check)
         except ValueError:
-            logger.error('Stock price must be a a non zero numerical value. You entered: {}'.format(price_to_check))
+            logger.error('Stock price must be a a non zero numerical value. You entered: %s', price_to_check)
         return False
 
+    @writes
     def dividend_yield_calculator(self, stock_symbol, stock_price):
         """
         A method to calculate the dividend yield of a stock, given its price.
@@ -244,20 +671,29 @@ class StockExchange(object):
             # Checking if the stock_price is valid
             validated_price = StockExchange.is_stock_price_valid(stock_price)
             if validated_price:
-                # Updating the trade price and timestamp of the price for the stock
-                current_stock.current_price = validated_price
-                current_stock.current_price_timestamp = datetime.strptime(str(datetime.now())[:-7], '%Y-%m-%d %H:%M:%S')
-                # Checking the type of the stock to use the correct equation.
-                if current_stock.stock_type == 'common':
-                    logger.debug('Calculating dividend yield, for common stock type.')
-                    dividend = np.round(np.divide(current_stock.last_dividend, validated_price), decimals=3)
-                elif current_stock.stock_type == 'preferred':
-                    logger.debug('Calculating dividend yield, for preferred stock type.')
-                    dividend = np.round(
-                        np.divide(np.multiply(current_stock.fixed_dividend, current_stock.par_value), validated_price),
-                        decimals=3)
-                logger.info('Successfully calculated dividend yield: {}, for stock: {} and price: {}'
-                            .format(dividend, stock_symbol, stock_price))
+                # Updating the trade price and timestamp of the price for the stock, and logging it, since no trade
+                # records the new price.
+                time_stamp = current_time_stamp()
+                self._set_stock_price(current_stock, validated_price, time_stamp)
+                if self.write_ahead_log is not None:
+                    self.write_ahead_log.log_update_price(stock_symbol, to_epoch(time_stamp), validated_price)
+                # Using the cached dividend yield, if it was calculated for this price since the stock last changed.
+                dividend = self.result_cache.get('dividend_yield', stock_symbol, (validated_price,))
+                if dividend is MISSING:
+                    dividend = None
+                    # Checking the type of the stock to use the correct equation.
+                    if current_stock.stock_type == 'common':
+                        logger.debug('Calculating dividend yield, for common stock type.')
+                        dividend = np.round(np.divide(current_stock.last_dividend, validated_price), decimals=3)
+                    elif current_stock.stock_type == 'preferred':
+                        logger.debug('Calculating dividend yield, for preferred stock type.')
+                        dividend = np.round(np.divide(np.multiply(current_stock.fixed_dividend,
+                                                                  current_stock.par_value), validated_price),
+                                            decimals=3)
+                    self.result_cache.put('dividend_yield', stock_symbol, (validated_price,), dividend)
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info('Successfully calculated dividend yield: %s, for stock: %s and price: %s', dividend,
+                                stock_symbol, stock_price)
                 current_stock.dividend_yield = dividend
         return dividend
 
@@ -279,26 +715,104 @@ class StockExchange(object):
             # Checking if the stock_price is valid
             validated_price = StockExchange.is_stock_price_valid(stock_price)
             if validated_price:
-                denominator = 0.0
-                # Checking the type of the stock to use the correct equation.
-                if current_stock.stock_type == 'common':
-                    logger.debug('Calculating dividend, for common stock type.')
-                    denominator = current_stock.last_dividend
-                elif current_stock.stock_type == 'preferred':
-                    logger.debug('Calculating dividend, for preferred stock type.')
-                    denominator = np.multiply(current_stock.fixed_dividend, current_stock.par_value)
+                # Using the cached P/E ratio, if it was calculated for this price since the stock last changed. The
+                # version is taken first, since this calculator does not hold the lock.
+                version = self.result_cache.version(stock_symbol)
+                p_e_ratio = self.result_cache.get('p_e_ratio', stock_symbol, (validated_price,))
+                if p_e_ratio is MISSING:
+                    p_e_ratio = None
+                    denominator = 0.0
+                    # Checking the type of the stock to use the correct equation.
+                    if current_stock.stock_type == 'common':
+                        logger.debug('Calculating dividend, for common stock type.')
+                        denominator = current_stock.last_dividend
+                    elif current_stock.stock_type == 'preferred':
+                        logger.debug('Calculating dividend, for preferred stock type.')
+                        denominator = np.multiply(current_stock.fixed_dividend, current_stock.par_value)
 
-                try:
-                    # Post process to avoid division by zero.
-                    if denominator != 0.0:
-                        p_e_ratio = np.round(np.divide(validated_price, denominator), decimals=3)
-                        logger.info('Successfully calculated P/E ratio: {}, for stock: {} '
-                                    'and price: {}'.format(p_e_ratio, stock_symbol, stock_price))
-                except TypeError as error:
-                    logger.error('Tried to calculate P/E ratio, but got error: {}'.format(error))
+                    try:
+                        # Post process to avoid division by zero.
+                        if denominator != 0.0:
+                            p_e_ratio = np.round(np.divide(validated_price, denominator), decimals=3)
+                            if logger.isEnabledFor(logging.INFO):
+                                logger.info('Successfully calculated P/E ratio: %s, for stock: %s and price: %s',
+                                            p_e_ratio, stock_symbol, stock_price)
+                    except TypeError as error:
+                        logger.error('Tried to calculate P/E ratio, but got error: %s', error)
+                    self.result_cache.put('p_e_ratio', stock_symbol, (validated_price,), p_e_ratio, version)
 
         return p_e_ratio
 
+    @reads
+    def batch_calculator(self, stock_symbols=None, stock_prices=None):
+        """
+        A method to calculate the dividend yield and the P/E ratio of many stocks at once, in one vectorized pass.
+        Unlike dividend_yield_calculator(), the prices of the stocks are not updated.
+        Example usage: stock_exchange.batch_calculator(['POP', 'GIN'], ['150', '350'])
+        :param stock_symbols: the symbols (abbreviated names) of the stocks. If none are provided, all registered
+                              stocks are used.
+        :type stock_symbols: list | numpy.ndarray
+        :param stock_prices: the price of each stock. If none are provided, the current price of each stock is used.
+        :type stock_prices: list | numpy.ndarray
+        :return: the stock symbols, their dividend yields and their P/E ratios. Values that could not be calculated
+                 (unregistered stock, invalid price, zero dividend for the P/E ratio) are NaN.
+        :rtype: tuple(numpy.ndarray, numpy.ndarray, numpy.ndarray)
+        """
+        stock_table = self._stock_table
+        if stock_symbols is None:
+            stock_symbols = np.array(stock_table.stock_symbols)
+            positions = np.arange(len(stock_table))
+        else:
+            stock_symbols = np.asarray(stock_symbols)
+            positions = stock_table.positions(stock_symbols)
+            if (positions < 0).any():
+                logger.warning('Stock symbols: %s, have not been registered yet in the current stock exchange.',
+                               list(stock_symbols[positions < 0]))
+        registered = positions >= 0
+        positions = positions[registered]
+
+        # Assigning the price of each stock. Invalid and zero prices are replaced by NaN.
+        validated_prices = np.full(len(stock_symbols), np.nan)
+        if stock_prices is None:
+            validated_prices[registered] = stock_table.current_prices[positions]
+        else:
+            validated_prices[:] = StockExchange._to_float_array(stock_prices)
+            validated_prices[~registered] = np.nan
+        validated_prices[validated_prices == 0.0] = np.nan
+
+        # Using the correct equation for each stock type, through the preferred stocks mask.
+        dividends = np.full(len(stock_symbols), np.nan)
+        dividends[registered] = np.where(stock_table.is_preferred[positions],
+                                         stock_table.preferred_dividends[positions],
+                                         stock_table.last_dividends[positions])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dividend_yields = np.round(np.divide(dividends, validated_prices), decimals=3)
+            p_e_ratios = np.round(np.divide(validated_prices, np.where(dividends != 0.0, dividends, np.nan)),
+                                  decimals=3)
+        logger.info('Successfully calculated dividend yields and P/E ratios for %s stocks', len(stock_symbols))
+        return stock_symbols, dividend_yields, p_e_ratios
+
+    @staticmethod
+    def _to_float_array(values):
+        """
+        A helper method to convert user provided values to a float array.
+        :param values: the values to convert.
+        :type values: list | numpy.ndarray
+        :return: the converted values, with NaN for the values that are not numerical.
+        :rtype: numpy.ndarray
+        """
+        try:
+            return np.asarray(values, dtype=np.float64)
+        except ValueError:
+            # Slow path, converting the values one by one.
+            converted_values = np.full(len(values), np.nan)
+            for index, value in enumerate(values):
+                try:
+                    converted_values[index] = float(value)
+                except (TypeError, ValueError):
+                    logger.error('Stock price must be a numerical value. You entered: %s', value)
+            return converted_values
+
     def all_share_index_calculator(self):
         """
         A method to calculate the all share index for all stocks in the stock exchange.
@@ -307,13 +821,9 @@ class StockExchange(object):
         """
         # Checking if there are any stocks in the stock exchange
         if self.registered_stocks:
-            all_stock_prices = [self.registered_stocks[price_symbol].current_price
-                                if self.registered_stocks[price_symbol].current_price is not ''
-                                else self.registered_stocks[price_symbol].par_value for price_symbol in
-                                self.registered_stocks.keys()]
-            all_share_index = np.round(np.power(np.prod(all_stock_prices), np.divide(1, float(len(all_stock_prices)))),
-                                       decimals=3)
-            logger.info('Successfully calculated the all share index: {}'.format(all_share_index))
+            # The index is maintained on every price update, so it only needs to be read.
+            all_share_index = self.all_share_index
+            logger.info('Successfully calculated the all share index: %s', all_share_index)
             return all_share_index
 
         else:
@@ -321,6 +831,23 @@ class StockExchange(object):
                 'Stock exchange is empty. Please register some stocks first, record some trades and then retry.')
             return None
 
+    @reads
+    def share_index_components(self):
+        """
+        A method to get the parts the all share index is calculated from, so that the indices of many stock exchanges
+        (e.g. the shards of a ShardedStockExchange) can be combined into one.
+        :return: the sum of the log-prices of the stocks with a positive price, the number of stocks, the number of
+                 stocks with a non positive price and, only if there are such stocks, the product of all prices.
+        :rtype: tuple(float, int, int, float | None)
+        """
+        prices_product = None
+        if self._non_positive_prices:
+            prices_product = float(np.prod([current_stock.current_price if current_stock.current_price != ''
+                                            else current_stock.par_value
+                                            for current_stock in self.registered_stocks.values()]))
+        return self._log_price_sum, len(self._index_log_prices), self._non_positive_prices, prices_product
+
+    @reads
     def vw_stock_price_calculator(self, stock_symbol, time_span=None):
         """
         A method to calculate the volume weighted price of a stock, for a given time frame.
@@ -340,27 +867,177 @@ class StockExchange(object):
             try:
                 time_span = int(time_span)
             except ValueError:
-                logger.error('Time span must be a numerical value. You entered: {}'.format(time_span))
+                logger.error('Time span must be a numerical value. You entered: %s', time_span)
                 return False
 
-        starting_time = datetime.today() - timedelta(minutes=time_span)
+        starting_time = to_epoch(datetime.today() - timedelta(minutes=time_span))
         # Checking if the stock is registered in the stock exchange.
         if self.is_stock_registered(stock_symbol):
-            # Collecting trades for this particular stock over the specified time frame.
-            latest_trades = [trade for trade in self.recorded_trades[stock_symbol] if trade.time_stamp > starting_time]
-            if latest_trades:
-                # Getting the denominator. reduce/lambda is used only for
-                # knowledge demonstration purposes. sum() is simpler
-                denominator = float(reduce(lambda x, y: x + y, [trade.quantity for trade in latest_trades]))
-                # Calculating the volume weighted stock price.
-                volume_weighted_price = sum(
-                    [np.round(np.divide(np.multiply(trade.traded_price, trade.quantity), denominator), decimals=3) for
-                     trade in latest_trades])
-                logger.info(
-                    'Successfully calculated the volume weighted price {} for stock: {}'.format(volume_weighted_price,
-                                                                                                stock_symbol))
+            # Using the cached price, if it was calculated for the same starting second since the trades last changed.
+            volume_weighted_price = self.result_cache.get('vw_price', stock_symbol, (starting_time,))
+            if volume_weighted_price is MISSING:
+                volume_weighted_price = None
+                # Calculating the volume weighted stock price over the trades of the specified time frame.
+                if stock_symbol in self.recorded_trades:
+                    volume_weighted_price = self.recorded_trades[stock_symbol].volume_weighted_price(starting_time)
+                self.result_cache.put('vw_price', stock_symbol, (starting_time,), volume_weighted_price)
+            if volume_weighted_price is not None:
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info('Successfully calculated the volume weighted price %s for stock: %s',
+                                volume_weighted_price, stock_symbol)
             else:
-                logger.info('No trades found for stock: {} in the last: {} minutes. '
-                            'Unable to calculate volume weighted price.'.format(stock_symbol, MINUTES_FOR_VW_PRICE))
+                logger.info('No trades found for stock: %s in the last: %s minutes. '
+                            'Unable to calculate volume weighted price.', stock_symbol, time_span)
 
         return volume_weighted_price
+
+    @reads
+    def query_trades(self, stock_symbols, starting_time=None, ending_time=None, trade_type=None, min_quantity=None,
+                     max_quantity=None, offset=0, limit=None):
+        """
+        A method to get the trades of one or many stocks that happened between two times, optionally only the trades
+        of one type or within a range of quantities. The trades of each stock are kept sorted by timestamp, so they
+        are found with a binary search, and the cost depends on the number of trades between the two times and not
+        on all the trades of the stock. Only offset + limit trades of each stock are read without a type or quantity
+        filter, and with one, the trades are read and filtered in blocks until offset + limit trades match.
+        Example usage: stock_exchange.query_trades(['TEA', 'POP'], '2017-02-05 12:00:00', '2017-02-05 13:00:00',
+                                                   trade_type='buy', limit=100)
+        :param stock_symbols: the symbol (abbreviated name) of a stock, or the symbols of many stocks.
+        :type stock_symbols: str | list(str)
+        :param starting_time: the earliest time of a trade, in the format Y-m-d H:M:S. By default the first trade.
+        :type starting_time: str
+        :param ending_time: the latest time of a trade, in the format Y-m-d H:M:S. By default the last trade.
+        :type ending_time: str
+        :param trade_type: the type of the trades, buy or sell. By default both.
+        :type trade_type: str
+        :param min_quantity: the minimum quantity of a trade (inclusive).
+        :type min_quantity: int
+        :param max_quantity: the maximum quantity of a trade (inclusive).
+        :type max_quantity: int
+        :param offset: the number of matching trades to skip.
+        :type offset: int
+        :param limit: the maximum number of trades to get. By default all matching trades.
+        :type limit: int
+        :return: the trades, sorted by timestamp and ID, as a numpy array of TRADE_QUERY_TYPE.
+        :rtype: numpy.ndarray
+        :raises ValueError: if a time is not in the format Y-m-d H:M:S, or the trade type is not valid.
+        """
+        stock_symbols, after, ending_time = self._query_bounds(stock_symbols, starting_time, ending_time, trade_type)
+        read_limit = None if limit is None else int(offset) + int(limit)
+        trades = merge_trades([self._find_trades(stock_symbol, after, ending_time, trade_type, min_quantity,
+                                                 max_quantity, read_limit) for stock_symbol in stock_symbols],
+                              offset, limit)
+        logger.info('Found %s trades of stocks: %s', len(trades), stock_symbols)
+        return trades
+
+    @staticmethod
+    def _query_bounds(stock_symbols, starting_time, ending_time, trade_type):
+        """
+        A helper method to validate the parameters of a trade query.
+        :return: the symbols of the stocks, the timestamp and ID of the trade to start after (None for the first
+                 trade) and the epoch timestamp of the latest trade.
+        :rtype: tuple(list(str), tuple | None, int)
+        :raises ValueError: if a time is not in the format Y-m-d H:M:S, or the trade type is not valid.
+        """
+        if isinstance(stock_symbols, basestring):
+            stock_symbols = [stock_symbols]
+        if trade_type is not None and trade_type not in TRADE_TYPE_CODES:
+            raise ValueError('Trade type must be one of: {}. You entered: {}'.format(sorted(TRADE_TYPE_CODES),
+                                                                                  trade_type))
+        # Starting after the last possible trade of the second before the starting time.
+        after = None if starting_time is None else (to_epoch(parse_time_stamp(starting_time)) - 1,
+                                                    np.iinfo(np.int64).max)
+        ending_time = np.iinfo(np.int64).max if ending_time is None else to_epoch(parse_time_stamp(ending_time))
+        return stock_symbols, after, ending_time
+
+    def _find_trades(self, stock_symbol, after, ending_time, trade_type=None, min_quantity=None, max_quantity=None,
+                     limit=None):
+        """
+        A helper method to find the trades of a stock after a trade and up to a time, optionally of one type or within
+        a range of quantities. With a filter, the stored trades are read and filtered QUERY_BLOCK_SIZE at a time, until
+        limit trades match, so the cost depends on the trades read and not on the whole time frame. The read lock
+        must be held.
+        :param after: the timestamp and ID of the trade to start after, or None for the first stored trade.
+        :type after: tuple | None
+        :return: the trades, sorted by timestamp and ID, as a numpy array of TRADE_QUERY_TYPE.
+        :rtype: numpy.ndarray
+        """
+        trade_store = self.recorded_trades.get(stock_symbol)
+        filtered = trade_type is not None or min_quantity is not None or max_quantity is not None
+        results = []
+        found = 0
+        while trade_store is not None and (limit is None or found < limit):
+            if filtered:
+                block_size = QUERY_BLOCK_SIZE
+            else:
+                block_size = None if limit is None else limit - found
+            block = trade_store.trades_after(*(after or (None, None)), limit=block_size)
+            in_range = int(np.searchsorted(block[0], ending_time, side='right'))
+            time_stamps, traded_prices, quantities, trade_type_codes, trade_ids = [column[:in_range]
+                                                                                   for column in block]
+            if in_range:
+                after = (time_stamps[-1], trade_ids[-1])
+            if filtered:
+                matching = np.ones(len(time_stamps), dtype=np.bool_)
+                if trade_type is not None:
+                    matching &= trade_type_codes == TRADE_TYPE_CODES[trade_type]
+                if min_quantity is not None:
+                    matching &= quantities >= int(min_quantity)
+                if max_quantity is not None:
+                    matching &= quantities <= int(max_quantity)
+                time_stamps, traded_prices, quantities, trade_type_codes, trade_ids = [
+                    column[matching] for column in (time_stamps, traded_prices, quantities, trade_type_codes,
+                                                    trade_ids)]
+            trades = np.empty(len(time_stamps), dtype=TRADE_QUERY_TYPE)
+            trades['stock_symbol'] = stock_symbol
+            trades['time_stamp'] = time_stamps
+            trades['traded_price'] = traded_prices
+            trades['quantity'] = quantities
+            trades['trade_type'] = trade_type_codes
+            trades['trade_id'] = trade_ids
+            results.append(trades)
+            found += len(trades)
+            # Stopping at the end of the time frame, or of the stored trades.
+            if block_size is None or in_range < len(block[0]) or len(block[0]) < block_size:
+                break
+        trades = merge_trades(results)
+        return trades if limit is None else trades[:limit]
+
+    @reads
+    def _query_page(self, stock_symbols, after, ending_time, trade_type, min_quantity, max_quantity, limit):
+        """
+        A helper method to find the next trades of a query after a trade, holding the read lock.
+        See query_trade_rows().
+        """
+        return merge_trades([self._find_trades(stock_symbol, after, ending_time, trade_type, min_quantity,
+                                               max_quantity, limit) for stock_symbol in stock_symbols], 0, limit)
+
+    def query_trade_rows(self, stock_symbols, starting_time=None, ending_time=None, trade_type=None,
+                         min_quantity=None, max_quantity=None, offset=0, limit=None):
+        """
+        A method to get the trades found by query_trades() one at a time, e.g. to stream them. The trades are found
+        QUERY_PAGE_SIZE at a time, each time after the last trade found, so they are never all held in memory, and
+        the read lock is not held while the trades are consumed. See query_trades() for the parameters.
+        :return: for every trade: its stock symbol, timestamp, price, quantity, trade type and ID.
+        :rtype: generator
+        :raises ValueError: if a time is not in the format Y-m-d H:M:S, or the trade type is not valid, when the first
+                            trade is taken.
+        """
+        stock_symbols, after, ending_time = self._query_bounds(stock_symbols, starting_time, ending_time, trade_type)
+        to_skip = int(offset)
+        remaining = None if limit is None else int(limit)
+        while remaining is None or remaining > 0:
+            page_size = QUERY_PAGE_SIZE if remaining is None else min(QUERY_PAGE_SIZE, to_skip + remaining)
+            trades = self._query_page(stock_symbols, after, ending_time, trade_type, min_quantity, max_quantity,
+                                      page_size)
+            if len(trades):
+                after = (trades['time_stamp'][-1], trades['trade_id'][-1])
+            skipped = min(to_skip, len(trades))
+            to_skip -= skipped
+            for trade in trades[skipped:skipped + remaining if remaining is not None else None]:
+                yield (trade['stock_symbol'], from_epoch(trade['time_stamp']), float(trade['traded_price']),
+                       int(trade['quantity']), TRADE_TYPE_NAMES[int(trade['trade_type'])], int(trade['trade_id']))
+            if remaining is not None:
+                remaining -= len(trades) - skipped
+            if len(trades) < page_size:
+                break
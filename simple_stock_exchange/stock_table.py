@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import logging
+
+import numpy as np
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The number of rows allocated when the table is created.
+INITIAL_CAPACITY = 64
+
+
+class StockTable(object):
+    """
+    A class to keep the parameters of all the stocks registered in a stock exchange in numpy arrays, one row per
+    stock, so that metrics can be calculated for all the stocks at once.
+    Rows are removed by moving the last row in their place, so both adding and removing a stock are O(1).
+    """
+
+    # The names of all the columns of the table.
+    _COLUMNS = ('_last_dividends', '_preferred_dividends', '_is_preferred', '_current_prices')
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        """
+        Constructor.
+        :param capacity: the number of stocks to allocate space for.
+        :type capacity: int
+        """
+        self.stock_symbols = []
+        self._positions = {}
+        self._last_dividends = np.empty(capacity, dtype=np.float64)
+        # The fixed dividend multiplied by the par value. Only used for preferred stocks.
+        self._preferred_dividends = np.empty(capacity, dtype=np.float64)
+        self._is_preferred = np.empty(capacity, dtype=np.bool_)
+        # The current price of each stock, or NaN if it does not have one yet.
+        self._current_prices = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.stock_symbols)
+
+    def __contains__(self, stock_symbol):
+        return stock_symbol in self._positions
+
+    @property
+    def last_dividends(self):
+        """The last dividend of each stock."""
+        return self._last_dividends[:len(self)]
+
+    @property
+    def preferred_dividends(self):
+        """The fixed dividend multiplied by the par value of each stock."""
+        return self._preferred_dividends[:len(self)]
+
+    @property
+    def is_preferred(self):
+        """A mask of the preferred stocks. The rest are common stocks."""
+        return self._is_preferred[:len(self)]
+
+    @property
+    def current_prices(self):
+        """The current price of each stock (NaN if it has no price yet)."""
+        return self._current_prices[:len(self)]
+
+    def add(self, stock_to_add):
+        """
+        A method to add the parameters of a stock to the table.
+        :param stock_to_add: The stock object to add.
+        :type stock_to_add: Stock
+        """
+        size = len(self)
+        if size == len(self._last_dividends):
+            for attribute in StockTable._COLUMNS:
+                old_column = getattr(self, attribute)
+                new_column = np.empty(max(2 * size, INITIAL_CAPACITY), dtype=old_column.dtype)
+                new_column[:size] = old_column[:size]
+                setattr(self, attribute, new_column)
+
+        self._positions[stock_to_add.stock_symbol] = size
+        self.stock_symbols.append(stock_to_add.stock_symbol)
+        self._last_dividends[size] = stock_to_add.last_dividend
+        self._is_preferred[size] = stock_to_add.stock_type == 'preferred'
+        if self._is_preferred[size]:
+            self._preferred_dividends[size] = stock_to_add.fixed_dividend * stock_to_add.par_value
+        else:
+            self._preferred_dividends[size] = np.nan
+        self._current_prices[size] = stock_to_add.current_price if stock_to_add.current_price != '' else np.nan
+
+    def remove(self, stock_symbol):
+        """
+        A method to remove the parameters of a stock from the table.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        """
+        position = self._positions.pop(stock_symbol)
+        last_position = len(self) - 1
+        last_symbol = self.stock_symbols.pop()
+        if position != last_position:
+            # Moving the last row in the place of the removed one.
+            self.stock_symbols[position] = last_symbol
+            self._positions[last_symbol] = position
+            for attribute in StockTable._COLUMNS:
+                column = getattr(self, attribute)
+                column[position] = column[last_position]
+
+    def set_price(self, stock_symbol, stock_price):
+        """
+        A method to update the current price of a stock in the table.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param stock_price: the new price of the stock.
+        :type stock_price: float
+        """
+        self._current_prices[self._positions[stock_symbol]] = stock_price
+
+    def positions(self, stock_symbols):
+        """
+        A method to get the rows of the given stocks.
+        :param stock_symbols: the symbols (abbreviated names) of the stocks.
+        :type stock_symbols: list
+        :return: the row of each stock, or -1 for stocks not in the table.
+        :rtype: numpy.ndarray
+        """
+        return np.array([self._positions.get(stock_symbol, -1) for stock_symbol in stock_symbols], dtype=np.intp)
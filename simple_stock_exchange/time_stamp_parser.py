@@ -0,0 +1,108 @@
+#!/usr/bin/python
+
+import logging
+from datetime import datetime
+
+import numpy as np
+
+from trade_store import to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The format of all time stamps provided by the user.
+TIME_STAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The maximum number of parsed dates to keep. Trades usually arrive for a handful of dates, so this is never reached.
+DATE_CACHE_SIZE = 1024
+
+# The positions of the separators of a zero padded time stamp, and of the digits between them.
+_SEPARATOR_POSITIONS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':'}
+_DIGIT_POSITIONS = [position for position in range(19) if position not in _SEPARATOR_POSITIONS]
+
+# Cache of the date part (Y-m-d) of the time stamps, to the parsed (year, month, day).
+_date_cache = {}
+
+
+def parse_time_stamp(time_stamp):
+    """
+    A method to parse a time stamp in the format Y-m-d H:M:S. It is equivalent to
+    datetime.strptime(time_stamp, TIME_STAMP_FORMAT), but the fields of well formed time stamps are sliced directly
+    and their date part is parsed only once.
+    :param time_stamp: the time stamp to parse, e.g. 2017-02-05 22:14:39
+    :type time_stamp: str
+    :return: the parsed time stamp.
+    :rtype: datetime
+    :raises ValueError: if the time stamp is not in the expected format, or it is not a valid date and time.
+    """
+    if len(time_stamp) == 19 and time_stamp[10] == ' ' and time_stamp[13] == ':' and time_stamp[16] == ':' and \
+            (time_stamp[11:13] + time_stamp[14:16] + time_stamp[17:19]).isdigit():
+        date_part = time_stamp[:10]
+        date = _date_cache.get(date_part)
+        if date is None:
+            parsed_date = datetime.strptime(date_part, '%Y-%m-%d')
+            date = (parsed_date.year, parsed_date.month, parsed_date.day)
+            if len(_date_cache) >= DATE_CACHE_SIZE:
+                _date_cache.clear()
+            _date_cache[date_part] = date
+        # The datetime constructor validates the ranges of the hour, minute and second.
+        return datetime(date[0], date[1], date[2], int(time_stamp[11:13]), int(time_stamp[14:16]),
+                        int(time_stamp[17:19]))
+    # Slow path, for time stamps that are not zero padded or not valid.
+    return datetime.strptime(time_stamp, TIME_STAMP_FORMAT)
+
+
+def current_time_stamp():
+    """
+    A method to get the current time, truncated to seconds like the time stamps provided by the user.
+    :return: the current time stamp.
+    :rtype: datetime
+    """
+    return datetime.now().replace(microsecond=0)
+
+
+def parse_time_stamps(time_stamps):
+    """
+    A method to parse many time stamps in the format Y-m-d H:M:S to epoch seconds, in vectorized form.
+    :param time_stamps: the time stamps to parse. None values are replaced by the current time.
+    :type time_stamps: list | numpy.ndarray
+    :return: the epoch seconds and a mask of the valid time stamps.
+    :rtype: tuple(numpy.ndarray, numpy.ndarray)
+    """
+    converted_time_stamps = np.zeros(len(time_stamps), dtype=np.int64)
+    valid_time_stamps = np.zeros(len(time_stamps), dtype=np.bool_)
+    given_time_stamps = np.array([time_stamp is not None for time_stamp in time_stamps], dtype=np.bool_)
+    converted_time_stamps[~given_time_stamps] = to_epoch(current_time_stamp())
+    valid_time_stamps[~given_time_stamps] = True
+    if not given_time_stamps.any():
+        return converted_time_stamps, valid_time_stamps
+
+    # Fast path: checking the shape of all time stamps at once and letting numpy parse them. numpy accepts more than
+    # strptime does (e.g. signed years), so only time stamps with digits and separators at the fixed positions of
+    # Y-m-d H:M:S are given to it, and the rest are left to parse_time_stamp.
+    given_positions = np.flatnonzero(given_time_stamps)
+    try:
+        text_time_stamps = np.asarray(time_stamps)[given_positions]
+        well_formed = np.char.str_len(text_time_stamps) == 19
+        characters = text_time_stamps.astype('S19').view(np.uint8).reshape(len(text_time_stamps), 19)
+        for position, separator in _SEPARATOR_POSITIONS.items():
+            well_formed &= characters[:, position] == ord(separator)
+        digits = characters[:, _DIGIT_POSITIONS]
+        well_formed &= ((digits >= ord('0')) & (digits <= ord('9'))).all(axis=1)
+        converted_time_stamps[given_positions[well_formed]] = \
+            text_time_stamps[well_formed].astype('datetime64[s]').astype(np.int64)
+        valid_time_stamps[given_positions[well_formed]] = True
+        slow_positions = given_positions[~well_formed]
+    except (TypeError, ValueError, UnicodeError):
+        slow_positions = given_positions
+
+    # Slow path, parsing the remaining time stamps one by one.
+    for position in slow_positions:
+        try:
+            converted_time_stamps[position] = to_epoch(parse_time_stamp(time_stamps[position]))
+            valid_time_stamps[position] = True
+        except (TypeError, ValueError):
+            logger.error('Timestamp provided must be in the following format "Y-m-d H:M:S". You entered: %s',
+                         time_stamps[position])
+    return converted_time_stamps, valid_time_stamps
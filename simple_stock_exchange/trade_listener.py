@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+__author__ = 'Nikitas Papangelopoulos'
+
+
+class TradeListener(object):
+    """
+    A base class for objects that follow the trades of a stock exchange as they are recorded and removed, e.g. to
+    keep aggregates of them up to date. Listeners are called while the stock exchange holds its write lock, so they
+    must be quick and must not call back into the stock exchange.
+    Example usage: stock_exchange.add_trade_listener(RollingVWAP())
+    """
+
+    def added_to(self, stock_exchange):
+        """
+        A method called when the listener is added to a stock exchange, before it is called for any trades, e.g. to
+        aggregate the trades already recorded. Unlike the other methods, it can read the trades of the stock exchange.
+        :param stock_exchange: the stock exchange.
+        :type stock_exchange: StockExchange
+        """
+        pass
+
+    def trades_added(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes):
+        """
+        A method called after trades of a stock have been recorded.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamps: the epoch timestamps of the trades.
+        :type time_stamps: list | numpy.ndarray
+        :param traded_prices: the prices of the stock for the trades.
+        :type traded_prices: list | numpy.ndarray
+        :param quantities: The number of stocks traded in each trade.
+        :type quantities: list | numpy.ndarray
+        :param trade_type_codes: the codes of the types of the trades (see trade_store.TRADE_TYPE_CODES).
+        :type trade_type_codes: list | numpy.ndarray
+        """
+        pass
+
+    def trade_removed(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code):
+        """
+        A method called after a trade of a stock has been removed.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp of the trade.
+        :type time_stamp: int
+        :param traded_price: the price of the stock for the trade.
+        :type traded_price: float
+        :param quantity: The number of stocks traded.
+        :type quantity: int
+        :param trade_type_code: the code of the type of the trade.
+        :type trade_type_code: int
+        """
+        pass
+
+    def trades_expired(self, stock_symbol, time_stamp):
+        """
+        A method called after the trades of a stock that happened before a time have been dropped because they are
+        too old to keep (see StockExchange.expire_trades()). Aggregates of them can be kept, since the trades did
+        happen.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp before which the trades were dropped.
+        :type time_stamp: int
+        """
+        pass
+
+    def price_updated(self, stock_symbol, current_price, time_stamp):
+        """
+        A method called after the current price of a stock has changed, e.g. because a more recent trade was recorded.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param current_price: the new price of the stock.
+        :type current_price: float
+        :param time_stamp: the time the price was set.
+        :type time_stamp: datetime
+        """
+        pass
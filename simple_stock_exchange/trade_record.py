@@ -1,11 +1,11 @@
 #!/usr/bin/python
 
 import logging
-from datetime import datetime
 
 from enum import Enum
 
 from stock_exchange import StockExchange
+from time_stamp_parser import current_time_stamp, parse_time_stamp
 
 __author__ = 'Nikitas Papangelopoulos'
 
@@ -20,6 +20,10 @@ class TradeRecord(object):
     # An enum to save the stock type.
     TradeType = Enum('TradeType', 'buy sell')
 
+    # Using slots instead of a per instance __dict__, since many trades can be kept in memory.
+    __slots__ = ('created_successfully', 'stock_symbol', 'quantity', 'trade_type', 'traded_price', 'time_stamp',
+                 'current_stock_exchange', 'trade_id')
+
     def __init__(self, current_stock_exchange, stock_symbol, quantity, trade_type, traded_price, time_stamp=None):
         """
         The constructor, to create a new trade for some stock in the stock exchange.
@@ -37,7 +41,8 @@ class TradeRecord(object):
         :param time_stamp: the time stamp of the trade in the format: Y-m-d H:M:S. If none is provided .now() is used.
         :type time_stamp: str
         """
-        logger.debug('Recording a new trade')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Recording a new trade')
         # boolean to check if everything went OK.
         self.created_successfully = True
 
@@ -49,48 +54,51 @@ class TradeRecord(object):
         if quantity.isdigit():
             self.quantity = int(quantity)
         else:
-            logger.error('Quantity of shares must be a numerical value. You entered: {}'.format(quantity))
+            logger.error('Quantity of shares must be a numerical value. You entered: %s', quantity)
             self.created_successfully = False
 
         # Assigning trade type.
         try:
             self.trade_type = TradeRecord.TradeType[trade_type].name
         except KeyError:
-            logger.error('Attempted to record a trade with invalid type: {}. Valid types are: {}'
-                         .format(trade_type, TradeRecord.TradeType.__members__.keys()))
+            logger.error('Attempted to record a trade with invalid type: %s. Valid types are: %s',
+                         trade_type, TradeRecord.TradeType.__members__.keys())
             self.created_successfully = False
 
         # Assigning traded price of shares traded.
         try:
             self.traded_price = float(traded_price)
         except ValueError:
-            logger.error('Traded price of shares must be a numerical value. You entered: {}'.format(traded_price))
+            logger.error('Traded price of shares must be a numerical value. You entered: %s', traded_price)
             self.created_successfully = False
 
         # Assigning the timestamp.
         if time_stamp:
             # Attempting to convert the time to the appropriate format.
             try:
-                self.time_stamp = datetime.strptime(time_stamp, '%Y-%m-%d %H:%M:%S')
+                self.time_stamp = parse_time_stamp(time_stamp)
             except ValueError:
                 logger.error('Timestamp provided must be in the following format "Y-m-d H:M:S". '
-                             'You entered: {}'.format(time_stamp))
+                             'You entered: %s', time_stamp)
                 self.created_successfully = False
         else:
-            self.time_stamp = datetime.strptime(str(datetime.now())[:-7], '%Y-%m-%d %H:%M:%S')
+            self.time_stamp = current_time_stamp()
 
         # Assigning current_stock_exchange value.
         if isinstance(current_stock_exchange, StockExchange):
             self.current_stock_exchange = current_stock_exchange
         else:
-            logger.error(
-                'Argument "current_stock_exchange" must be of type stock_exchange.StockExchange. '
-                'You provided: {}'.format(current_stock_exchange))
+            logger.error('Argument "current_stock_exchange" must be of type stock_exchange.StockExchange. '
+                         'You provided: %s', current_stock_exchange)
             self.created_successfully = False
 
+        # The ID given to the trade by the stock exchange, when it is recorded.
+        self.trade_id = None
         if self.created_successfully:
-            logger.info(
-                'Successfully created new trade with attributes stock_symbol: {}, quantity: {}, trade_type: {}, '
-                'traded_price: {}, time_stamp: {}.'.format(self.stock_symbol, self.quantity, self.trade_type,
-                                                           self.traded_price, self.time_stamp))
+            if logger.isEnabledFor(logging.INFO):
+                logger.info('Successfully created new trade with attributes stock_symbol: %s, quantity: %s, '
+                            'trade_type: %s, traded_price: %s, time_stamp: %s.', self.stock_symbol, self.quantity,
+                            self.trade_type, self.traded_price, self.time_stamp)
             self.current_stock_exchange.add_new_trade(self)
+            # The stock exchange keeps its own copy of the trade, so the reference to it is no longer needed.
+            self.current_stock_exchange = None
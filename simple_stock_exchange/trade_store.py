@@ -0,0 +1,559 @@
+#!/usr/bin/python
+
+import bisect
+import calendar
+import logging
+from datetime import datetime
+
+import numpy as np
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# Numerical codes used to store the trade type. They match the values of TradeRecord.TradeType.
+TRADE_TYPE_CODES = {'buy': 1, 'sell': 2}
+TRADE_TYPE_NAMES = dict((code, name) for name, code in TRADE_TYPE_CODES.items())
+
+# The number of rows allocated for a symbol when its first trade is recorded.
+INITIAL_CAPACITY = 64
+
+# The maximum number of removed trades that are only marked as removed (tombstones), before they are removed from the
+# buffers all together.
+COMPACTION_THRESHOLD = 1024
+
+
+def to_epoch(time_stamp):
+    """
+    A helper method to convert a (naive) datetime to integer seconds since the epoch.
+    :param time_stamp: the timestamp to convert.
+    :type time_stamp: datetime
+    :return: the seconds since the epoch.
+    :rtype: int
+    """
+    return calendar.timegm(time_stamp.timetuple())
+
+
+def from_epoch(epoch):
+    """
+    A helper method to convert integer seconds since the epoch back to a (naive) datetime.
+    :param epoch: the seconds since the epoch.
+    :type epoch: int
+    :return: the corresponding timestamp.
+    :rtype: datetime
+    """
+    return datetime.utcfromtimestamp(int(epoch))
+
+
+class TradeStore(object):
+    """
+    A class to store all the trades of a single stock in columns, backed by numpy buffers.
+    Each trade costs 49 bytes (timestamp, price, quantity, trade type, two running sums and the ID of the trade),
+    instead of a full TradeRecord object. The buffers grow geometrically, so appending a trade is amortized O(1).
+    The trades are kept sorted by timestamp, together with running (prefix) sums of price * quantity and quantity,
+    so that the volume weighted price over any time window needs only two binary searches and one subtraction.
+    Removed trades are first only marked as removed (tombstones), which is O(log n), and are taken out of the buffers
+    in one step once COMPACTION_THRESHOLD of them (or an eighth of the trades) have been removed, so that a burst of
+    removals does not shift the buffers and recalculate the running sums once per trade.
+    """
+
+    # The names of all the buffers of the store.
+    _COLUMNS = ('_time_stamps', '_traded_prices', '_quantities', '_trade_types', '_cumulative_notional',
+                '_cumulative_quantities', '_trade_ids')
+    # The buffers with the values of the trades themselves, which are moved together when trades are inserted or
+    # removed. The running sums are recalculated instead.
+    _TRADE_COLUMNS = ('_time_stamps', '_traded_prices', '_quantities', '_trade_types', '_trade_ids')
+
+    def __init__(self, stock_symbol, capacity=INITIAL_CAPACITY):
+        """
+        Constructor.
+        :param stock_symbol: the symbol (abbreviated name) of the stock the trades belong to.
+        :type stock_symbol: str
+        :param capacity: the number of trades to allocate space for.
+        :type capacity: int
+        """
+        self.stock_symbol = stock_symbol
+        self.size = 0
+        self._time_stamps = np.empty(capacity, dtype=np.int64)
+        self._traded_prices = np.empty(capacity, dtype=np.float64)
+        self._quantities = np.empty(capacity, dtype=np.int64)
+        self._trade_types = np.empty(capacity, dtype=np.uint8)
+        # Running sums, up to and including each trade.
+        self._cumulative_notional = np.empty(capacity, dtype=np.float64)
+        self._cumulative_quantities = np.empty(capacity, dtype=np.int64)
+        # The IDs given to the trades by the stock exchange. They are given in increasing order, so usually they are
+        # sorted like the trades and a trade is found by a binary search. Otherwise (out of order trades) an index
+        # from ID to position is built when needed.
+        self._trade_ids = np.empty(capacity, dtype=np.int64)
+        self._ids_sorted = True
+        self._positions_by_id = None
+        # The removed trades that are still in the buffers: their positions, sorted, and the price * quantity and
+        # quantity of each of them.
+        self._tombstone_positions = []
+        self._tombstones = {}
+
+    def __len__(self):
+        return self.size - len(self._tombstones)
+
+    @classmethod
+    def from_columns(cls, stock_symbol, columns, ids_sorted=None):
+        """
+        A method to create a trade store on top of existing columns, e.g. memory mapped from a snapshot file.
+        The columns are not copied. They are only replaced by new buffers when the store grows.
+        :param stock_symbol: the symbol (abbreviated name) of the stock the trades belong to.
+        :type stock_symbol: str
+        :param columns: the columns of the trades, in the order returned by columns(), including the trade IDs.
+        :type columns: list(numpy.ndarray)
+        :param ids_sorted: whether the trade IDs are in increasing order, if it is known. Otherwise the whole ID
+                           column is read to find out.
+        :type ids_sorted: bool
+        :return: the trade store.
+        :rtype: TradeStore
+        """
+        trade_store = cls(stock_symbol, capacity=0)
+        for attribute, column in zip(TradeStore._COLUMNS, columns):
+            setattr(trade_store, attribute, column)
+        trade_store.size = len(columns[0])
+        if ids_sorted is None:
+            ids_sorted = bool(np.all(trade_store.trade_ids[1:] > trade_store.trade_ids[:-1]))
+        trade_store._ids_sorted = ids_sorted
+        return trade_store
+
+    def columns(self):
+        """
+        A method to get all the columns of the stored trades, including the running sums.
+        :return: the timestamps, prices, quantities, trade types, running sums of price * quantity, running sums of
+                 quantity and IDs of the trades.
+        :rtype: list(numpy.ndarray)
+        """
+        if not self._tombstones:
+            return [getattr(self, attribute)[:self.size] for attribute in TradeStore._COLUMNS]
+        # Leaving out the removed trades, without changing the buffers, since readers may share the store.
+        columns = [self._live_column(attribute) for attribute in TradeStore._COLUMNS]
+        columns[4] = np.cumsum(columns[1] * columns[2])
+        columns[5] = np.cumsum(columns[2])
+        return columns
+
+    def _live_column(self, attribute):
+        """
+        A helper method to get the values of a buffer for the trades that have not been removed.
+        :param attribute: the name of the buffer.
+        :type attribute: str
+        :return: a view of the buffer, or a copy without the removed trades if there are any.
+        :rtype: numpy.ndarray
+        """
+        column = getattr(self, attribute)[:self.size]
+        if self._tombstones:
+            return np.delete(column, self._tombstone_positions)
+        return column
+
+    @property
+    def time_stamps(self):
+        """The epoch timestamps of the stored trades."""
+        return self._live_column('_time_stamps')
+
+    @property
+    def traded_prices(self):
+        """The traded prices of the stored trades."""
+        return self._live_column('_traded_prices')
+
+    @property
+    def quantities(self):
+        """The quantities of the stored trades."""
+        return self._live_column('_quantities')
+
+    @property
+    def trade_types(self):
+        """The trade type codes of the stored trades."""
+        return self._live_column('_trade_types')
+
+    @property
+    def trade_ids(self):
+        """The IDs of the stored trades."""
+        return self._live_column('_trade_ids')
+
+    @property
+    def nbytes(self):
+        """The number of bytes allocated by the buffers of the store."""
+        return sum(getattr(self, attribute).nbytes for attribute in TradeStore._COLUMNS)
+
+    def _reserve(self, required_capacity):
+        """
+        A helper method to grow the buffers, so that they can hold at least the required number of trades.
+        :param required_capacity: the number of trades the buffers need to hold.
+        :type required_capacity: int
+        """
+        capacity = len(self._time_stamps)
+        if required_capacity <= capacity:
+            return
+        new_capacity = max(required_capacity, 2 * capacity, INITIAL_CAPACITY)
+        for attribute in TradeStore._COLUMNS:
+            old_buffer = getattr(self, attribute)
+            new_buffer = np.empty(new_capacity, dtype=old_buffer.dtype)
+            new_buffer[:self.size] = old_buffer[:self.size]
+            setattr(self, attribute, new_buffer)
+
+    def append(self, time_stamp, traded_price, quantity, trade_type, trade_id=0):
+        """
+        A method to store a new trade.
+        :param time_stamp: the epoch timestamp of the trade.
+        :type time_stamp: int
+        :param traded_price: the price of the stock for this trade.
+        :type traded_price: float
+        :param quantity: The number of stocks traded.
+        :type quantity: int
+        :param trade_type: the type of the trade, buy or sell.
+        :type trade_type: str
+        :param trade_id: the ID given to the trade.
+        :type trade_id: int
+        :return: the position the trade was stored at.
+        :rtype: int
+        """
+        self._reserve(self.size + 1)
+        if self.size == 0 or time_stamp >= self._time_stamps[self.size - 1]:
+            # The usual case: the trade is the most recent one, so it is added at the end.
+            position = self.size
+            if self.size and trade_id <= self._trade_ids[self.size - 1]:
+                self._ids_sorted = False
+            if self._positions_by_id is not None:
+                self._positions_by_id[trade_id] = position
+        else:
+            # Out of order trade: shifting the later trades right by one, to keep the timestamps sorted.
+            self.compact()
+            position = int(np.searchsorted(self.time_stamps, time_stamp, side='right'))
+            for attribute in TradeStore._TRADE_COLUMNS:
+                column = getattr(self, attribute)
+                column[position + 1:self.size + 1] = column[position:self.size]
+            self._ids_sorted = False
+            self._positions_by_id = None
+        self._time_stamps[position] = time_stamp
+        self._traded_prices[position] = traded_price
+        self._quantities[position] = quantity
+        self._trade_types[position] = TRADE_TYPE_CODES[trade_type]
+        self._trade_ids[position] = trade_id
+        self.size += 1
+        self._update_cumulative_sums(position)
+        return position
+
+    def extend(self, time_stamps, traded_prices, quantities, trade_type_codes, trade_ids=None):
+        """
+        A method to store many trades of the stock in one step.
+        :param time_stamps: the epoch timestamps of the trades.
+        :type time_stamps: numpy.ndarray
+        :param traded_prices: the prices of the stock for the trades.
+        :type traded_prices: numpy.ndarray
+        :param quantities: The number of stocks traded in each trade.
+        :type quantities: numpy.ndarray
+        :param trade_type_codes: the codes of the types of the trades (see TRADE_TYPE_CODES).
+        :type trade_type_codes: numpy.ndarray
+        :param trade_ids: the IDs given to the trades. By default they are all 0.
+        :type trade_ids: numpy.ndarray
+        """
+        added = len(time_stamps)
+        if not added:
+            return
+        if trade_ids is None:
+            trade_ids = np.zeros(added, dtype=np.int64)
+        # A stable sort, so that trades with the same timestamp keep their order.
+        order = np.argsort(time_stamps, kind='mergesort')
+        new_columns = [time_stamps[order], traded_prices[order], quantities[order], trade_type_codes[order],
+                       trade_ids[order]]
+        self._reserve(self.size + added)
+
+        if self.size == 0 or new_columns[0][0] >= self._time_stamps[self.size - 1]:
+            # The usual case: all the trades are more recent than the stored ones.
+            position = self.size
+            if np.any(new_columns[4][1:] <= new_columns[4][:-1]) or \
+                    (self.size and new_columns[4][0] <= self._trade_ids[self.size - 1]):
+                self._ids_sorted = False
+        else:
+            # Merging the out of order trades with the stored trades that happened after the earliest of them.
+            self.compact()
+            position = int(np.searchsorted(self.time_stamps, new_columns[0][0], side='right'))
+            order = np.argsort(np.concatenate((self._time_stamps[position:self.size], new_columns[0])),
+                               kind='mergesort')
+            new_columns = [np.concatenate((getattr(self, attribute)[position:self.size], new_column))[order]
+                           for attribute, new_column in zip(TradeStore._TRADE_COLUMNS, new_columns)]
+            self._ids_sorted = False
+
+        for attribute, new_column in zip(TradeStore._TRADE_COLUMNS, new_columns):
+            getattr(self, attribute)[position:self.size + added] = new_column
+        self.size += added
+        self._positions_by_id = None
+        self._update_cumulative_sums(position)
+
+    def _update_cumulative_sums(self, position):
+        """
+        A helper method to recalculate the running sums, from the given position until the last trade.
+        :param position: the position of the first trade whose running sums have changed.
+        :type position: int
+        """
+        notional_before, quantity_before = self._cumulative_sums_before(position)
+        if position == self.size - 1:
+            # Avoiding the numpy overhead when only the last trade changed.
+            self._cumulative_notional[position] = notional_before + \
+                self._traded_prices[position] * self._quantities[position]
+            self._cumulative_quantities[position] = quantity_before + self._quantities[position]
+        elif position < self.size:
+            np.cumsum(self._traded_prices[position:self.size] * self._quantities[position:self.size],
+                      out=self._cumulative_notional[position:self.size])
+            self._cumulative_notional[position:self.size] += notional_before
+            np.cumsum(self._quantities[position:self.size], out=self._cumulative_quantities[position:self.size])
+            self._cumulative_quantities[position:self.size] += quantity_before
+
+    def _cumulative_sums_before(self, position):
+        """
+        A helper method to get the running sums of all the trades before the given position.
+        :param position: the position of the trade.
+        :type position: int
+        :return: the sum of price * quantity and the sum of quantity of the trades before the position.
+        :rtype: tuple
+        """
+        if position == 0:
+            return 0.0, 0
+        return self._cumulative_notional[position - 1], self._cumulative_quantities[position - 1]
+
+    def find(self, time_stamp, traded_price, quantity, trade_type):
+        """
+        A method to find the position of the first stored trade with the given attributes.
+        :return: the position of the trade, or None if it was not found.
+        :rtype: int | None
+        """
+        # Only the trades with the same timestamp need to be compared.
+        start, end = self._positions_between(time_stamp, time_stamp)
+        matches = np.flatnonzero((self._traded_prices[start:end] == traded_price) &
+                                 (self._quantities[start:end] == quantity) &
+                                 (self._trade_types[start:end] == TRADE_TYPE_CODES[trade_type]))
+        for match in matches:
+            if start + int(match) not in self._tombstones:
+                return start + int(match)
+        return None
+
+    def find_by_time_stamp(self, time_stamp):
+        """
+        A method to find the position of the first stored trade that happened at the given time.
+        :param time_stamp: the epoch timestamp of the trade.
+        :type time_stamp: int
+        :return: the position of the trade, or None if it was not found.
+        :rtype: int | None
+        """
+        start, end = self._positions_between(time_stamp, time_stamp)
+        for position in range(start, end):
+            if position not in self._tombstones:
+                return position
+        return None
+
+    def find_by_id(self, trade_id):
+        """
+        A method to find the position of a stored trade from its ID.
+        :param trade_id: the ID of the trade.
+        :type trade_id: int
+        :return: the position of the trade, or None if it was not found.
+        :rtype: int | None
+        """
+        if self._ids_sorted:
+            position = int(np.searchsorted(self._trade_ids[:self.size], trade_id))
+            if position == self.size or self._trade_ids[position] != trade_id or position in self._tombstones:
+                return None
+            return position
+        if self._positions_by_id is None:
+            # Building the index again after trades were moved.
+            self._positions_by_id = dict((int(stored_id), position) for position, stored_id in
+                                         enumerate(self._trade_ids[:self.size]) if position not in self._tombstones)
+        return self._positions_by_id.get(trade_id)
+
+    def trade_at(self, position):
+        """
+        A method to get the values of the trade stored at a position, as returned by find().
+        :param position: the position of the trade.
+        :type position: int
+        :return: the timestamp, price, quantity, trade type code and ID of the trade.
+        :rtype: tuple
+        """
+        return (int(self._time_stamps[position]), float(self._traded_prices[position]),
+                int(self._quantities[position]), int(self._trade_types[position]), int(self._trade_ids[position]))
+
+    def _positions_between(self, starting_time, ending_time):
+        """
+        A helper method to find the positions in the buffers, including the removed trades, of the trades that
+        happened between two times (both inclusive).
+        """
+        time_stamps = self._time_stamps[:self.size]
+        return (int(np.searchsorted(time_stamps, starting_time, side='left')),
+                int(np.searchsorted(time_stamps, ending_time, side='right')))
+
+    def time_stamp_range(self, starting_time, ending_time):
+        """
+        A method to find the positions of the trades that happened between two times (both inclusive).
+        :param starting_time: the epoch timestamp of the start of the time frame.
+        :type starting_time: int
+        :param ending_time: the epoch timestamp of the end of the time frame.
+        :type ending_time: int
+        :return: the position of the first trade in the time frame and the position after the last one, in the
+                 columns of the trades (e.g. time_stamps).
+        :rtype: tuple
+        """
+        time_stamps = self.time_stamps
+        return (int(np.searchsorted(time_stamps, starting_time, side='left')),
+                int(np.searchsorted(time_stamps, ending_time, side='right')))
+
+    def trades_between(self, starting_time, ending_time, limit=None):
+        """
+        A method to get the trades that happened between two times (both inclusive), without going through the
+        other trades.
+        :param starting_time: the epoch timestamp of the start of the time frame.
+        :type starting_time: int
+        :param ending_time: the epoch timestamp of the end of the time frame.
+        :type ending_time: int
+        :param limit: an optional maximum number of trades to get, the earliest ones.
+        :type limit: int
+        :return: the timestamps, prices, quantities, trade type codes and IDs of the trades.
+        :rtype: list(numpy.ndarray)
+        """
+        start, end = self._positions_between(starting_time, ending_time)
+        return self._live_columns(start, end, limit)
+
+    def trades_after(self, time_stamp=None, trade_id=None, limit=1000):
+        """
+        A method to get the next trades, in the order they are stored, after a given trade, e.g. to page through the
+        trades. Trades with the same timestamp are stored in the order they were recorded, i.e. by ID, so the trade is
+        given by its timestamp and ID, and it does not need to be still stored.
+        :param time_stamp: the epoch timestamp of the trade to start after. By default: the first stored trade.
+        :type time_stamp: int
+        :param trade_id: the ID of the trade to start after.
+        :type trade_id: int
+        :param limit: the maximum number of trades to get.
+        :type limit: int
+        :return: the timestamps, prices, quantities, trade type codes and IDs of the trades.
+        :rtype: list(numpy.ndarray)
+        """
+        start = 0
+        if time_stamp is not None:
+            start, end = self._positions_between(time_stamp, time_stamp)
+            start += int(np.searchsorted(self._trade_ids[start:end], trade_id, side='right'))
+        return self._live_columns(start, self.size, limit)
+
+    def _live_columns(self, start, end, limit=None):
+        """
+        A helper method to get the columns of the trades stored between two positions, leaving out the removed
+        trades, up to an optional number of trades.
+        """
+        if limit is not None:
+            # Reading further than the limit, by the number of removed trades in the way.
+            stop, end = end, min(start + limit, end)
+            while end < stop:
+                removed_count = bisect.bisect_left(self._tombstone_positions, end) - \
+                    bisect.bisect_left(self._tombstone_positions, start)
+                missing = limit - (end - start - removed_count)
+                if missing <= 0:
+                    break
+                end = min(end + missing, stop)
+        removed = [position - start for position in self._tombstone_positions[
+            bisect.bisect_left(self._tombstone_positions, start):bisect.bisect_left(self._tombstone_positions, end)]]
+        return [np.delete(getattr(self, attribute)[start:end], removed) for attribute in TradeStore._TRADE_COLUMNS]
+
+    def remove_at(self, position):
+        """
+        A method to remove the trade stored at the given position. The trade is marked as removed, and the removed
+        trades are taken out of the buffers when there are enough of them (see compact()).
+        :param position: the position of the trade to remove.
+        :type position: int
+        """
+        if self._positions_by_id is not None:
+            self._positions_by_id.pop(int(self._trade_ids[position]), None)
+        if position == self.size - 1 and not self._tombstones:
+            # Removing the last trade does not move any other trade.
+            self.size -= 1
+            return
+        self._tombstones[position] = (self._traded_prices[position] * self._quantities[position],
+                                      self._quantities[position])
+        bisect.insort(self._tombstone_positions, position)
+        if len(self._tombstones) >= min(COMPACTION_THRESHOLD, max(self.size // 8, 1)):
+            self.compact()
+
+    def compact(self):
+        """
+        A method to take the removed trades out of the buffers, shifting the other trades left, in one step.
+        """
+        if not self._tombstones:
+            return
+        first_removed = self._tombstone_positions[0]
+        kept = np.ones(self.size - first_removed, dtype=np.bool_)
+        kept[np.array(self._tombstone_positions) - first_removed] = False
+        size = self.size - len(self._tombstones)
+        for attribute in TradeStore._TRADE_COLUMNS:
+            column = getattr(self, attribute)
+            column[first_removed:size] = column[first_removed:self.size][kept]
+        self.size = size
+        self._tombstone_positions = []
+        self._tombstones = {}
+        self._positions_by_id = None
+        if not self._ids_sorted:
+            # The out of order trades may have been removed.
+            self._ids_sorted = bool(np.all(self._trade_ids[1:size] > self._trade_ids[:size - 1]))
+        self._update_cumulative_sums(first_removed)
+
+    def drop_before(self, time_stamp):
+        """
+        A method to remove all the trades that happened before the given time, e.g. when they are too old to keep.
+        The buffers are shrunk when most of their space is no longer used, so that the memory is given back.
+        :param time_stamp: the epoch timestamp before which trades are removed.
+        :type time_stamp: int
+        :return: the timestamps, prices, quantities, trade type codes and IDs of the removed trades.
+        :rtype: list(numpy.ndarray)
+        """
+        self.compact()
+        dropped = int(np.searchsorted(self.time_stamps, time_stamp, side='left'))
+        dropped_columns = [getattr(self, attribute)[:dropped].copy() for attribute in TradeStore._TRADE_COLUMNS]
+        if not dropped:
+            return dropped_columns
+        notional_dropped, quantity_dropped = self._cumulative_sums_before(dropped)
+        size = self.size - dropped
+        capacity = len(self._time_stamps)
+        if 4 * size <= capacity and capacity > INITIAL_CAPACITY:
+            # Moving the remaining trades to smaller buffers, with room to double.
+            capacity = max(2 * size, INITIAL_CAPACITY)
+        for attribute in TradeStore._COLUMNS:
+            column = getattr(self, attribute)
+            if capacity < len(column):
+                new_column = np.empty(capacity, dtype=column.dtype)
+                new_column[:size] = column[dropped:self.size]
+                setattr(self, attribute, new_column)
+            else:
+                column[:size] = column[dropped:self.size]
+        # The running sums now start after the removed trades.
+        self._cumulative_notional[:size] -= notional_dropped
+        self._cumulative_quantities[:size] -= quantity_dropped
+        self.size = size
+        self._positions_by_id = None
+        return dropped_columns
+
+    def volume_weighted_price(self, starting_time, ending_time=None):
+        """
+        A method to calculate the volume weighted price of all trades that happened after the starting time.
+        :param starting_time: the epoch timestamp after which trades are taken into account.
+        :type starting_time: int
+        :param ending_time: an optional epoch timestamp, after which trades are not taken into account.
+        :type ending_time: int
+        :return: the volume weighted price or None, if no trades happened after the starting time.
+        :rtype: float | None
+        """
+        time_stamps = self._time_stamps[:self.size]
+        start = int(np.searchsorted(time_stamps, starting_time, side='right'))
+        if ending_time is None:
+            end = self.size
+        else:
+            end = int(np.searchsorted(time_stamps, ending_time, side='right'))
+        if start >= end:
+            return None
+        notional_before, quantity_before = self._cumulative_sums_before(start)
+        total_quantity = self._cumulative_quantities[end - 1] - quantity_before
+        notional = self._cumulative_notional[end - 1] - notional_before
+        # Taking out the removed trades that are still counted in the running sums.
+        for position in self._tombstone_positions[bisect.bisect_left(self._tombstone_positions, start):
+                                                  bisect.bisect_left(self._tombstone_positions, end)]:
+            notional -= self._tombstones[position][0]
+            total_quantity -= self._tombstones[position][1]
+        if not total_quantity:
+            return None
+        return np.round(np.divide(notional, float(total_quantity)), decimals=3)
@@ -0,0 +1,454 @@
+#!/usr/bin/python
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from snapshot import read_snapshot, read_snapshot_log_offset
+from stock import Stock
+from stock_exchange import StockExchange
+from trade_store import TRADE_TYPE_NAMES, from_epoch, to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logger = logging.getLogger(__name__)
+
+# The types of the records in the log.
+ADD_STOCK = 1
+REMOVE_STOCK = 2
+ADD_TRADE = 3
+ADD_TRADES = 4
+REMOVE_TRADE = 5
+EXPIRE_TRADES = 6
+UPDATE_PRICE = 7
+
+# The policies for when the log file is synced to disk:
+# 'always': every record is written and synced as soon as it is logged.
+# 'batch': records are written and synced in groups (group commit).
+# 'never': records are written in groups, but syncing to disk is left to the operating system.
+FSYNC_POLICIES = ('always', 'batch', 'never')
+
+# Every record starts with its type, the length of its payload and the CRC32 checksum of its payload.
+_HEADER = struct.Struct('<BII')
+_SYMBOL_LENGTH = struct.Struct('<H')
+_STOCK = struct.Struct('<Bdddqd')
+_TRADE = struct.Struct('<qdqB')
+_TRADES_COUNT = struct.Struct('<I')
+_TIME_STAMP = struct.Struct('<q')
+_TRADE_ID = struct.Struct('<q')
+_PRICE = struct.Struct('<qd')
+
+_STOCK_TYPE_CODES = {'common': 1, 'preferred': 2}
+_STOCK_TYPE_NAMES = dict((code, name) for name, code in _STOCK_TYPE_CODES.items())
+
+
+class WriteAheadLog(object):
+    """
+    A class to record every change to a stock exchange in an append only binary file, so that the stock exchange can
+    be rebuilt after a restart (see recover_stock_exchange()).
+    Records are written in groups (group commit): a group is written when it reaches group_commit_size records, or
+    at the latest group_commit_interval seconds after its first record, by a background thread.
+    Example usage: StockExchange('example', WriteAheadLog('exchange.wal'))
+    """
+
+    def __init__(self, path, fsync_policy='batch', group_commit_size=1000, group_commit_interval=0.05):
+        """
+        Constructor.
+        :param path: the path of the log file. New records are appended to it.
+        :type path: str
+        :param fsync_policy: when to sync the log file to disk: always | batch | never
+        :type fsync_policy: str
+        :param group_commit_size: the maximum number of records written together.
+        :type group_commit_size: int
+        :param group_commit_interval: the maximum time in seconds a record waits before it is written.
+        :type group_commit_interval: float
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError('fsync_policy must be one of: {}. You entered: {}'.format(FSYNC_POLICIES, fsync_policy))
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.group_commit_size = group_commit_size
+        self.group_commit_interval = group_commit_interval
+        self._file = open(path, 'ab')
+        self._pending_records = []
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._committer_thread = None
+        if fsync_policy != 'always':
+            self._committer_thread = threading.Thread(target=self._commit_periodically, name='WriteAheadLog')
+            self._committer_thread.daemon = True
+            self._committer_thread.start()
+
+    def log_add_stock(self, stock_to_add):
+        """
+        A method to record that a stock was added to the stock exchange.
+        :param stock_to_add: The stock that was added.
+        :type stock_to_add: Stock
+        """
+        fixed_dividend = stock_to_add.fixed_dividend if stock_to_add.fixed_dividend is not None else np.nan
+        if stock_to_add.current_price != '':
+            current_price = stock_to_add.current_price
+            current_price_timestamp = to_epoch(stock_to_add.current_price_timestamp) \
+                if stock_to_add.current_price_timestamp else -1
+        else:
+            current_price, current_price_timestamp = np.nan, -1
+        self._append(ADD_STOCK, _encode_symbol(stock_to_add.stock_symbol) + _STOCK.pack(
+            _STOCK_TYPE_CODES[stock_to_add.stock_type], stock_to_add.last_dividend, stock_to_add.par_value,
+            fixed_dividend, current_price_timestamp, current_price))
+
+    def log_remove_stock(self, stock_symbol):
+        """
+        A method to record that a stock was removed from the stock exchange.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        """
+        self._append(REMOVE_STOCK, _encode_symbol(stock_symbol))
+
+    def log_add_trade(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code, trade_id):
+        """
+        A method to record that a trade was added to the stock exchange.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp of the trade.
+        :type time_stamp: int
+        :param traded_price: the price of the stock for this trade.
+        :type traded_price: float
+        :param quantity: The number of stocks traded.
+        :type quantity: int
+        :param trade_type_code: the code of the type of the trade.
+        :type trade_type_code: int
+        :param trade_id: the ID given to the trade.
+        :type trade_id: int
+        """
+        self._append(ADD_TRADE, _encode_symbol(stock_symbol) + _TRADE.pack(time_stamp, traded_price, quantity,
+                                                                           trade_type_code) + _TRADE_ID.pack(trade_id))
+
+    def log_add_trades(self, stock_symbol, time_stamps, traded_prices, quantities, trade_type_codes, trade_ids):
+        """
+        A method to record, in a single record, that many trades of a stock were added to the stock exchange.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamps: the epoch timestamps of the trades.
+        :type time_stamps: numpy.ndarray
+        :param traded_prices: the prices of the stock for the trades.
+        :type traded_prices: numpy.ndarray
+        :param quantities: The number of stocks traded in each trade.
+        :type quantities: numpy.ndarray
+        :param trade_type_codes: the codes of the types of the trades.
+        :type trade_type_codes: numpy.ndarray
+        :param trade_ids: the IDs given to the trades.
+        :type trade_ids: numpy.ndarray
+        """
+        self._append(ADD_TRADES, b''.join((
+            _encode_symbol(stock_symbol), _TRADES_COUNT.pack(len(time_stamps)),
+            np.ascontiguousarray(time_stamps, dtype='<i8').tobytes(),
+            np.ascontiguousarray(traded_prices, dtype='<f8').tobytes(),
+            np.ascontiguousarray(quantities, dtype='<i8').tobytes(),
+            np.ascontiguousarray(trade_type_codes, dtype=np.uint8).tobytes(),
+            np.ascontiguousarray(trade_ids, dtype='<i8').tobytes())))
+
+    def log_remove_trade(self, stock_symbol, time_stamp, traded_price, quantity, trade_type_code, trade_id):
+        """
+        A method to record that a trade was removed from the stock exchange. The parameters are the same as in
+        log_add_trade(). The ID identifies the removed trade among identical trades.
+        """
+        self._append(REMOVE_TRADE, _encode_symbol(stock_symbol) + _TRADE.pack(time_stamp, traded_price, quantity,
+                                                                              trade_type_code) +
+                     _TRADE_ID.pack(trade_id))
+
+    def log_expire_trades(self, stock_symbol, time_stamp):
+        """
+        A method to record that the trades of a stock that happened before a time were removed from the stock
+        exchange, e.g. by a retention policy.
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp before which the trades were removed.
+        :type time_stamp: int
+        """
+        self._append(EXPIRE_TRADES, _encode_symbol(stock_symbol) + _TIME_STAMP.pack(time_stamp))
+
+    def log_update_price(self, stock_symbol, time_stamp, stock_price):
+        """
+        A method to record that the current price of a stock was set without a trade, e.g. by
+        StockExchange.dividend_yield_calculator().
+        :param stock_symbol: the symbol (abbreviated name) of the stock.
+        :type stock_symbol: str
+        :param time_stamp: the epoch timestamp the price was set at.
+        :type time_stamp: int
+        :param stock_price: the new price of the stock.
+        :type stock_price: float
+        """
+        self._append(UPDATE_PRICE, _encode_symbol(stock_symbol) + _PRICE.pack(time_stamp, stock_price))
+
+    def _append(self, record_type, payload):
+        """
+        A helper method to add a record to the current group, writing the group if needed.
+        :param record_type: the type of the record.
+        :type record_type: int
+        :param payload: the encoded contents of the record.
+        :type payload: bytes
+        """
+        record = _HEADER.pack(record_type, len(payload), zlib.crc32(payload) & 0xffffffff) + payload
+        with self._lock:
+            self._pending_records.append(record)
+            if self.fsync_policy == 'always' or len(self._pending_records) >= self.group_commit_size:
+                self._commit()
+
+    def _commit(self):
+        """
+        A helper method to write the records of the current group to the log file. The lock must be held.
+        """
+        if not self._pending_records:
+            return
+        self._file.write(b''.join(self._pending_records))
+        self._pending_records = []
+        self._file.flush()
+        if self.fsync_policy != 'never':
+            os.fsync(self._file.fileno())
+
+    def _commit_periodically(self):
+        """
+        A helper method, run by a background thread, that writes the current group every group_commit_interval
+        seconds, until the log is closed.
+        """
+        while not self._closed.wait(self.group_commit_interval):
+            with self._lock:
+                self._commit()
+
+    def flush(self):
+        """
+        A method to write all pending records to the log file now.
+        """
+        with self._lock:
+            self._commit()
+
+    def truncate(self):
+        """
+        A method to discard all records of the log, e.g. after saving a snapshot of the stock exchange.
+        """
+        with self._lock:
+            self._pending_records = []
+            self._file.truncate(0)
+            self._file.flush()
+            if self.fsync_policy != 'never':
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        """
+        A method to write all pending records and close the log file.
+        """
+        self._closed.set()
+        if self._committer_thread is not None:
+            self._committer_thread.join()
+        with self._lock:
+            if not self._file.closed:
+                self._commit()
+                self._file.close()
+
+
+def _encode_symbol(stock_symbol):
+    """
+    A helper method to encode a stock symbol as its length followed by its utf8 bytes.
+    :param stock_symbol: the symbol (abbreviated name) of the stock.
+    :type stock_symbol: str
+    :return: the encoded symbol.
+    :rtype: bytes
+    """
+    if not isinstance(stock_symbol, bytes):
+        stock_symbol = stock_symbol.encode('utf8')
+    return _SYMBOL_LENGTH.pack(len(stock_symbol)) + stock_symbol
+
+
+def _decode_symbol(payload):
+    """
+    A helper method to decode the stock symbol at the start of a payload.
+    :param payload: the payload of a record.
+    :type payload: bytes
+    :return: the symbol and the position in the payload right after it.
+    :rtype: tuple(str, int)
+    """
+    end = _SYMBOL_LENGTH.size + _SYMBOL_LENGTH.unpack_from(payload)[0]
+    return payload[_SYMBOL_LENGTH.size:end].decode('utf8'), end
+
+
+def _decode_record(record_type, payload):
+    """
+    A helper method to decode the payload of a record.
+    :param record_type: the type of the record.
+    :type record_type: int
+    :param payload: the payload of the record.
+    :type payload: bytes
+    :return: the record type, the stock symbol and the decoded fields of the record.
+    :rtype: tuple
+    """
+    stock_symbol, position = _decode_symbol(payload)
+    if record_type == ADD_STOCK:
+        values = _STOCK.unpack_from(payload, position)
+    elif record_type == ADD_TRADE:
+        values = _TRADE.unpack_from(payload, position) + _TRADE_ID.unpack_from(payload, position + _TRADE.size)
+    elif record_type == REMOVE_TRADE:
+        values = _TRADE.unpack_from(payload, position)
+        # Logs written before removed trades were logged with their ID have no ID.
+        if len(payload) >= position + _TRADE.size + _TRADE_ID.size:
+            values += _TRADE_ID.unpack_from(payload, position + _TRADE.size)
+    elif record_type == EXPIRE_TRADES:
+        values = _TIME_STAMP.unpack_from(payload, position)
+    elif record_type == UPDATE_PRICE:
+        values = _PRICE.unpack_from(payload, position)
+    elif record_type == ADD_TRADES:
+        count = _TRADES_COUNT.unpack_from(payload, position)[0]
+        position += _TRADES_COUNT.size
+        values = []
+        for dtype in ('<i8', '<f8', '<i8', np.uint8, '<i8'):
+            column = np.frombuffer(payload, dtype=dtype, count=count, offset=position)
+            position += column.nbytes
+            values.append(column.astype(column.dtype.newbyteorder('=')))
+    else:
+        values = ()
+    return record_type, stock_symbol, values
+
+
+def read_write_ahead_log(path, start_offset=0):
+    """
+    A method to read the records of a log file. Reading stops at the first incomplete or corrupted record, which is
+    what a crash in the middle of a write leaves behind.
+    :param path: the path of the log file.
+    :type path: str
+    :param start_offset: the position in the file of the first record to read.
+    :type start_offset: int
+    :return: a generator of (record_type, stock_symbol, values, end_offset) tuples, where values are the decoded
+             fields of the record and end_offset is the position in the file right after the record.
+    :rtype: generator
+    """
+    with open(path, 'rb') as log_file:
+        log_file.seek(start_offset)
+        offset = start_offset
+        while True:
+            # Reading one record at a time, so that the memory used does not grow with the length of the log.
+            header = log_file.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            record_type, length, checksum = _HEADER.unpack(header)
+            payload = log_file.read(length)
+            if len(payload) < length or zlib.crc32(payload) & 0xffffffff != checksum:
+                logger.warning('Ignoring incomplete or corrupted record at position %s of write ahead log: %s',
+                               offset, path)
+                return
+            offset += _HEADER.size + length
+            yield _decode_record(record_type, payload) + (offset,)
+
+
+def replay_write_ahead_log(path, stock_exchange, start_offset=0):
+    """
+    A method to apply the records of a log file to a stock exchange. Consecutive trades are applied in bulk.
+    :param path: the path of the log file.
+    :type path: str
+    :param stock_exchange: the stock exchange to apply the records to. It must not have a write ahead log attached.
+    :type stock_exchange: StockExchange
+    :param start_offset: the position in the file of the first record to apply.
+    :type start_offset: int
+    :return: the number of records applied and the position in the file right after the last valid record.
+    :rtype: tuple(int, int)
+    """
+    records_count = 0
+    valid_length = start_offset
+    # The trades waiting to be applied, per stock symbol, as chunks of columns. Single trades are collected in
+    # chunks of python lists, bulk trades are kept as the numpy columns they were read as.
+    pending_trades = {}
+
+    def apply_pending_trades():
+        for pending_symbol, chunks in pending_trades.items():
+            if stock_exchange.is_stock_registered(pending_symbol):
+                stock_exchange._record_trades(pending_symbol, *[
+                    np.concatenate([np.asarray(chunk[column], dtype=dtype) for chunk in chunks])
+                    for column, dtype in enumerate((np.int64, np.float64, np.int64, np.uint8, np.int64))])
+        pending_trades.clear()
+
+    for record_type, stock_symbol, values, valid_length in read_write_ahead_log(path, start_offset):
+        records_count += 1
+        if record_type == ADD_TRADE:
+            chunks = pending_trades.setdefault(stock_symbol, [])
+            if not chunks or not isinstance(chunks[-1][0], list):
+                chunks.append(([], [], [], [], []))
+            for column, value in zip(chunks[-1], values):
+                column.append(value)
+            continue
+        if record_type == ADD_TRADES:
+            pending_trades.setdefault(stock_symbol, []).append(values)
+            continue
+
+        apply_pending_trades()
+        if record_type == ADD_STOCK:
+            stock_type_code, last_dividend, par_value, fixed_dividend, current_price_timestamp, current_price = values
+            stock_exchange.add_new_stock(Stock.restore(
+                stock_symbol, _STOCK_TYPE_NAMES[stock_type_code], last_dividend, par_value,
+                None if np.isnan(fixed_dividend) else fixed_dividend,
+                '' if np.isnan(current_price) else current_price,
+                from_epoch(current_price_timestamp) if current_price_timestamp >= 0 else ''))
+        elif record_type == REMOVE_STOCK:
+            stock_exchange.remove_existing_stock_by_symbol(stock_symbol)
+        elif record_type == REMOVE_TRADE:
+            trade_store = stock_exchange.recorded_trades.get(stock_symbol)
+            if trade_store is not None:
+                if len(values) > 4:
+                    position = trade_store.find_by_id(values[4])
+                else:
+                    time_stamp, traded_price, quantity, trade_type_code = values
+                    position = trade_store.find(time_stamp, traded_price, quantity,
+                                                TRADE_TYPE_NAMES[trade_type_code])
+                if position is not None:
+                    stock_exchange._remove_stored_trade(trade_store, position)
+        elif record_type == EXPIRE_TRADES:
+            stock_exchange.expire_trades(stock_symbol, values[0])
+        elif record_type == UPDATE_PRICE:
+            if stock_exchange.is_stock_registered(stock_symbol):
+                time_stamp, stock_price = values
+                stock_exchange._set_stock_price(stock_exchange.registered_stocks[stock_symbol], stock_price,
+                                                from_epoch(time_stamp))
+    apply_pending_trades()
+    return records_count, valid_length
+
+
+def recover_stock_exchange(name, path, fsync_policy='batch', group_commit_size=1000, group_commit_interval=0.05,
+                           snapshot_path=None):
+    """
+    A method to rebuild a stock exchange from its write ahead log and keep logging its changes to the same file.
+    If a snapshot is given, the stock exchange is loaded from it and only the records logged after the snapshot
+    was saved are replayed (see snapshot.checkpoint()).
+    If the log file does not exist, a new empty stock exchange is created.
+    Example usage: stock_exchange = recover_stock_exchange('example', 'exchange.wal')
+    :param name: The name to give to the stock exchange.
+    :type name: str
+    :param path: the path of the log file.
+    :type path: str
+    :param snapshot_path: the path of a snapshot of the stock exchange, if one has been saved.
+    :type snapshot_path: str
+    :return: the recovered stock exchange.
+    :rtype: StockExchange
+    """
+    started = time.time()
+    start_offset = 0
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        stock_exchange = read_snapshot(snapshot_path)
+        stock_exchange.name = name
+        start_offset = read_snapshot_log_offset(snapshot_path)
+        # A log shorter than the recorded position has already been truncated by the checkpoint.
+        if not os.path.exists(path) or os.path.getsize(path) < start_offset:
+            start_offset = 0
+    else:
+        stock_exchange = StockExchange(name)
+    if os.path.exists(path):
+        records_count, valid_length = replay_write_ahead_log(path, stock_exchange, start_offset)
+        # Removing any incomplete record left at the end of the file by a crash.
+        if os.path.getsize(path) > valid_length:
+            with open(path, 'r+b') as log_file:
+                log_file.truncate(valid_length)
+        logger.info('Replayed %s records from write ahead log: %s in %.3f seconds.', records_count, path,
+                    time.time() - started)
+    stock_exchange.write_ahead_log = WriteAheadLog(path, fsync_policy, group_commit_size, group_commit_interval)
+    return stock_exchange
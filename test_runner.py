@@ -3,7 +3,11 @@
 import logging.config
 import unittest
 
-from tests import test_stock, test_trade_record, test_stock_exchange  # , test_rest_api
+from tests import test_stock, test_trade_record, test_stock_exchange, test_trade_store, \
+    test_time_stamp_parser, test_log_handlers, test_write_ahead_log, test_snapshot, \
+    test_async_server, test_concurrency, test_sharded_stock_exchange, \
+    test_rolling_vwap, test_bar_builder, test_retention, test_benchmarks, test_instrumentation, \
+    test_result_cache, test_serializers, test_price_broadcaster  # , test_rest_api
 
 __author__ = 'Nikitas Papangelopoulos'
 
@@ -18,6 +22,22 @@ suite = unittest.TestSuite()
 suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_stock))
 suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_trade_record))
 suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_stock_exchange))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_trade_store))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_time_stamp_parser))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_log_handlers))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_write_ahead_log))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_snapshot))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_async_server))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_concurrency))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_sharded_stock_exchange))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_rolling_vwap))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_bar_builder))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_retention))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_benchmarks))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_instrumentation))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_result_cache))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_serializers))
+suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_price_broadcaster))
 # suite.addTest(unittest.defaultTestLoader.loadTestsFromModule(test_rest_api))
 
 unittest.TextTestRunner().run(suite)
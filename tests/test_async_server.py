@@ -0,0 +1,127 @@
+#!/usr/bin/python
+
+import json
+import unittest
+import logging.config
+from io import BytesIO
+
+from werkzeug.test import Client, EnvironBuilder
+from werkzeug.wrappers import BaseResponse
+
+from api import rest_api
+from simple_stock_exchange import StockExchange
+
+try:
+    import gevent
+    from api.async_server import AsyncServer
+except ImportError:
+    AsyncServer = None
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+@unittest.skipIf(AsyncServer is None, 'gevent is not installed')
+class TestAsyncServer(unittest.TestCase):
+
+    def setUp(self):
+        # Using a separate stock exchange, so the requests do not change the results of the other tests.
+        self.shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_async_stock_exchange')
+        self.server = AsyncServer(rest_api.app, port=0)
+        self.client = Client(self.server.handle, BaseResponse)
+
+    def tearDown(self):
+        self.server.stop()
+        rest_api.stock_exchange = self.shared_stock_exchange
+
+    def post(self, path, payload, content_type='application/json'):
+        return self.client.post(path, data=payload if isinstance(payload, str) else json.dumps(payload),
+                                content_type=content_type)
+
+    def test_writes_and_reads(self):
+        response = self.post('/api/add_stock', {"stock_symbol": "POP", "stock_type": "common", "last_dividend": "8",
+                                                "par_value": "100"})
+        self.assertEqual(json.loads(response.get_data()), {'Added stock': 'POP'})
+        self.assertEqual(response.status_code, 200)
+
+        response0 = self.post('/api/add_trades', [
+            {"stock_symbol": "POP", "quantity": "300", "trade_type": "buy", "traded_price": "150"},
+            {"stock_symbol": "POP", "quantity": "100", "trade_type": "sell", "traded_price": "110"}])
+        self.assertEqual(json.loads(response0.get_data()), {'Added trades': 2, 'Rejected trades': []})
+
+        response1 = self.post('/api/calculate_volume_weighted_price', {"stock_symbol": "POP"})
+        self.assertEqual(json.loads(response1.get_data()), {'Volume Weighted Price': 140.0, 'minutes': 15})
+        self.assertEqual(response1.status_code, 200)
+
+        response2 = self.post('/api/stream_trades',
+                              '{"stock_symbol": "POP", "quantity": "1", "trade_type": "buy", "traded_price": "1"}\n',
+                              'application/x-ndjson')
+        self.assertEqual(json.loads(response2.get_data()),
+                         {'Received trades': 1, 'Added trades': 1, 'Rejected trades': [], 'Finished': True})
+
+        # Errors of write requests are returned as usual.
+        response3 = self.post('/api/remove_stock', {"stock_symbol": "TEA"})
+        self.assertEqual(json.loads(response3.get_data()), {'error': 'Please first add stock: TEA in stock exchange.'})
+        self.assertEqual(response3.status_code, 400)
+        self.assertEqual(len(rest_api.stock_exchange.recorded_trades['POP']), 3)
+
+    def test_bodies_read_before_writer(self):
+        readers = []
+
+        class RecordingInput(BytesIO):
+            def read(self, *args):
+                readers.append(gevent.getcurrent())
+                return BytesIO.read(self, *args)
+
+        self.post('/api/add_stock', {"stock_symbol": "POP", "stock_type": "common", "last_dividend": "8",
+                                     "par_value": "100"})
+        body = json.dumps([{"stock_symbol": "POP", "quantity": "1", "trade_type": "buy", "traded_price": "1"}] * 3)
+        environ = EnvironBuilder(path='/api/add_trades', method='POST', data=body,
+                                 content_type='application/json').get_environ()
+        environ['wsgi.input'] = RecordingInput(body)
+        environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        del environ['CONTENT_LENGTH']
+        statuses = []
+        chunks = list(self.server.handle(environ, lambda status, headers, exc_info=None: statuses.append(status)))
+        # The body is read by the greenlet of the connection, never by the writer.
+        self.assertTrue(readers)
+        self.assertNotIn(self.server._writer, readers)
+        self.assertEqual(statuses, ['200 OK'])
+        self.assertEqual(json.loads(''.join(chunks)), {'Added trades': 3, 'Rejected trades': []})
+
+    def test_streamed_upload(self):
+        readers = []
+
+        class RecordingInput(BytesIO):
+            def next(self):
+                readers.append(gevent.getcurrent())
+                return BytesIO.next(self)
+
+        self.post('/api/add_stock', {"stock_symbol": "POP", "stock_type": "common", "last_dividend": "8",
+                                     "par_value": "100"})
+        rest_api.STREAM_CHUNK_SIZE, stream_chunk_size = 2, rest_api.STREAM_CHUNK_SIZE
+        try:
+            body = '{"stock_symbol": "POP", "quantity": "1", "trade_type": "buy", "traded_price": "1"}\n' * 5
+            environ = EnvironBuilder(path='/api/stream_trades', method='POST', data=body,
+                                     content_type='application/x-ndjson').get_environ()
+            # As gevent gives chunked uploads: of unknown length, read until their last chunk.
+            environ['wsgi.input'] = RecordingInput(body)
+            environ['wsgi.input_terminated'] = True
+            del environ['CONTENT_LENGTH']
+            chunks = iter(self.server.handle(environ, lambda status, headers, exc_info=None: None))
+            self.assertEqual(json.loads(next(chunks))['Added trades'], 2)
+            # The upload is in progress, and the writer still applies other writes.
+            response = self.post('/api/add_trades', [
+                {"stock_symbol": "POP", "quantity": "300", "trade_type": "buy", "traded_price": "150"}])
+            self.assertEqual(json.loads(response.get_data()), {'Added trades': 1, 'Rejected trades': []})
+            progress = [json.loads(chunk) for chunk in chunks]
+        finally:
+            rest_api.STREAM_CHUNK_SIZE = stream_chunk_size
+        self.assertEqual([line['Added trades'] for line in progress], [4, 5])
+        self.assertTrue(progress[-1]['Finished'])
+        # The upload is read chunk by chunk by the greenlet of the connection, not by the writer.
+        self.assertTrue(readers)
+        self.assertNotIn(self.server._writer, readers)
+        self.assertEqual(len(rest_api.stock_exchange.recorded_trades['POP']), 6)
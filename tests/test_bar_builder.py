@@ -0,0 +1,100 @@
+#!/usr/bin/python
+
+import random
+import unittest
+import logging.config
+from datetime import datetime
+
+import numpy as np
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.bar_builder import BarBuilder
+from simple_stock_exchange.trade_store import from_epoch, to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestBarBuilder(unittest.TestCase):
+
+    def setUp(self):
+        self.start = to_epoch(datetime(2017, 2, 5, 12, 0, 0))
+        self.stock_exchange = StockExchange('test')
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+
+    def add_trade(self, stock_symbol, quantity, traded_price, seconds):
+        return TradeRecord(self.stock_exchange, stock_symbol, str(quantity), 'buy', str(traded_price),
+                           str(from_epoch(self.start + seconds)))
+
+    def test_bars(self):
+        bar_builder = BarBuilder(self.stock_exchange, intervals=(60, 3600))
+        self.add_trade('TEA', 100, 10, 5)
+        self.add_trade('TEA', 300, 20, 30)
+        self.add_trade('TEA', 100, 15, 50)
+        self.add_trade('TEA', 200, 12, 70)
+        # An out of order trade becomes the open of its bar.
+        self.add_trade('TEA', 100, 8, 1)
+        bars = bar_builder.bars('TEA', 60)
+        self.assertEqual(list(bars['time_stamp']), [self.start, self.start + 60])
+        self.assertEqual(list(bars['open']), [8.0, 12.0])
+        self.assertEqual(list(bars['high']), [20.0, 12.0])
+        self.assertEqual(list(bars['low']), [8.0, 12.0])
+        self.assertEqual(list(bars['close']), [15.0, 12.0])
+        self.assertEqual(list(bars['volume']), [600, 200])
+        self.assertEqual(list(bars['vwap']), [15.5, 12.0])
+        hour_bars = bar_builder.bars('TEA', 3600)
+        self.assertEqual(len(hour_bars), 1)
+        self.assertEqual((hour_bars['open'][0], hour_bars['close'][0], hour_bars['volume'][0]), (8.0, 12.0, 800))
+        # Querying a time range.
+        self.assertEqual(list(bar_builder.bars('TEA', 60, starting_time='2017-02-05 12:01:00')['close']), [12.0])
+        self.assertEqual(len(bar_builder.bars('TEA', 60, ending_time='2017-02-05 11:59:00')), 0)
+        self.assertEqual(len(bar_builder.bars('POP', 60)), 0)
+        self.assertRaises(ValueError, bar_builder.bars, 'TEA', 300)
+
+    def test_removed_trades(self):
+        bar_builder = BarBuilder(self.stock_exchange, intervals=(60,))
+        self.add_trade('TEA', 100, 10, 5)
+        highest_trade = self.add_trade('TEA', 300, 20, 30)
+        last_trade = self.add_trade('TEA', 100, 15, 70)
+        self.stock_exchange.remove_trade(highest_trade)
+        bars = bar_builder.bars('TEA', 60)
+        self.assertEqual((bars['high'][0], bars['volume'][0], bars['vwap'][0]), (10.0, 100, 10.0))
+        # Removing the only trade of a bar removes the bar.
+        self.stock_exchange.remove_trade(last_trade)
+        self.assertEqual(list(bar_builder.bars('TEA', 60)['time_stamp']), [self.start])
+
+    def test_removed_trades_after_expiry(self):
+        bar_builder = BarBuilder(self.stock_exchange, intervals=(60,))
+        self.add_trade('TEA', 100, 10, 5)
+        self.add_trade('TEA', 300, 20, 30)
+        last_trade = self.add_trade('TEA', 100, 15, 50)
+        # The first trade of the bar expires, but it stays in the bar.
+        self.stock_exchange.expire_trades('TEA', self.start + 20)
+        self.stock_exchange.remove_trade(last_trade)
+        bar = bar_builder.bars('TEA', 60)[0]
+        self.assertEqual((bar['open'], bar['high'], bar['low'], bar['close']), (10.0, 20.0, 10.0, 20.0))
+        self.assertEqual((bar['volume'], bar['vwap']), (400, 17.5))
+
+    def test_matches_trades(self):
+        random.seed(17)
+        # Trades recorded before the bar builder is created are aggregated too.
+        self.stock_exchange.add_trades_bulk(
+            stock_symbols=['POP'] * 1000, quantities=[random.randint(1, 500) for _ in range(1000)],
+            trade_types=['sell'] * 1000, traded_prices=[random.randint(1, 100) for _ in range(1000)],
+            time_stamps=[str(from_epoch(self.start + random.randint(0, 7200))) for _ in range(1000)])
+        bar_builder = BarBuilder(self.stock_exchange, intervals=(60, 300))
+        for _ in range(200):
+            self.add_trade('POP', random.randint(1, 500), random.randint(1, 100), random.randint(0, 7200))
+        trade_store = self.stock_exchange.recorded_trades['POP']
+        for interval in (60, 300):
+            bars = bar_builder.bars('POP', interval)
+            starts = trade_store.time_stamps - trade_store.time_stamps % interval
+            np.testing.assert_array_equal(bars['time_stamp'], np.unique(starts))
+            for bar in bars:
+                in_bar = starts == bar['time_stamp']
+                prices, quantities = trade_store.traded_prices[in_bar], trade_store.quantities[in_bar]
+                self.assertEqual((bar['high'], bar['low'], bar['volume']), (prices.max(), prices.min(),
+                                                                            quantities.sum()))
+                self.assertEqual(bar['vwap'], np.round((prices * quantities).sum() / float(quantities.sum()), 3))
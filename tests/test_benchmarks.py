@@ -0,0 +1,46 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+
+from benchmark_runner import compare_results, result_key, run_case
+from benchmarks.cases import CASES
+from benchmarks.trade_generator import TradeGenerator
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_trade_generator(self):
+        stock_exchange = TradeGenerator(20, seed=3).stock_exchange(500)
+        self.assertEqual(len(stock_exchange.registered_stocks), 20)
+        self.assertEqual(sum(len(trade_store) for trade_store in stock_exchange.recorded_trades.values()), 500)
+        # The same seed gives the same trades.
+        self.assertEqual(TradeGenerator(20, seed=3).trades(100)[:4], TradeGenerator(20, seed=3).trades(100)[:4])
+
+    def test_run_case(self):
+        for case_name in CASES:
+            result = run_case(case_name, 5, 100, 50)
+            self.assertEqual(result_key(result), '{}/5/100'.format(case_name))
+            self.assertEqual(result['operations'], 50)
+            self.assertGreater(result['throughput'], 0)
+            self.assertTrue(result['p50_us'] <= result['p90_us'] <= result['p99_us'] <= result['max_us'])
+            self.assertGreater(result['peak_memory_kb'], 0)
+
+    def test_compare_results(self):
+        baseline = {'add_new_trade/10/1000': {'throughput': 1000.0, 'p99_us': 100.0, 'peak_memory_kb': 30000}}
+        self.assertEqual(compare_results({'add_new_trade/10/1000': {'throughput': 900.0, 'p99_us': 110.0,
+                                                                    'peak_memory_kb': 31000},
+                                          'add_new_trade/10/100000': {'throughput': 1.0, 'p99_us': 1e6,
+                                                                      'peak_memory_kb': 1e6}}, baseline), [])
+        regressions = compare_results({'add_new_trade/10/1000': {'throughput': 500.0, 'p99_us': 200.0,
+                                                                 'peak_memory_kb': 30000}}, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertIn('throughput', regressions[0])
+        self.assertIn('p99_us', regressions[1])
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+
+import math
+import random
+import sys
+import threading
+import time
+import unittest
+import logging.config
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.concurrency import ReadWriteLock
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+STOCK_SYMBOLS = ['TEA', 'POP', 'ALE', 'GIN', 'JOE']
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    def test_readers_share_the_lock(self):
+        lock = ReadWriteLock()
+        readers_inside = threading.Semaphore(0)
+        release_readers = threading.Event()
+
+        def read():
+            with lock.read_locked():
+                readers_inside.release()
+                release_readers.wait()
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+        # All readers hold the lock at the same time.
+        for _ in readers:
+            self.assertTrue(readers_inside.acquire())
+        release_readers.set()
+        for reader in readers:
+            reader.join()
+
+    def test_writer_excludes_readers(self):
+        lock = ReadWriteLock()
+        events = []
+
+        def read():
+            with lock.read_locked():
+                events.append('read')
+
+        lock.acquire_write()
+        reader = threading.Thread(target=read)
+        reader.start()
+        time.sleep(0.05)
+        events.append('written')
+        lock.release_write()
+        reader.join()
+        self.assertEqual(events, ['written', 'read'])
+
+    def test_reentrant(self):
+        lock = ReadWriteLock()
+        with lock.write_locked():
+            with lock.write_locked():
+                with lock.read_locked():
+                    pass
+        with lock.read_locked():
+            with lock.read_locked():
+                self.assertRaises(RuntimeError, lock.acquire_write)
+        # The lock is free again.
+        with lock.write_locked():
+            pass
+
+
+class TestConcurrentStockExchange(unittest.TestCase):
+
+    def setUp(self):
+        # Switching threads as often as possible, to make races more likely.
+        self.check_interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+
+    def tearDown(self):
+        sys.setcheckinterval(self.check_interval)
+
+    def test_stress(self):
+        stock_exchange = StockExchange('test')
+        for stock_symbol in STOCK_SYMBOLS:
+            Stock(stock_symbol, 'common', '8', '100', current_stock_exchange=stock_exchange)
+        writers_count = 8
+        trades_per_writer = 200
+        start_time = datetime(2017, 2, 5, 10, 0, 0)
+        errors = []
+        writers_done = threading.Event()
+
+        def write(writer):
+            try:
+                for index in range(trades_per_writer):
+                    # A unique time stamp for every trade, so that it can be removed by it.
+                    time_stamp = str(start_time + timedelta(seconds=index * writers_count + writer))
+                    TradeRecord(stock_exchange, STOCK_SYMBOLS[index % len(STOCK_SYMBOLS)], '10', 'buy',
+                                str(random.randint(100, 200)), time_stamp)
+                    stock_exchange.add_trades_bulk([(random.choice(STOCK_SYMBOLS), '5', 'sell',
+                                                     str(random.randint(100, 200)))])
+                    if index % 2:
+                        self.assertTrue(stock_exchange.remove_trade_by_symbol_date(
+                            STOCK_SYMBOLS[index % len(STOCK_SYMBOLS)], time_stamp))
+            except Exception as error:
+                errors.append(error)
+
+        def change_stocks():
+            try:
+                while not writers_done.is_set():
+                    Stock('XYZ', 'preferred', '8', '100', '2%', stock_exchange)
+                    stock_exchange.remove_existing_stock_by_symbol('XYZ')
+            except Exception as error:
+                errors.append(error)
+
+        def read():
+            try:
+                while not writers_done.is_set():
+                    volume_weighted_price = stock_exchange.vw_stock_price_calculator(random.choice(STOCK_SYMBOLS))
+                    self.assertTrue(volume_weighted_price is None or 100 <= volume_weighted_price <= 200)
+                    all_share_index = stock_exchange.all_share_index_calculator()
+                    self.assertTrue(0 < all_share_index <= 200)
+                    stock_symbols, dividend_yields, p_e_ratios = stock_exchange.batch_calculator()
+                    self.assertEqual(len(stock_symbols), len(dividend_yields))
+            except Exception as error:
+                errors.append(error)
+
+        writers = [threading.Thread(target=write, args=(writer,)) for writer in range(writers_count)]
+        others = [threading.Thread(target=read) for _ in range(4)] + [threading.Thread(target=change_stocks)]
+        for thread in writers + others:
+            thread.start()
+        for writer in writers:
+            writer.join()
+        writers_done.set()
+        for thread in others:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        # Half of the single trades were removed, all the bulk trades were kept.
+        self.assertEqual(sum(len(trade_store) for trade_store in stock_exchange.recorded_trades.values()),
+                         writers_count * trades_per_writer * 3 // 2)
+        for trade_store in stock_exchange.recorded_trades.values():
+            self.assertTrue((np.diff(trade_store.time_stamps) >= 0).all())
+            self.assertTrue(np.allclose(trade_store.columns()[4],
+                                        np.cumsum(trade_store.traded_prices * trade_store.quantities)))
+            self.assertEqual(list(trade_store.columns()[5]), list(np.cumsum(trade_store.quantities)))
+        # The incrementally maintained index matches one calculated from scratch.
+        prices = [stock.current_price for stock in stock_exchange.registered_stocks.values()]
+        self.assertEqual(sorted(stock_exchange.registered_stocks), sorted(STOCK_SYMBOLS))
+        self.assertAlmostEqual(stock_exchange.all_share_index,
+                               math.exp(sum(math.log(price) for price in prices) / len(prices)), places=3)
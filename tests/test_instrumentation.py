@@ -0,0 +1,105 @@
+#!/usr/bin/python
+
+import threading
+import unittest
+import logging.config
+
+from simple_stock_exchange import Stock, StockExchange, TradeRecord, instrumentation
+from simple_stock_exchange.sharded_stock_exchange import ShardedStockExchange
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.original_add_new_trade = StockExchange.__dict__['add_new_trade']
+        self.stock_exchange = StockExchange('test')
+        instrumentation.reset()
+        instrumentation.enable()
+
+    def tearDown(self):
+        instrumentation.disable()
+        instrumentation.reset()
+
+    def add_trades(self, count):
+        for trade in range(count):
+            TradeRecord(self.stock_exchange, 'TEA', '100', 'buy', '10')
+
+    def test_counts_calls(self):
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        self.add_trades(3)
+        # A call that raises an error is counted as an error.
+        self.assertRaises(AttributeError, self.stock_exchange.add_new_stock, None)
+        # Static methods are still static methods.
+        self.assertTrue(StockExchange.is_stock_price_valid('10'))
+
+        metrics = instrumentation.snapshot()
+        self.assertEqual(metrics['Stock.__init__']['calls'], 1)
+        self.assertEqual(metrics['TradeRecord.__init__']['calls'], 3)
+        self.assertEqual(metrics['StockExchange.add_new_trade']['calls'], 3)
+        self.assertEqual(metrics['StockExchange.add_new_trade']['errors'], 0)
+        self.assertEqual(sum(metrics['StockExchange.add_new_trade']['buckets']), 3)
+        self.assertEqual(metrics['StockExchange.add_new_stock']['errors'], 1)
+        self.assertGreater(metrics['StockExchange.add_new_trade']['seconds'], 0)
+        self.assertGreater(metrics['StockExchange.add_new_trade']['p99'], 0)
+        self.assertIn('StockExchange.is_stock_price_valid', metrics)
+
+    def test_merges_threads(self):
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        threads = [threading.Thread(target=self.add_trades, args=(25,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(instrumentation.snapshot()['StockExchange.add_new_trade']['calls'], 100)
+        self.assertEqual(len(self.stock_exchange.recorded_trades['TEA']), 100)
+
+    def test_finished_threads(self):
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        # A thread per call, like the threaded flask server starts per request.
+        for repeat in range(50):
+            thread = threading.Thread(target=self.add_trades, args=(1,))
+            thread.start()
+            thread.join()
+        self.assertEqual(instrumentation.snapshot()['StockExchange.add_new_trade']['calls'], 50)
+        # Only the counters of live threads are kept apart.
+        self.assertLessEqual(len(instrumentation._thread_counters), 2)
+        instrumentation.reset()
+        self.assertEqual(instrumentation.snapshot(), {})
+
+    def test_sharded_stock_exchange(self):
+        sharded_stock_exchange = ShardedStockExchange('test', 2)
+        try:
+            Stock('TEA', 'common', '0', '100', current_stock_exchange=sharded_stock_exchange)
+            TradeRecord(sharded_stock_exchange, 'TEA', '100', 'buy', '10')
+            metrics = instrumentation.snapshot()
+            self.assertEqual(metrics['ShardedStockExchange.add_new_stock']['calls'], 1)
+            self.assertEqual(metrics['ShardedStockExchange.add_new_trade']['calls'], 1)
+        finally:
+            sharded_stock_exchange.close()
+
+    def test_disable(self):
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        instrumentation.disable()
+        self.assertFalse(instrumentation.is_enabled())
+        # The original methods are back in place, so nothing is counted.
+        self.assertIs(StockExchange.__dict__['add_new_trade'], self.original_add_new_trade)
+        self.add_trades(2)
+        self.assertNotIn('TradeRecord.__init__', instrumentation.snapshot())
+        self.assertEqual(instrumentation.snapshot()['Stock.__init__']['calls'], 1)
+        instrumentation.reset()
+        self.assertEqual(instrumentation.snapshot(), {})
+
+    def test_render_text(self):
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        lines = instrumentation.render_text().splitlines()
+        self.assertIn('simple_stock_exchange_calls_total{name="Stock.__init__"} 1', lines)
+        self.assertIn('simple_stock_exchange_latency_seconds_bucket{name="Stock.__init__",le="+Inf"} 1', lines)
+        self.assertIn('simple_stock_exchange_latency_seconds_count{name="Stock.__init__"} 1', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from simple_stock_exchange.log_handlers import QueueFileHandler
+
+__author__ = 'Nikitas Papangelopoulos'
+
+
+class TestQueueFileHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.directory, 'test.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records_written_on_close(self):
+        handler = QueueFileHandler(self.log_file)
+        handler.setFormatter(logging.Formatter('%(levelname)s : %(message)s'))
+        test_logger = logging.getLogger('test_queue_file_handler')
+        test_logger.propagate = False
+        test_logger.addHandler(handler)
+        for index in range(100):
+            test_logger.warning('Message %s', index)
+        test_logger.removeHandler(handler)
+        handler.close()
+        with open(self.log_file) as log_file:
+            lines = log_file.read().splitlines()
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(lines[42], 'WARNING : Message 42')
+
+    def test_records_prepared_before_queued(self):
+        handler = QueueFileHandler(self.log_file)
+        handler.setFormatter(logging.Formatter('%(levelname)s : %(message)s'))
+        test_logger = logging.getLogger('test_queue_file_handler_prepare')
+        test_logger.propagate = False
+        test_logger.addHandler(handler)
+        prices = {'POP': 100}
+        test_logger.warning('Prices %s', prices)
+        prices['POP'] = 200
+        try:
+            raise ValueError('test')
+        except ValueError:
+            test_logger.exception('Failed')
+        test_logger.removeHandler(handler)
+        handler.close()
+        with open(self.log_file) as log_file:
+            lines = log_file.read().splitlines()
+        self.assertEqual(lines[0], "WARNING : Prices {'POP': 100}")
+        self.assertEqual(lines[1], 'ERROR : Failed')
+        self.assertEqual(lines[-1], 'ValueError: test')
+
+    def test_full_queue_drops_records(self):
+        handler = QueueFileHandler(self.log_file, max_queued_records=1)
+        # Stopping the background thread, so that the queue is never emptied.
+        handler._queue.put(None)
+        handler._writer_thread.join()
+        for index in range(3):
+            handler.emit(logging.LogRecord('test', logging.INFO, __file__, 0, 'Message', None, None))
+        self.assertEqual(handler.dropped_records, 2)
+        handler.close()
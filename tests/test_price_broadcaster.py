@@ -0,0 +1,142 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+from datetime import timedelta
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.price_broadcaster import PriceBroadcaster, Subscription, PRICE_EVENT, VWAP_EVENT
+from simple_stock_exchange.rolling_vwap import RollingVWAP
+from simple_stock_exchange.time_stamp_parser import current_time_stamp, TIME_STAMP_FORMAT
+from simple_stock_exchange.trade_store import to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestPriceBroadcaster(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        # The trades happen in the last minute, so they are in every window of the volume weighted prices.
+        self.start = current_time_stamp() - timedelta(seconds=30)
+        self.stock_exchange = StockExchange('test')
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+        self.price_broadcaster = PriceBroadcaster(self.stock_exchange, max_rate=2, clock=lambda: self.now)
+
+    def add_trade(self, stock_symbol, quantity, traded_price, seconds=0):
+        return TradeRecord(self.stock_exchange, stock_symbol, str(quantity), 'buy', str(traded_price),
+                           str(self.start + timedelta(seconds=seconds)))
+
+    def test_publishes_prices_and_vwap(self):
+        subscription = self.price_broadcaster.subscribe(['TEA'])
+        self.assertEqual(subscription.pop_updates(), [])
+        self.add_trade('TEA', 100, 10)
+        self.add_trade('POP', 100, 50)
+        updates = dict(((event, stock_symbol), data) for event, stock_symbol, data in subscription.pop_updates())
+        self.assertEqual(sorted(updates), [(PRICE_EVENT, 'TEA'), (VWAP_EVENT, 'TEA')])
+        self.assertEqual(updates[(PRICE_EVENT, 'TEA')]['current_price'], 10.0)
+        self.assertEqual(updates[(VWAP_EVENT, 'TEA')]['volume_weighted_prices'],
+                         {'1': 10.0, '5': 10.0, '15': 10.0, '60': 10.0})
+
+        # Removing a trade changes the volume weighted prices, but not the current price.
+        self.now += 1
+        self.add_trade('TEA', 300, 20, 1)
+        self.now += 1
+        trade_to_remove = self.add_trade('TEA', 100, 40, 2)
+        self.assertEqual([data['current_price'] for event, stock_symbol, data in subscription.pop_updates()
+                          if event == PRICE_EVENT], [40.0])
+        self.now += 1
+        self.stock_exchange.remove_trade(trade_to_remove)
+        self.assertEqual([(event, data['volume_weighted_prices']['5'])
+                          for event, stock_symbol, data in subscription.pop_updates()], [(VWAP_EVENT, 17.5)])
+
+    def test_coalesces_and_limits_rate(self):
+        subscription = self.price_broadcaster.subscribe(['TEA'])
+        for price in range(10, 20):
+            self.add_trade('TEA', 100, price, price - 10)
+        # Only the latest update of each kind is pending.
+        price_updates = [data for event, stock_symbol, data in subscription.pop_updates() if event == PRICE_EVENT]
+        self.assertEqual([data['current_price'] for data in price_updates], [19.0])
+        self.assertGreater(subscription.coalesced, 0)
+        self.assertIsNone(subscription.next_due())
+
+        # Updates are held back for 1 / max_rate seconds after the previous one.
+        self.stock_exchange.dividend_yield_calculator('TEA', '30')
+        self.assertEqual(subscription.pop_updates(), [])
+        self.assertEqual(subscription.next_due(), 0.5)
+        self.now += 0.5
+        self.assertEqual([(event, data['current_price']) for event, stock_symbol, data in subscription.pop_updates()],
+                         [(PRICE_EVENT, 30.0)])
+
+    def test_refresh(self):
+        # The volume weighted prices age on their own clock, in epoch seconds.
+        self.epoch = to_epoch(self.start) + 30
+        rolling_vwap = RollingVWAP(clock=lambda: self.epoch)
+        self.stock_exchange.add_trade_listener(rolling_vwap)
+        price_broadcaster = PriceBroadcaster(self.stock_exchange, rolling_vwap, max_rate=2, clock=lambda: self.now)
+        self.add_trade('TEA', 100, 10)
+        subscription = price_broadcaster.subscribe(['TEA'])
+        subscription.pop_updates()
+        # Nothing changed, so nothing is published.
+        self.now += 1
+        self.assertEqual(price_broadcaster.refresh(), [])
+        # The trade ages out of the 1 minute window, without any new trade.
+        self.epoch += 60
+        self.assertEqual(price_broadcaster.refresh(), [])
+        self.now += 1
+        self.assertEqual(price_broadcaster.refresh(), ['TEA'])
+        self.assertEqual([(event, data['volume_weighted_prices']['1'], data['volume_weighted_prices']['5'])
+                          for event, stock_symbol, data in subscription.pop_updates()], [(VWAP_EVENT, None, 10.0)])
+        self.now += 1
+        self.assertEqual(price_broadcaster.refresh(), [])
+
+    def test_subscribe(self):
+        self.add_trade('TEA', 100, 10)
+        # The current values are pending right away, and the rate can only be lowered.
+        subscription = self.price_broadcaster.subscribe(['TEA', 'POP', 'GIN'], max_rate=10)
+        self.assertEqual(subscription.interval, 0.5)
+        updates = subscription.pop_updates()
+        self.assertEqual(sorted((event, stock_symbol) for event, stock_symbol, data in updates),
+                         [(PRICE_EVENT, 'TEA'), (VWAP_EVENT, 'TEA')])
+        self.assertEqual(self.price_broadcaster.subscriptions, {'TEA': 1, 'POP': 1, 'GIN': 1})
+        self.assertRaises(ValueError, self.price_broadcaster.subscribe, ['TEA'], 0)
+
+        self.price_broadcaster.unsubscribe(subscription)
+        self.assertEqual(self.price_broadcaster.subscriptions, {})
+        self.add_trade('TEA', 100, 20)
+        self.assertEqual(subscription.pop_updates(), [])
+
+    def test_existing_trades(self):
+        self.add_trade('POP', 100, 10)
+        price_broadcaster = PriceBroadcaster(self.stock_exchange)
+        subscription = price_broadcaster.subscribe(['POP'])
+        updates = dict((event, data) for event, stock_symbol, data in subscription.pop_updates())
+        self.assertEqual(updates[VWAP_EVENT]['volume_weighted_prices']['1'], 10.0)
+        self.assertEqual(updates[PRICE_EVENT]['time_stamp'],
+                         self.stock_exchange.registered_stocks['POP'].current_price_timestamp.strftime(
+                             TIME_STAMP_FORMAT))
+
+    def test_close(self):
+        subscription = self.price_broadcaster.subscribe(['TEA'])
+        self.price_broadcaster.close()
+        # The broadcaster and the rolling volume weighted prices it created no longer follow the stock exchange.
+        self.assertEqual(self.stock_exchange.trade_listeners, [])
+        self.add_trade('TEA', 100, 10)
+        self.assertEqual(subscription.pop_updates(), [])
+
+    def test_subscription(self):
+        self.assertRaises(ValueError, Subscription, ['TEA'], -1)
+        subscription = Subscription(['TEA'], 1, clock=lambda: self.now)
+        subscription.publish(PRICE_EVENT, 'TEA', {'current_price': 1.0})
+        subscription.publish(PRICE_EVENT, 'TEA', {'current_price': 2.0})
+        self.assertEqual((subscription.published, subscription.coalesced), (2, 1))
+        self.assertEqual(subscription.next_due(), 0.0)
+        self.assertEqual(subscription.pop_updates(), [(PRICE_EVENT, 'TEA', {'current_price': 2.0})])
+        self.assertIsNone(subscription.next_due())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@ import unittest
 import logging.config
 import json
 from api import rest_api
+from simple_stock_exchange import Stock, StockExchange, TradeRecord, instrumentation
 
 __author__ = 'Nikitas Papangelopoulos'
 
@@ -29,8 +30,8 @@ class TestRestApi(unittest.TestCase):
         self.assertEqual(json.loads(response0.get_data()), {
             "all_share_index": "",
             "name": "test_stock_exchange",
-            "recorded_trades": {},
-            "registered_stocks": {}
+            "stocks": 0,
+            "trades": 0
         })
         self.assertEqual(response0.status_code, 200)
 
@@ -280,6 +281,239 @@ class TestRestApi(unittest.TestCase):
         self.assertEqual(json.loads(response3.get_data()), {"error": "Fifth parameter must be \"time_stamp\"."})
         self.assertEqual(response3.status_code, 400)
 
+    def test_add_trades(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_bulk_stock_exchange')
+        try:
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=rest_api.stock_exchange)
+            trades = [
+                {"quantity": "300", "trade_type": "buy", "stock_symbol": "ALE", "traded_price": "150"},
+                {"quantity": "100", "trade_type": "sell", "stock_symbol": "ALE", "traded_price": "120",
+                 "time_stamp": "2017-02-04 23:30:39"},
+                {"quantity": "100", "trade_type": "sell", "stock_symbol": "POP", "traded_price": "120"},
+                {"quantity": "100", "trade_type": "sell", "stock_symbol": "ALE"},
+                {"quantity": "100", "trade_type": "sell", "stock_symbol": "ALE", "traded_price": "1", "test": "2"},
+                {"quantity": "-5", "trade_type": "buy", "stock_symbol": "ALE", "traded_price": "150"},
+                "not a trade"
+            ]
+            response = self.app.post('http://localhost:5000/api/add_trades', data=json.dumps(trades),
+                                     content_type='application/json')
+            self.assertEqual(json.loads(response.get_data()), {'Added trades': 2, 'Rejected trades': [2, 3, 4, 5, 6]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(rest_api.stock_exchange.recorded_trades['ALE']), 2)
+
+            response0 = self.app.post('http://localhost:5000/api/add_trades',
+                                      data='\n'.join(json.dumps(trade) for trade in trades[:3]) + '\n\n{"broken',
+                                      content_type='application/x-ndjson')
+            self.assertEqual(json.loads(response0.get_data()), {'Added trades': 2, 'Rejected trades': [2, 3]})
+            self.assertEqual(response0.status_code, 200)
+            self.assertEqual(len(rest_api.stock_exchange.recorded_trades['ALE']), 4)
+
+            response1 = self.app.post('http://localhost:5000/api/add_trades', data=json.dumps(trades[0]),
+                                      content_type='application/json')
+            self.assertEqual(json.loads(response1.get_data()),
+                             {"error": "The request must be a json array of trades."})
+            self.assertEqual(response1.status_code, 400)
+
+            response2 = self.app.post('http://localhost:5000/api/add_trades')
+            self.assertEqual(response2.status_code, 400)
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+
+    def test_stream_trades(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        shared_chunk_size = rest_api.STREAM_CHUNK_SIZE
+        rest_api.stock_exchange = StockExchange('test_stream_stock_exchange')
+        rest_api.STREAM_CHUNK_SIZE = 2
+        try:
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=rest_api.stock_exchange)
+            lines = [
+                '{"quantity": "300", "trade_type": "buy", "stock_symbol": "ALE", "traded_price": "150", '
+                '"time_stamp": "2017-02-04 23:30:39"}',
+                '{"quantity": "100", "trade_type": "sell", "stock_symbol": "POP", "traded_price": "120"}',
+                '{"broken',
+                # An older trade does not change the price of the stock.
+                '{"quantity": "100", "trade_type": "sell", "stock_symbol": "ALE", "traded_price": "120", '
+                '"time_stamp": "2017-02-04 22:30:39"}',
+                '{"quantity": "100", "trade_type": "buy", "stock_symbol": "ALE", "traded_price": "140", '
+                '"time_stamp": "2017-02-04 23:30:39"}'
+            ]
+            response = self.app.post('http://localhost:5000/api/stream_trades', data='\n'.join(lines),
+                                     content_type='application/x-ndjson')
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertEqual([json.loads(line) for line in response.get_data().splitlines()], [
+                {'Received trades': 2, 'Added trades': 1, 'Rejected trades': [1]},
+                {'Received trades': 4, 'Added trades': 2, 'Rejected trades': [2]},
+                {'Received trades': 5, 'Added trades': 3, 'Rejected trades': [], 'Finished': True}
+            ])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(rest_api.stock_exchange.recorded_trades['ALE']), 3)
+            self.assertEqual(rest_api.stock_exchange.registered_stocks['ALE'].current_price, 150.0)
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+            rest_api.STREAM_CHUNK_SIZE = shared_chunk_size
+
+    def test_metrics(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_metrics_stock_exchange')
+        instrumentation.reset()
+        instrumentation.enable()
+        try:
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=rest_api.stock_exchange)
+            self.app.post('http://localhost:5000/api/add_trade',
+                          data=json.dumps({'stock_symbol': 'ALE', 'quantity': '100', 'trade_type': 'buy',
+                                           'traded_price': '150'}),
+                          content_type='application/json')
+            response = self.app.get('http://localhost:5000/api/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.mimetype, 'text/plain')
+            lines = response.get_data().splitlines()
+            self.assertIn('simple_stock_exchange_calls_total{name="route.add_trade"} 1', lines)
+            # The trade adds itself to the stock exchange, and is then added again by the route.
+            self.assertIn('simple_stock_exchange_calls_total{name="StockExchange.add_new_trade"} 2', lines)
+            self.assertIn('simple_stock_exchange_calls_total{name="TradeRecord.__init__"} 1', lines)
+        finally:
+            instrumentation.disable()
+            instrumentation.reset()
+            rest_api.stock_exchange = shared_stock_exchange
+
+    def test_cache_statistics(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_cache_stock_exchange')
+        try:
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=rest_api.stock_exchange)
+            for repeat in range(2):
+                self.app.post('http://localhost:5000/api/calculate_p_e_ratio',
+                              data=json.dumps({'stock_symbol': 'ALE', 'stock_price': '150'}),
+                              content_type='application/json')
+            response = self.app.get('http://localhost:5000/api/cache_statistics')
+            self.assertEqual(response.status_code, 200)
+            statistics = json.loads(response.get_data())
+            self.assertEqual((statistics['hits'], statistics['misses'], statistics['size']), (1, 1, 1))
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+
+    def test_list_stocks_and_trades(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_list_stock_exchange')
+        try:
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=rest_api.stock_exchange)
+            Stock('POP', 'common', '8', '100', current_stock_exchange=rest_api.stock_exchange)
+            for second in range(3):
+                TradeRecord(rest_api.stock_exchange, 'POP', '100', 'buy', '120',
+                            '2017-02-04 23:30:0{}'.format(second))
+
+            response = self.app.get('http://localhost:5000/api/stocks?limit=1')
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.get_data())
+            self.assertEqual(([stock['stock_symbol'] for stock in page['stocks']], page['next_cursor']),
+                             (['ALE'], 'ALE'))
+
+            response = self.app.get('http://localhost:5000/api/trades?stock_symbol=POP&limit=2')
+            page = json.loads(response.get_data())
+            self.assertEqual([trade['time_stamp'] for trade in page['trades']],
+                             ['2017-02-04 23:30:00', '2017-02-04 23:30:01'])
+            response = self.app.get('http://localhost:5000/api/trades?stock_symbol=POP&limit=2&cursor=' +
+                                    page['next_cursor'])
+            page = json.loads(response.get_data())
+            self.assertEqual(([trade['time_stamp'] for trade in page['trades']], page['next_cursor']),
+                             (['2017-02-04 23:30:02'], None))
+            response = self.app.get('http://localhost:5000/api/trades?stock_symbol=POP&cursor=broken')
+            self.assertEqual(response.status_code, 400)
+
+            response = self.app.get('http://localhost:5000/api/export_trades')
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertEqual(len(response.get_data().splitlines()), 3)
+            response = self.app.get('http://localhost:5000/api/export_stocks')
+            self.assertEqual(len(response.get_data().splitlines()), 2)
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+
+    def test_query_trades(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_query_stock_exchange')
+        try:
+            Stock('POP', 'common', '8', '100', current_stock_exchange=rest_api.stock_exchange)
+            for second, trade_type in enumerate(['buy', 'sell', 'buy']):
+                TradeRecord(rest_api.stock_exchange, 'POP', '100', trade_type, '120',
+                            '2017-02-04 23:30:0{}'.format(second))
+            query = {'stock_symbols': ['POP'], 'starting_time': '2017-02-04 23:30:01', 'trade_type': 'buy'}
+            response = self.app.post('http://localhost:5000/api/query_trades', data=json.dumps(query),
+                                     content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(json.loads(response.get_data()), {'trades': [
+                {'trade_id': 2, 'stock_symbol': 'POP', 'time_stamp': '2017-02-04 23:30:02', 'quantity': 100,
+                 'trade_type': 'buy', 'traded_price': 120.0}]})
+
+            response = self.app.post('http://localhost:5000/api/query_trades',
+                                     data=json.dumps({'stock_symbol': 'POP', 'stream': True}),
+                                     content_type='application/json')
+            self.assertEqual(response.mimetype, 'application/x-ndjson')
+            self.assertEqual([json.loads(line)['trade_id'] for line in response.get_data().splitlines()], [0, 1, 2])
+
+            response = self.app.post('http://localhost:5000/api/query_trades',
+                                     data=json.dumps({'stock_symbol': 'POP', 'trade_type': 'hold', 'stream': True}),
+                                     content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+            for params in ({'offset': -1}, {'limit': -1}, {'limit': 'all'}):
+                params['stock_symbol'] = 'POP'
+                response = self.app.post('http://localhost:5000/api/query_trades', data=json.dumps(params),
+                                         content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+            response = self.app.post('http://localhost:5000/api/query_trades',
+                                     data=json.dumps({'stock_symbol': 'POP', 'offset': '1', 'limit': '1'}),
+                                     content_type='application/json')
+            self.assertEqual([trade['trade_id'] for trade in json.loads(response.get_data())['trades']], [1])
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+
+    def test_subscribe(self):
+        # Using a separate stock exchange, so the trades do not change the results of the other tests.
+        shared_stock_exchange = rest_api.stock_exchange
+        rest_api.stock_exchange = StockExchange('test_subscribe_stock_exchange')
+        try:
+            Stock('POP', 'common', '8', '100', current_stock_exchange=rest_api.stock_exchange)
+            TradeRecord(rest_api.stock_exchange, 'POP', '100', 'buy', '120')
+
+            response = self.app.get('http://localhost:5000/api/subscribe?stock_symbol=POP', buffered=False)
+            try:
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, 'text/event-stream')
+                # The stream starts with a comment, followed by the current values.
+                chunks = iter(response.response)
+                self.assertEqual(next(chunks), ': subscribed\n\n')
+                events = next(chunks).split('\n\n')
+                self.assertIn('event: price', events[0])
+                self.assertEqual(json.loads(events[0].split('data: ')[1])['current_price'], 120.0)
+                self.assertIn('event: vwap', events[1])
+                self.assertEqual(rest_api.price_broadcaster.subscriptions, {'POP': 1})
+            finally:
+                response.close()
+            # Closing the stream ends the subscription.
+            self.assertEqual(rest_api.price_broadcaster.subscriptions, {})
+            subscribed_stock_exchange = rest_api.stock_exchange
+
+            # Replacing the stock exchange replaces the broadcaster, which stops following the old stock exchange.
+            rest_api.stock_exchange = StockExchange('test_subscribe_stock_exchange')
+            Stock('POP', 'common', '8', '100', current_stock_exchange=rest_api.stock_exchange)
+            self.app.get('http://localhost:5000/api/subscribe?stock_symbol=POP', buffered=False).close()
+            self.assertIs(rest_api.price_broadcaster.stock_exchange, rest_api.stock_exchange)
+            self.assertEqual(subscribed_stock_exchange.trade_listeners, [])
+
+            response = self.app.get('http://localhost:5000/api/subscribe')
+            self.assertEqual(response.status_code, 400)
+            response = self.app.get('http://localhost:5000/api/subscribe?stock_symbol=POP&max_rate=0')
+            self.assertEqual(response.status_code, 400)
+        finally:
+            rest_api.stock_exchange = shared_stock_exchange
+
     def test_remove_trade(self):
         self.app.post('http://localhost:5000/api/create_stock_exchange',
                       data=json.dumps({'name': 'test_stock_exchange'}),
@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+
+from simple_stock_exchange.result_cache import ResultCache, MISSING
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_get_put(self):
+        result_cache = ResultCache(10)
+        self.assertIs(result_cache.get('vw_price', 'TEA', (15,)), MISSING)
+        result_cache.put('vw_price', 'TEA', (15,), 138.0)
+        result_cache.put('vw_price', 'TEA', (30,), None)
+        self.assertEqual(result_cache.get('vw_price', 'TEA', (15,)), 138.0)
+        # None is a result like any other.
+        self.assertIsNone(result_cache.get('vw_price', 'TEA', (30,)))
+        self.assertIs(result_cache.get('p_e_ratio', 'TEA', (15,)), MISSING)
+        self.assertEqual(result_cache.statistics(), {'hits': 2, 'misses': 2, 'evictions': 0, 'hit_ratio': 0.5,
+                                                     'size': 2, 'capacity': 10})
+
+    def test_invalidate(self):
+        result_cache = ResultCache(10)
+        result_cache.put('vw_price', 'TEA', (15,), 138.0)
+        result_cache.put('vw_price', 'POP', (15,), 120.0)
+        result_cache.invalidate('TEA')
+        self.assertEqual(result_cache.version('TEA'), 1)
+        self.assertIs(result_cache.get('vw_price', 'TEA', (15,)), MISSING)
+        self.assertEqual(result_cache.get('vw_price', 'POP', (15,)), 120.0)
+        # A result calculated from an older version is not used.
+        result_cache.put('vw_price', 'TEA', (15,), 130.0, version=0)
+        self.assertIs(result_cache.get('vw_price', 'TEA', (15,)), MISSING)
+        result_cache.put('vw_price', 'TEA', (15,), 140.0, version=1)
+        self.assertEqual(result_cache.get('vw_price', 'TEA', (15,)), 140.0)
+
+    def test_eviction(self):
+        result_cache = ResultCache(2)
+        result_cache.put('vw_price', 'TEA', (15,), 1.0)
+        result_cache.put('vw_price', 'POP', (15,), 2.0)
+        # Using TEA, so POP is the least recently used.
+        result_cache.get('vw_price', 'TEA', (15,))
+        result_cache.put('vw_price', 'ALE', (15,), 3.0)
+        self.assertEqual(result_cache.get('vw_price', 'TEA', (15,)), 1.0)
+        self.assertIs(result_cache.get('vw_price', 'POP', (15,)), MISSING)
+        self.assertEqual(result_cache.get('vw_price', 'ALE', (15,)), 3.0)
+        self.assertEqual(result_cache.statistics()['evictions'], 1)
+        self.assertEqual(result_cache.statistics()['size'], 2)
+
+    def test_disabled(self):
+        result_cache = ResultCache(0)
+        result_cache.put('vw_price', 'TEA', (15,), 138.0)
+        self.assertIs(result_cache.get('vw_price', 'TEA', (15,)), MISSING)
+        self.assertEqual(result_cache.statistics()['size'], 0)
@@ -0,0 +1,102 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+import logging.config
+from datetime import datetime
+
+from simple_stock_exchange import Stock, StockExchange
+from simple_stock_exchange.bar_builder import BarBuilder
+from simple_stock_exchange.price_broadcaster import PriceBroadcaster
+from simple_stock_exchange.retention import RetentionPolicy
+from simple_stock_exchange.rolling_vwap import RollingVWAP
+from simple_stock_exchange.trade_store import from_epoch, to_epoch
+from simple_stock_exchange.write_ahead_log import WriteAheadLog, ADD_TRADES, read_write_ahead_log, \
+    recover_stock_exchange
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestRetentionPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = to_epoch(datetime(2017, 2, 5, 12, 0, 0))
+        self.stock_exchange = StockExchange('test', WriteAheadLog(os.path.join(self.directory, 'exchange.wal')))
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+        # A trade every minute for the last 10 hours.
+        minutes = range(600)
+        self.stock_exchange.add_trades_bulk(
+            stock_symbols=['TEA'] * 600, quantities=[100 + minute for minute in minutes], trade_types=['buy'] * 600,
+            traded_prices=[10 + minute % 7 for minute in minutes],
+            time_stamps=[str(from_epoch(self.now - 60 * minute)) for minute in minutes])
+        self.stock_exchange.add_trades_bulk([('POP', '200', 'sell', '120', str(from_epoch(self.now - 5 * 3600)))])
+
+    def tearDown(self):
+        self.stock_exchange.write_ahead_log.close()
+        shutil.rmtree(self.directory)
+
+    def test_run_once(self):
+        trade_store = self.stock_exchange.recorded_trades['TEA']
+        volume_weighted_price = trade_store.volume_weighted_price(self.now - 3600)
+        bar_builder = BarBuilder(self.stock_exchange, intervals=(3600,))
+        archive_path = os.path.join(self.directory, 'trades.archive')
+        retention_policy = RetentionPolicy(self.stock_exchange, horizon=120, archive_path=archive_path,
+                                           clock=lambda: self.now)
+        expired_trades, reclaimed_bytes = retention_policy.run_once()
+        retention_policy.stop()
+        self.assertEqual(expired_trades, 480)
+        self.assertGreater(reclaimed_bytes, 0)
+        self.assertEqual(retention_policy.reclaimed_bytes, reclaimed_bytes)
+        self.assertEqual(len(trade_store), 121)
+        self.assertEqual(trade_store.time_stamps[0], self.now - 120 * 60)
+        self.assertNotIn('POP', self.stock_exchange.recorded_trades)
+        # The volume weighted price over the horizon is not affected.
+        self.assertEqual(trade_store.volume_weighted_price(self.now - 3600), volume_weighted_price)
+        # The bars of the dropped trades are kept.
+        self.assertEqual(len(bar_builder.bars('TEA', 3600)), 11)
+        # The dropped trades are archived, and the log records that they were dropped.
+        archived_trades = [(stock_symbol, len(values[0])) for record_type, stock_symbol, values, _ in
+                           read_write_ahead_log(archive_path) if record_type == ADD_TRADES]
+        self.assertEqual(sorted(archived_trades), [('POP', 1), ('TEA', 479)])
+        self.stock_exchange.write_ahead_log.flush()
+        recovered = recover_stock_exchange('test', self.stock_exchange.write_ahead_log.path)
+        recovered.write_ahead_log.close()
+        self.assertEqual(list(recovered.recorded_trades['TEA'].time_stamps), list(trade_store.time_stamps))
+        self.assertEqual(sorted(recovered.recorded_trades), ['TEA'])
+
+    def test_minimum_horizon(self):
+        self.stock_exchange.add_trade_listener(RollingVWAP(windows=(1, 60)))
+        self.assertRaises(ValueError, RetentionPolicy, self.stock_exchange, horizon=30)
+        self.assertRaises(ValueError, RetentionPolicy, self.stock_exchange, horizon=5)
+
+    def test_listeners_after_start(self):
+        retention_policy = RetentionPolicy(self.stock_exchange, horizon=30, clock=lambda: self.now).start()
+        try:
+            # The 60 minutes window of the broadcaster would miss the trades the policy drops.
+            self.assertRaises(ValueError, PriceBroadcaster, self.stock_exchange)
+            self.assertEqual(self.stock_exchange.trade_listeners, [])
+            self.stock_exchange.add_trade_listener(RollingVWAP(windows=(1, 30)))
+        finally:
+            retention_policy.stop()
+        self.assertIsNone(self.stock_exchange.retention_horizon)
+        PriceBroadcaster(self.stock_exchange)
+        self.assertEqual(len(self.stock_exchange.trade_listeners), 3)
+
+    def test_background_thread(self):
+        retention_policy = RetentionPolicy(self.stock_exchange, horizon=60, interval=0.01,
+                                           clock=lambda: self.now).start()
+        try:
+            for _ in range(500):
+                if retention_policy.expired_trades:
+                    break
+                retention_policy._stopped.wait(0.01)
+        finally:
+            retention_policy.stop()
+        self.assertEqual(retention_policy.expired_trades, 540)
+        self.assertEqual(len(self.stock_exchange.recorded_trades['TEA']), 61)
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+import random
+import unittest
+import logging.config
+from datetime import datetime
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.rolling_vwap import RollingVWAP
+from simple_stock_exchange.trade_store import from_epoch, to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestRollingVWAP(unittest.TestCase):
+
+    def setUp(self):
+        self.now = to_epoch(datetime(2017, 2, 5, 12, 0, 0))
+        self.stock_exchange = StockExchange('test')
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=self.stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+        self.rolling_vwap = RollingVWAP(clock=lambda: self.now)
+        self.stock_exchange.add_trade_listener(self.rolling_vwap)
+
+    def add_trade(self, stock_symbol, quantity, traded_price, seconds_ago):
+        TradeRecord(self.stock_exchange, stock_symbol, str(quantity), 'buy', str(traded_price),
+                    str(from_epoch(self.now - seconds_ago)))
+
+    def assert_matches_trade_store(self):
+        for stock_symbol, trade_store in self.stock_exchange.recorded_trades.items():
+            for window in (1, 5, 15, 60):
+                self.assertEqual(self.rolling_vwap.volume_weighted_price(stock_symbol, window),
+                                 trade_store.volume_weighted_price(self.now - 60 * window))
+
+    def test_windows(self):
+        self.add_trade('TEA', 100, 10, 30)
+        self.add_trade('TEA', 300, 20, 4 * 60)
+        self.add_trade('TEA', 100, 30, 50 * 60)
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('TEA', 1), 10.0)
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('TEA', 5), 17.5)
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('TEA', 60), 20.0)
+        self.assertEqual(self.rolling_vwap.volume_weighted_prices(15), {'TEA': 17.5})
+        # Trades age out of the windows as time passes.
+        self.now += 60
+        self.assertIsNone(self.rolling_vwap.volume_weighted_price('TEA', 1))
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('TEA', 5), 10.0)
+        self.now += 3600
+        self.assertIsNone(self.rolling_vwap.volume_weighted_price('TEA', 60))
+        # Stocks without trades, and windows not followed.
+        self.assertIsNone(self.rolling_vwap.volume_weighted_price('POP', 15))
+        self.assertRaises(KeyError, self.rolling_vwap.volume_weighted_price, 'TEA', 2)
+
+    def test_subscribe(self):
+        self.rolling_vwap.subscribe_all = False
+        self.rolling_vwap.subscribe('POP', (2, 30))
+        self.add_trade('POP', 100, 10, 90)
+        self.add_trade('TEA', 100, 10, 90)
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('POP', 2), 10.0)
+        self.assertRaises(KeyError, self.rolling_vwap.volume_weighted_price, 'POP', 15)
+        self.assertRaises(KeyError, self.rolling_vwap.volume_weighted_price, 'TEA', 15)
+        self.rolling_vwap.unsubscribe('POP')
+        self.assertRaises(KeyError, self.rolling_vwap.volume_weighted_price, 'POP', 2)
+
+    def test_existing_trades(self):
+        self.add_trade('TEA', 100, 10, 30)
+        self.add_trade('TEA', 300, 20, 4 * 60)
+        self.add_trade('POP', 100, 30, 2 * 3600)
+        # Added after the trades were recorded, it starts with the trades that are in its windows.
+        rolling_vwap = RollingVWAP(clock=lambda: self.now)
+        self.stock_exchange.add_trade_listener(rolling_vwap)
+        self.assertEqual(rolling_vwap.volume_weighted_price('TEA', 1), 10.0)
+        self.assertEqual(rolling_vwap.volume_weighted_price('TEA', 5), 17.5)
+        self.assertIsNone(rolling_vwap.volume_weighted_price('POP', 60))
+        # Stocks subscribed later, and stocks traded again after unsubscribing, also start with their trades.
+        rolling_vwap.subscribe('TEA', (2, 30))
+        self.assertEqual(rolling_vwap.volume_weighted_price('TEA', 30), 17.5)
+        rolling_vwap.unsubscribe('TEA')
+        self.add_trade('TEA', 100, 40, 0)
+        self.assertEqual(rolling_vwap.volume_weighted_price('TEA', 1), 25.0)
+        self.assertEqual(rolling_vwap.volume_weighted_price('TEA', 5), 22.0)
+
+    def test_expired_trades(self):
+        self.add_trade('TEA', 100, 10, 30)
+        self.add_trade('TEA', 300, 20, 4 * 60)
+        self.stock_exchange.expire_trades('TEA', self.now - 60)
+        # The windows keep matching the trades of the stock exchange.
+        self.assertEqual(self.rolling_vwap.volume_weighted_price('TEA', 5), 10.0)
+        self.assert_matches_trade_store()
+
+    def test_random_trades(self):
+        random.seed(5)
+        for _ in range(20):
+            for _ in range(50):
+                stock_symbol = random.choice(['TEA', 'POP'])
+                # Mostly recent trades, with some out of order and some older than all windows.
+                seconds_ago = random.choice([random.randint(0, 10), random.randint(0, 7200)])
+                self.add_trade(stock_symbol, random.randint(1, 500), random.randint(50, 150), seconds_ago)
+            self.stock_exchange.add_trades_bulk([
+                (random.choice(['TEA', 'POP']), str(random.randint(1, 500)), 'sell', str(random.randint(50, 150)),
+                 str(from_epoch(self.now - random.randint(0, 600)))) for _ in range(20)])
+            for _ in range(10):
+                stock_symbol = random.choice(['TEA', 'POP'])
+                trade_store = self.stock_exchange.recorded_trades[stock_symbol]
+                self.stock_exchange.remove_trade_by_symbol_date(
+                    stock_symbol, str(from_epoch(random.choice(trade_store.time_stamps))))
+            self.now += random.randint(0, 120)
+            self.assert_matches_trade_store()
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+
+import json
+import unittest
+import logging.config
+
+from api import serializers
+from simple_stock_exchange import Stock, StockExchange, TradeRecord
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestSerializers(unittest.TestCase):
+
+    def setUp(self):
+        self.stock_exchange = StockExchange('test')
+        for stock_symbol in ('TEA', 'POP', 'ALE', 'GIN', 'JOE'):
+            Stock(stock_symbol, 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+        self.stock_exchange.add_trades_bulk(
+            stock_symbols=['TEA'] * 25, quantities=range(1, 26), trade_types=['buy', 'sell'] * 12 + ['buy'],
+            traded_prices=[100 + trade for trade in range(25)],
+            time_stamps=['2017-02-05 12:00:{:02d}'.format(trade // 2) for trade in range(25)])
+        TradeRecord(self.stock_exchange, 'POP', '300', 'buy', '130', '2017-02-05 13:00:00')
+
+    def test_serialize_stock_exchange(self):
+        self.assertEqual(serializers.serialize_stock_exchange(self.stock_exchange),
+                         {'name': 'test', 'stocks': 5, 'trades': 26,
+                          'all_share_index': self.stock_exchange.all_share_index})
+
+    def test_query_range(self):
+        self.assertEqual(serializers.query_range(None, None), (0, None))
+        self.assertEqual(serializers.query_range('10', 5), (10, 5))
+        self.assertRaises(ValueError, serializers.query_range, -1, None)
+        self.assertRaises(ValueError, serializers.query_range, 0, '-5')
+        self.assertRaises(ValueError, serializers.query_range, 'first', None)
+
+    def test_stocks_page(self):
+        stocks, cursor = serializers.stocks_page(self.stock_exchange, limit=2)
+        self.assertEqual([stock['stock_symbol'] for stock in stocks], ['ALE', 'GIN'])
+        self.assertEqual(cursor, 'GIN')
+        # A stock added before the cursor is not in the next pages.
+        Stock('ABC', 'common', '8', '100', current_stock_exchange=self.stock_exchange)
+        stocks, cursor = serializers.stocks_page(self.stock_exchange, cursor, limit=2)
+        self.assertEqual([stock['stock_symbol'] for stock in stocks], ['JOE', 'POP'])
+        stocks, cursor = serializers.stocks_page(self.stock_exchange, cursor, limit=2)
+        self.assertEqual([stock['stock_symbol'] for stock in stocks], ['TEA'])
+        self.assertIsNone(cursor)
+        self.assertEqual(stocks[0]['current_price'], 124.0)
+        self.assertEqual(stocks[0]['current_price_timestamp'], '2017-02-05 12:00:12')
+
+    def test_trades_page(self):
+        trades, cursor = serializers.trades_page(self.stock_exchange, 'TEA', limit=10)
+        self.assertEqual(trades[1], {'trade_id': 1, 'stock_symbol': 'TEA', 'time_stamp': '2017-02-05 12:00:00',
+                                     'quantity': 2, 'trade_type': 'sell', 'traded_price': 101.0})
+        trade_ids = [trade['trade_id'] for trade in trades]
+        # Removing a trade of the next page, and the last trade of this page.
+        self.stock_exchange.remove_trade_by_id('TEA', 12)
+        self.stock_exchange.remove_trade_by_id('TEA', 9)
+        while cursor is not None:
+            trades, cursor = serializers.trades_page(self.stock_exchange, 'TEA', cursor, limit=10)
+            trade_ids.extend(trade['trade_id'] for trade in trades)
+        self.assertEqual(trade_ids, [trade_id for trade_id in range(25) if trade_id != 12])
+        self.assertEqual(serializers.trades_page(self.stock_exchange, 'ALE'), ([], None))
+        self.assertRaises(ValueError, serializers.trades_page, self.stock_exchange, 'TEA', 'not a cursor')
+
+    def test_stream_trades(self):
+        serializers.STREAM_PAGE_SIZE, stream_page_size = 4, serializers.STREAM_PAGE_SIZE
+        try:
+            chunks = list(serializers.stream_trades(self.stock_exchange))
+            stocks = [json.loads(line) for chunk in serializers.stream_stocks(self.stock_exchange)
+                      for line in chunk.splitlines()]
+        finally:
+            serializers.STREAM_PAGE_SIZE = stream_page_size
+        self.assertEqual(len(chunks), 8)
+        trades = [json.loads(line) for chunk in chunks for line in chunk.splitlines()]
+        self.assertEqual([trade['stock_symbol'] for trade in trades], ['POP'] + ['TEA'] * 25)
+        self.assertEqual([trade['trade_id'] for trade in trades], [25] + range(25))
+        self.assertEqual(len(stocks), 5)
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+
+import numpy as np
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.rolling_vwap import RollingVWAP
+from simple_stock_exchange.sharded_stock_exchange import ShardedStockExchange, shard_of
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestShardedStockExchange(unittest.TestCase):
+
+    def setUp(self):
+        self.sharded_stock_exchange = ShardedStockExchange('test', 3)
+        self.stock_exchange = StockExchange('test')
+        for stock_exchange in (self.sharded_stock_exchange, self.stock_exchange):
+            Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+            Stock('POP', 'common', '8', '100', current_stock_exchange=stock_exchange)
+            Stock('ALE', 'common', '23', '60', current_stock_exchange=stock_exchange)
+            Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+            Stock('JOE', 'common', '13', '250', current_stock_exchange=stock_exchange)
+            TradeRecord(stock_exchange, 'POP', '300', 'buy', '150')
+            TradeRecord(stock_exchange, 'POP', '500', 'sell', '130', '2017-02-05 22:14:39')
+            TradeRecord(stock_exchange, 'GIN', '200', 'buy', '110')
+            stock_exchange.add_trades_bulk([('ALE', '100', 'buy', '70'), ('JOE', '100', 'sell', '240'),
+                                            ('XYZ', '100', 'sell', '240'), ('TEA', '-1', 'sell', '240')])
+
+    def tearDown(self):
+        self.sharded_stock_exchange.close()
+
+    def test_shard_of(self):
+        self.assertEqual(shard_of('POP', 3), shard_of(u'POP', 3))
+        self.assertEqual(sorted(set(shard_of(stock_symbol, 3) for stock_symbol in ['TEA', 'POP', 'ALE', 'GIN'])),
+                         [0, 1, 2])
+
+    def test_same_results(self):
+        for stock_exchange in (self.sharded_stock_exchange, self.stock_exchange):
+            self.assertFalse(stock_exchange.add_new_stock(Stock('POP', 'common', '8', '100')))
+            self.assertTrue(stock_exchange.remove_trade_by_symbol_date('POP', '2017-02-05 22:14:39'))
+            self.assertFalse(stock_exchange.remove_trade_by_symbol_date('POP', '2017-02-05 22:14:39'))
+            self.assertTrue(stock_exchange.is_stock_registered('JOE'))
+            self.assertFalse(stock_exchange.is_stock_registered('XYZ'))
+        self.assertEqual(self.sharded_stock_exchange.all_share_index_calculator(),
+                         self.stock_exchange.all_share_index_calculator())
+        for stock_symbol in ['TEA', 'POP', 'ALE', 'GIN', 'JOE', 'XYZ']:
+            self.assertEqual(self.sharded_stock_exchange.vw_stock_price_calculator(stock_symbol),
+                             self.stock_exchange.vw_stock_price_calculator(stock_symbol))
+            self.assertEqual(self.sharded_stock_exchange.p_e_ratio_calculator(stock_symbol, '120'),
+                             self.stock_exchange.p_e_ratio_calculator(stock_symbol, '120'))
+        self.assertEqual(self.sharded_stock_exchange.dividend_yield_calculator('ALE', '50'),
+                         self.stock_exchange.dividend_yield_calculator('ALE', '50'))
+        self.assertEqual(self.sharded_stock_exchange.all_share_index_calculator(),
+                         self.stock_exchange.all_share_index_calculator())
+        self.assertEqual(self.sharded_stock_exchange.all_share_index, self.stock_exchange.all_share_index)
+
+    def test_trades(self):
+        # The trades get the ID given by their shard, and are removed by it.
+        for stock_exchange in (self.sharded_stock_exchange, self.stock_exchange):
+            trade = TradeRecord(stock_exchange, 'TEA', '100', 'buy', '90', '2017-02-05 22:14:39')
+            trade1 = TradeRecord(stock_exchange, 'TEA', '100', 'buy', '90', '2017-02-05 22:14:39')
+            self.assertIsNotNone(trade.trade_id)
+            self.assertNotEqual(trade.trade_id, trade1.trade_id)
+            self.assertTrue(stock_exchange.remove_trade(trade1))
+            self.assertFalse(stock_exchange.remove_trade(trade1))
+            self.assertTrue(stock_exchange.remove_trade_by_id('TEA', trade.trade_id))
+            self.assertIsNone(TradeRecord(stock_exchange, 'XYZ', '100', 'buy', '90').trade_id)
+        self.assertRaises(NotImplementedError, self.sharded_stock_exchange.add_trade_listener, RollingVWAP())
+
+    def test_batch_calculator(self):
+        stock_symbols = ['JOE', 'XYZ', 'POP', 'GIN']
+        stock_prices = ['1', '2', '3', '4']
+        for sharded_column, column in zip(self.sharded_stock_exchange.batch_calculator(stock_symbols, stock_prices),
+                                          self.stock_exchange.batch_calculator(stock_symbols, stock_prices)):
+            np.testing.assert_array_equal(sharded_column, column)
+        sharded_symbols, sharded_dividend_yields, _ = self.sharded_stock_exchange.batch_calculator()
+        stock_symbols, dividend_yields, _ = self.stock_exchange.batch_calculator()
+        np.testing.assert_array_equal(sharded_dividend_yields[np.argsort(sharded_symbols)],
+                                      dividend_yields[np.argsort(stock_symbols)])
+
+    def test_add_trades_bulk(self):
+        recorded = self.sharded_stock_exchange.add_trades_bulk(
+            stock_symbols=['TEA', 'XYZ', 'JOE'], quantities=['10', '10', 'a'], trade_types=['buy', 'buy', 'sell'],
+            traded_prices=['90', '90', '90'])
+        self.assertEqual(list(recorded), [True, False, False])
+        self.assertEqual(self.sharded_stock_exchange.vw_stock_price_calculator('TEA'), 90.0)
+
+    def test_query_trades(self):
+        # The IDs of the trades are given by each shard, so only the other fields are compared. The trades without a
+        # time stamp are left out, as each stock exchange gives them its own current time.
+        for stock_exchange in (self.sharded_stock_exchange, self.stock_exchange):
+            stock_exchange.add_trades_bulk([('GIN', '100', 'buy', '90', '2017-02-06 10:00:00'),
+                                            ('ALE', '200', 'sell', '80', '2017-02-06 11:00:00'),
+                                            ('POP', '300', 'buy', '70', '2017-02-06 12:00:00')])
+        fields = ['stock_symbol', 'time_stamp', 'traded_price', 'quantity', 'trade_type']
+        for arguments in ((['POP', 'GIN', 'ALE', 'XYZ'], None, '2017-02-07 00:00:00'),
+                          (['POP', 'GIN', 'ALE'], None, '2017-02-07 00:00:00', 'buy'),
+                          (['POP', 'GIN', 'ALE'], '2017-02-06 00:00:00', '2017-02-07 00:00:00',
+                           None, None, None, 1, 1)):
+            self.assertEqual(self.sharded_stock_exchange.query_trades(*arguments)[fields].tolist(),
+                             self.stock_exchange.query_trades(*arguments)[fields].tolist())
+        self.assertEqual(len(self.sharded_stock_exchange.query_trades('POP')), 3)
+
+    def test_remove_stock(self):
+        stock = Stock('GIN', 'preferred', '8', '100', '2%')
+        self.assertTrue(self.sharded_stock_exchange.remove_existing_stock(stock))
+        self.assertFalse(self.sharded_stock_exchange.remove_existing_stock_by_symbol('GIN'))
+        self.stock_exchange.remove_existing_stock_by_symbol('GIN')
+        self.assertEqual(self.sharded_stock_exchange.all_share_index_calculator(),
+                         self.stock_exchange.all_share_index_calculator())
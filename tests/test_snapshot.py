@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+import logging.config
+
+import numpy as np
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.snapshot import checkpoint, read_snapshot, read_snapshot_log_offset, write_snapshot
+from simple_stock_exchange.write_ahead_log import WriteAheadLog, recover_stock_exchange
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot_file = os.path.join(self.directory, 'exchange.snapshot')
+        self.log_file = os.path.join(self.directory, 'exchange.wal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_exchange(self, write_ahead_log=None):
+        stock_exchange = StockExchange('test', write_ahead_log)
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=stock_exchange)
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-02-05 23:14:39')
+        TradeRecord(stock_exchange, 'GIN', '500', 'sell', '150', '2017-02-05 22:14:39')
+        TradeRecord(stock_exchange, 'POP', '200', 'sell', '120', '2017-02-05 22:14:39')
+        return stock_exchange
+
+    def assert_same_exchange(self, loaded, original):
+        self.assertEqual(loaded.name, original.name)
+        self.assertEqual(sorted(loaded.registered_stocks), sorted(original.registered_stocks))
+        for stock_symbol, stock in original.registered_stocks.items():
+            self.assertEqual(loaded.registered_stocks[stock_symbol].to_dict(), stock.to_dict())
+        self.assertEqual(sorted(loaded.recorded_trades), sorted(original.recorded_trades))
+        for stock_symbol, trade_store in original.recorded_trades.items():
+            for loaded_column, column in zip(loaded.recorded_trades[stock_symbol].columns(), trade_store.columns()):
+                self.assertEqual(list(loaded_column), list(column))
+        self.assertEqual(loaded.next_trade_id, original.next_trade_id)
+        self.assertEqual(loaded.all_share_index, original.all_share_index)
+
+    def test_write_read(self):
+        original = self.create_exchange()
+        write_snapshot(original, self.snapshot_file)
+        loaded = read_snapshot(self.snapshot_file)
+        self.assert_same_exchange(loaded, original)
+        self.assertEqual(loaded.vw_stock_price_calculator('GIN', '2017-02-05 22:00:00'),
+                         original.vw_stock_price_calculator('GIN', '2017-02-05 22:00:00'))
+
+    def test_empty_exchange(self):
+        write_snapshot(StockExchange('empty'), self.snapshot_file)
+        loaded = read_snapshot(self.snapshot_file)
+        self.assertEqual(loaded.name, 'empty')
+        self.assertEqual(loaded.registered_stocks, {})
+        self.assertEqual(loaded.recorded_trades, {})
+
+    def test_memory_mapped(self):
+        write_snapshot(self.create_exchange(), self.snapshot_file)
+        # Read only snapshots can not be changed.
+        loaded = read_snapshot(self.snapshot_file, mode='r')
+        self.assertIsInstance(loaded.recorded_trades['GIN'].columns()[0], np.memmap)
+        self.assertFalse(loaded.recorded_trades['GIN'].time_stamps.flags.writeable)
+        # The file is mapped once, whatever the number of stocks and columns.
+        self.assertEqual(len(set(id(column._mmap) for trade_store in loaded.recorded_trades.values()
+                                 for column in trade_store.columns())), 1)
+        # The order of the trade IDs is read from the trade directory, not from the ID columns.
+        for trade_store in loaded.recorded_trades.values():
+            trade_ids = trade_store.trade_ids
+            self.assertEqual(trade_store._ids_sorted, bool(np.all(trade_ids[1:] > trade_ids[:-1])))
+        # Copy on write snapshots can be changed, without changing the file.
+        loaded = read_snapshot(self.snapshot_file)
+        TradeRecord(loaded, 'GIN', '100', 'buy', '140', '2017-02-05 22:30:00')
+        loaded.remove_trade_by_symbol_date('POP', '2017-02-05 22:14:39')
+        self.assertEqual(len(loaded.recorded_trades['GIN']), 3)
+        self.assertNotIn('POP', loaded.recorded_trades)
+        self.assert_same_exchange(read_snapshot(self.snapshot_file), self.create_exchange())
+
+    def test_invalid_file(self):
+        with open(self.snapshot_file, 'wb') as snapshot_file:
+            snapshot_file.write(b'not a snapshot' * 4)
+        self.assertRaises(ValueError, read_snapshot, self.snapshot_file)
+
+    def test_checkpoint_recover(self):
+        original = self.create_exchange(WriteAheadLog(self.log_file))
+        checkpoint(original, self.snapshot_file)
+        self.assertEqual(os.path.getsize(self.log_file), 0)
+        self.assertEqual(read_snapshot_log_offset(self.snapshot_file), 0)
+        TradeRecord(original, 'POP', '100', 'buy', '110', '2017-02-06 10:00:00')
+        original.remove_existing_stock_by_symbol('TEA')
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file, snapshot_path=self.snapshot_file)
+        self.assert_same_exchange(recovered, original)
+        recovered.write_ahead_log.close()
+
+    def test_recover_before_log_truncated(self):
+        original = self.create_exchange(WriteAheadLog(self.log_file))
+        original.write_ahead_log.flush()
+        # A snapshot saved by a checkpoint that stopped before discarding the log.
+        write_snapshot(original, self.snapshot_file, os.path.getsize(self.log_file))
+        TradeRecord(original, 'POP', '100', 'buy', '110', '2017-02-06 10:00:00')
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file, snapshot_path=self.snapshot_file)
+        self.assert_same_exchange(recovered, original)
+        recovered.write_ahead_log.close()
+
+    def test_recover_after_log_truncated(self):
+        original = self.create_exchange(WriteAheadLog(self.log_file))
+        original.write_ahead_log.flush()
+        # A snapshot saved by a checkpoint that stopped after discarding the log, before resetting its length.
+        write_snapshot(original, self.snapshot_file, os.path.getsize(self.log_file))
+        original.write_ahead_log.truncate()
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file, snapshot_path=self.snapshot_file)
+        self.assert_same_exchange(recovered, original)
+        recovered.write_ahead_log.close()
@@ -48,6 +48,14 @@ class TestStock(unittest.TestCase):
         self.assertEqual(stock.current_stock_exchange, stock_exchange)
         self.assertTrue(stock.created_successfully)
 
+    def test_to_dict(self):
+        stock = Stock('GIN', 'preferred', '8', '100', '0.02', StockExchange('test'))
+        self.assertFalse(hasattr(stock, '__dict__'))
+        self.assertEqual(stock.to_dict(), {'created_successfully': True, 'stock_symbol': 'GIN',
+                                           'stock_type': 'preferred', 'last_dividend': 8.0, 'fixed_dividend': 0.02,
+                                           'par_value': 100.0, 'current_price': '', 'current_price_timestamp': '',
+                                           'dividend_yield': '', 'p_e_ratio': ''})
+
     def test_exceptions(self):
         stock = Stock('GIN', 'other', 'test', 'test1', 'test.3', 'stock_exchange')
         self.assertFalse(stock.created_successfully)
@@ -1,9 +1,15 @@
 #!/usr/bin/python
 
+import random
 import unittest
 import logging.config
+from datetime import datetime
+
+import numpy as np
 
 from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange import stock_exchange as stock_exchange_module
+from simple_stock_exchange.trade_store import TRADE_TYPE_CODES
 
 __author__ = 'Nikitas Papangelopoulos'
 
@@ -40,6 +46,34 @@ class TestStockExchange(unittest.TestCase):
         stock_exchange.remove_existing_stock(stock)
         stock_exchange.add_new_trade(TradeRecord(stock_exchange, 'GIN', '200', 'sell', '150', '2017-02-05 23:15:39'))
 
+    def test_add_trades_bulk(self):
+        stock_exchange = StockExchange('test')
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=stock_exchange)
+        TradeRecord(stock_exchange, 'GIN', '100', 'buy', '110', '2017-02-05 22:30:00')
+        recorded = stock_exchange.add_trades_bulk([('GIN', '300', 'buy', '130', '2017-02-05 23:14:39'),
+                                                   ('GIN', '500', 'sell', '150', '2017-02-05 22:14:39'),
+                                                   ('POP', '200', 'sell', '120', '2017-02-05 22:14:39'),
+                                                   ('TEA', '200', 'sell', '120', '2017-02-05 22:14:39'),
+                                                   ('POP', '-1', 'sell', '120', '2017-02-05 22:14:39'),
+                                                   ('POP', '200', 'hold', '120', '2017-02-05 22:14:39'),
+                                                   ('POP', '200', 'sell', 'test', '2017-02-05 22:14:39'),
+                                                   ('POP', '200', 'sell', '120', '2017-02-05'),
+                                                   ('POP', '100', 'buy', '125', '2017-2-5 22:14:40')])
+        self.assertEqual(list(recorded), [True, True, True, False, False, False, False, False, True])
+        self.assertEqual(list(stock_exchange.recorded_trades['GIN'].quantities), [500, 100, 300])
+        self.assertEqual(len(stock_exchange.recorded_trades['POP']), 2)
+        self.assertEqual(stock_exchange.registered_stocks['GIN'].current_price, 130.0)
+        self.assertEqual(stock_exchange.registered_stocks['POP'].current_price, 125.0)
+        self.assertEqual(str(stock_exchange.registered_stocks['POP'].current_price_timestamp), '2017-02-05 22:14:40')
+
+        # Columnar input, with the current time as the default time stamp.
+        recorded = stock_exchange.add_trades_bulk(stock_symbols=['POP', 'POP'], quantities=[300, 500],
+                                                  trade_types=['buy', 'sell'], traded_prices=[130.0, 150.0])
+        self.assertTrue(recorded.all())
+        self.assertEqual(stock_exchange.vw_stock_price_calculator('POP'), 142.5)
+        self.assertEqual(stock_exchange.registered_stocks['POP'].current_price, 130.0)
+
     def test_remove_trade(self):
         stock_exchange = StockExchange('test')
         Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
@@ -50,6 +84,12 @@ class TestStockExchange(unittest.TestCase):
         stock_exchange.remove_trade(trade1)
         stock_exchange.remove_trade(trade1)
 
+        # A recorded trade is removed by its ID, not the first identical trade.
+        trade = TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-02-05 23:14:39')
+        trade1 = TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-02-05 23:14:39')
+        self.assertTrue(stock_exchange.remove_trade(trade1))
+        self.assertEqual(list(stock_exchange.recorded_trades['GIN'].trade_ids), [trade.trade_id])
+
     def test_remove_trade_by_symbol_date(self):
         stock_exchange = StockExchange('test')
         Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
@@ -60,6 +100,21 @@ class TestStockExchange(unittest.TestCase):
         stock_exchange.remove_trade_by_symbol_date('GIN', '2017-02-05 22:14:39')
         stock_exchange.remove_trade_by_symbol_date('GIN', '2017-02-05 22:14:39')
 
+    def test_remove_trade_by_id(self):
+        stock_exchange = StockExchange('test')
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        trade = TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-02-05 23:14:39')
+        trade1 = TradeRecord(stock_exchange, 'GIN', '500', 'sell', '150', '2017-02-05 22:14:39')
+        stock_exchange.add_trades_bulk([('GIN', '100', 'buy', '140', '2017-02-05 22:30:00')])
+        self.assertEqual((trade.trade_id, trade1.trade_id), (0, 1))
+        self.assertEqual(list(stock_exchange.recorded_trades['GIN'].trade_ids), [1, 2, 0])
+        self.assertTrue(stock_exchange.remove_trade_by_id('GIN', trade.trade_id))
+        self.assertFalse(stock_exchange.remove_trade_by_id('GIN', trade.trade_id))
+        self.assertTrue(stock_exchange.remove_trade_by_id('GIN', 2))
+        self.assertEqual(list(stock_exchange.recorded_trades['GIN'].quantities), [500])
+        self.assertFalse(stock_exchange.remove_trade_by_id('GIN', 'not an id'))
+        self.assertFalse(stock_exchange.remove_trade_by_id('TEA', 1))
+
     def test_is_stock_price_valid(self):
         StockExchange.is_stock_price_valid('400.35')
         StockExchange.is_stock_price_valid('test')
@@ -92,6 +147,28 @@ class TestStockExchange(unittest.TestCase):
         p_e_ratio3 = stock_exchange.p_e_ratio_calculator('ALE', '140')
         self.assertEqual(p_e_ratio3, 6.087)
 
+    def test_batch_calculator(self):
+        stock_exchange = StockExchange('test')
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        Stock('POP', 'common', '8', '100', current_stock_exchange=stock_exchange)
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        stock_symbols, dividend_yields, p_e_ratios = stock_exchange.batch_calculator(
+            ['TEA', 'POP', 'GIN', 'ALE', 'POP'], ['200', '150', '350', '100', 'test'])
+        self.assertEqual(list(stock_symbols), ['TEA', 'POP', 'GIN', 'ALE', 'POP'])
+        self.assertEqual(list(dividend_yields[:3]), [0.0, 0.053, 0.006])
+        self.assertTrue(np.isnan(dividend_yields[3:]).all())
+        self.assertTrue(np.isnan(p_e_ratios[0]))
+        self.assertEqual(list(p_e_ratios[1:3]), [18.75, 175.0])
+        self.assertTrue(np.isnan(p_e_ratios[3:]).all())
+
+        # Defaulting to all registered stocks and their current prices.
+        TradeRecord(stock_exchange, 'POP', '300', 'buy', '150', '2017-02-05 22:14:39')
+        stock_exchange.remove_existing_stock_by_symbol('TEA')
+        stock_symbols, dividend_yields, p_e_ratios = stock_exchange.batch_calculator()
+        self.assertEqual(sorted(stock_symbols), ['GIN', 'POP'])
+        self.assertEqual(dict(zip(stock_symbols, p_e_ratios))['POP'], 18.75)
+        self.assertTrue(np.isnan(dict(zip(stock_symbols, p_e_ratios))['GIN']))
+
     def test_all_share_index_calculator(self):
         stock_exchange = StockExchange('test')
         stock_exchange.all_share_index_calculator()
@@ -106,6 +183,22 @@ class TestStockExchange(unittest.TestCase):
         all_share_index = stock_exchange.all_share_index_calculator()
         self.assertEqual(all_share_index, 155.362)
 
+    def test_all_share_index_incremental(self):
+        stock_exchange = StockExchange('test')
+        self.assertEqual(stock_exchange.all_share_index, '')
+        Stock('POP', 'common', '8', '100', current_stock_exchange=stock_exchange)
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        self.assertEqual(stock_exchange.all_share_index, 100.0)
+        TradeRecord(stock_exchange, 'POP', '300', 'buy', '400', '2017-02-05 22:14:39')
+        self.assertEqual(stock_exchange.all_share_index_calculator(), 200.0)
+        TradeRecord(stock_exchange, 'TEA', '300', 'buy', '0', '2017-02-05 22:14:39')
+        self.assertEqual(stock_exchange.all_share_index_calculator(), 0.0)
+        stock_exchange.remove_existing_stock_by_symbol('TEA')
+        self.assertEqual(stock_exchange.all_share_index_calculator(), 400.0)
+        stock_exchange.remove_existing_stock_by_symbol('POP')
+        self.assertIsNone(stock_exchange.all_share_index_calculator())
+        self.assertEqual(stock_exchange.all_share_index, '')
+
     def test_vw_stock_price_calculator(self):
         stock_exchange = StockExchange('test')
         Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
@@ -127,6 +220,94 @@ class TestStockExchange(unittest.TestCase):
         volume_weighted_price = stock_exchange.vw_stock_price_calculator('GIN')
         self.assertIsNone(volume_weighted_price)
 
+    def test_query_trades(self):
+        stock_exchange = StockExchange('test')
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-01-05 21:14:39')
+        TradeRecord(stock_exchange, 'TEA', '100', 'sell', '90', '2017-01-05 21:30:00')
+        TradeRecord(stock_exchange, 'GIN', '500', 'sell', '150', '2017-01-05 22:14:39')
+        TradeRecord(stock_exchange, 'TEA', '200', 'buy', '95', '2017-01-05 22:14:39')
+        TradeRecord(stock_exchange, 'GIN', '200', 'sell', '120', '2017-01-05 23:14:39')
+
+        trades = stock_exchange.query_trades(['GIN', 'TEA', 'POP'], '2017-01-05 21:30:00', '2017-01-05 23:00:00')
+        self.assertEqual(trades['stock_symbol'].tolist(), ['TEA', 'GIN', 'TEA'])
+        self.assertEqual(trades['trade_id'].tolist(), [1, 2, 3])
+        self.assertEqual(trades['traded_price'].tolist(), [90.0, 150.0, 95.0])
+        self.assertEqual(stock_exchange.query_trades('GIN')['quantity'].tolist(), [300, 500, 200])
+        self.assertEqual(stock_exchange.query_trades(['GIN', 'TEA'], trade_type='sell', min_quantity=150,
+                                                     max_quantity=300)['trade_id'].tolist(), [4])
+        self.assertEqual(stock_exchange.query_trades(['GIN', 'TEA'], offset=1, limit=2)['trade_id'].tolist(), [1, 2])
+        self.assertEqual(list(stock_exchange.query_trade_rows('TEA', trade_type='buy')),
+                         [('TEA', datetime(2017, 1, 5, 22, 14, 39), 95.0, 200, 'buy', 3)])
+        self.assertEqual(len(stock_exchange.query_trades('POP')), 0)
+        self.assertRaises(ValueError, stock_exchange.query_trades, 'GIN', trade_type='hold')
+        self.assertRaises(ValueError, stock_exchange.query_trades, 'GIN', starting_time='yesterday')
+
+    def test_query_trades_in_blocks(self):
+        stock_exchange = StockExchange('test')
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        random.seed(3)
+        stock_exchange.add_trades_bulk([
+            (random.choice(['GIN', 'TEA']), str(random.randint(1, 500)), random.choice(['buy', 'sell']), '100',
+             '2017-01-05 21:{:02d}:{:02d}'.format(random.randint(0, 59), random.randint(0, 59))) for _ in range(300)])
+        stock_exchange.remove_trade_by_id('GIN', int(stock_exchange.query_trades('GIN', limit=1)['trade_id'][0]))
+        all_trades = stock_exchange.query_trades(['GIN', 'TEA'], '2017-01-05 21:10:00', '2017-01-05 21:50:00')
+        matching = all_trades[(all_trades['trade_type'] == TRADE_TYPE_CODES['buy']) & (all_trades['quantity'] >= 100)]
+        # Reading the trades in blocks of 7, and streaming them in pages of 5.
+        block_and_page_sizes = stock_exchange_module.QUERY_BLOCK_SIZE, stock_exchange_module.QUERY_PAGE_SIZE
+        stock_exchange_module.QUERY_BLOCK_SIZE, stock_exchange_module.QUERY_PAGE_SIZE = 7, 5
+        trades_after = stock_exchange.recorded_trades['TEA'].trades_after
+        blocks_read = []
+
+        def counting_trades_after(*arguments, **keyword_arguments):
+            blocks_read.append(1)
+            return trades_after(*arguments, **keyword_arguments)
+
+        stock_exchange.recorded_trades['TEA'].trades_after = counting_trades_after
+        try:
+            for offset, limit in ((0, None), (3, 10), (0, 1), (20, 200)):
+                expected = matching[offset:] if limit is None else matching[offset:offset + limit]
+                trades = stock_exchange.query_trades(['GIN', 'TEA'], '2017-01-05 21:10:00', '2017-01-05 21:50:00',
+                                                     'buy', 100, None, offset, limit)
+                self.assertEqual(trades['trade_id'].tolist(), expected['trade_id'].tolist())
+                rows = stock_exchange.query_trade_rows(['GIN', 'TEA'], '2017-01-05 21:10:00', '2017-01-05 21:50:00',
+                                                       'buy', 100, None, offset, limit)
+                self.assertEqual([row[5] for row in rows], expected['trade_id'].tolist())
+            # Only the blocks up to the first matching trade are read.
+            del blocks_read[:]
+            stock_exchange.query_trades('TEA', '2017-01-05 21:10:00', None, 'buy', limit=1)
+            self.assertLessEqual(len(blocks_read), 2)
+        finally:
+            stock_exchange_module.QUERY_BLOCK_SIZE, stock_exchange_module.QUERY_PAGE_SIZE = block_and_page_sizes
+
+    def test_result_cache(self):
+        stock_exchange = StockExchange('test')
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130')
+        self.assertEqual(stock_exchange.vw_stock_price_calculator('GIN'), 130.0)
+        self.assertEqual(stock_exchange.p_e_ratio_calculator('GIN', '150'), 75.0)
+        self.assertEqual(stock_exchange.p_e_ratio_calculator('GIN', '150'), 75.0)
+        self.assertEqual(stock_exchange.result_cache.hits, 1)
+
+        # A new trade changes the volume weighted price.
+        TradeRecord(stock_exchange, 'GIN', '100', 'sell', '170')
+        self.assertEqual(stock_exchange.vw_stock_price_calculator('GIN'), 140.0)
+        trade = TradeRecord(stock_exchange, 'GIN', '200', 'sell', '80')
+        self.assertEqual(stock_exchange.vw_stock_price_calculator('GIN'), 120.0)
+        # And so does a removed one.
+        stock_exchange.remove_trade_by_id('GIN', trade.trade_id)
+        self.assertEqual(stock_exchange.vw_stock_price_calculator('GIN'), 140.0)
+
+        # A stock registered again with other parameters has other ratios.
+        stock_exchange.remove_existing_stock_by_symbol('GIN')
+        Stock('GIN', 'common', '10', '100', current_stock_exchange=stock_exchange)
+        self.assertEqual(stock_exchange.p_e_ratio_calculator('GIN', '150'), 15.0)
+        self.assertEqual(stock_exchange.dividend_yield_calculator('GIN', '150'), 0.067)
+        self.assertEqual(stock_exchange.dividend_yield_calculator('GIN', '150'), 0.067)
+        self.assertEqual(stock_exchange.result_cache.hits, 2)
+
 
         # with self.assertRaises(KeyError) as context:
         #     Stock('GIN', 'other', '8', '100', '0.02', stock_exchange)
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+from datetime import datetime
+
+from simple_stock_exchange import parse_time_stamp, current_time_stamp
+from simple_stock_exchange.time_stamp_parser import parse_time_stamps
+from simple_stock_exchange.trade_store import to_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestTimeStampParser(unittest.TestCase):
+
+    def test_parse_time_stamp(self):
+        self.assertEqual(parse_time_stamp('2017-02-05 22:14:39'), datetime(2017, 2, 5, 22, 14, 39))
+        # Served from the cached date.
+        self.assertEqual(parse_time_stamp('2017-02-05 07:00:01'), datetime(2017, 2, 5, 7, 0, 1))
+        # Not zero padded time stamps are still accepted, like strptime does.
+        self.assertEqual(parse_time_stamp('2017-2-5 7:0:1'), datetime(2017, 2, 5, 7, 0, 1))
+
+    def test_invalid_time_stamps(self):
+        for time_stamp in ('2017-02-05 25:14:39', '2017-02-30 22:14:39', '2017-02-05 22:+4:39', '2017-02-05',
+                           'test'):
+            with self.assertRaises(ValueError):
+                parse_time_stamp(time_stamp)
+
+    def test_current_time_stamp(self):
+        time_stamp = current_time_stamp()
+        self.assertEqual(time_stamp.microsecond, 0)
+        self.assertTrue((datetime.now() - time_stamp).total_seconds() < 2)
+
+    def test_parse_time_stamps(self):
+        time_stamps, valid_time_stamps = parse_time_stamps(['2017-02-05 22:14:39', '2017-2-5 22:14:39', None,
+                                                            '2017-02-05', 'test'])
+        self.assertEqual(list(valid_time_stamps), [True, True, True, False, False])
+        self.assertEqual(time_stamps[0], 1486332879)
+        self.assertEqual(time_stamps[1], 1486332879)
+
+    def test_same_as_parse_time_stamp(self):
+        # The vectorized parsing must accept exactly the time stamps parse_time_stamp accepts.
+        time_stamps = ['2017-02-05 22:14:39', '0999-02-05 22:14:39', '+017-02-05 22:14:39', '-017-02-05 22:14:39',
+                       ' 017-02-05 22:14:39', '2017-02-05 24:00:00', '2017-02-29 22:14:39', '2017-02-05T22:14:39',
+                       '2017-2-5 7:0:1']
+        converted_time_stamps, valid_time_stamps = parse_time_stamps(time_stamps)
+        for time_stamp, converted_time_stamp, valid_time_stamp in zip(time_stamps, converted_time_stamps,
+                                                                      valid_time_stamps):
+            try:
+                expected_time_stamp = to_epoch(parse_time_stamp(time_stamp))
+            except ValueError:
+                self.assertFalse(valid_time_stamp, time_stamp)
+            else:
+                self.assertTrue(valid_time_stamp, time_stamp)
+                self.assertEqual(converted_time_stamp, expected_time_stamp, time_stamp)
@@ -32,6 +32,14 @@ class TestTrade(unittest.TestCase):
         self.assertEqual(trade.time_stamp, datetime.strptime('2017-02-05 22:14:39', '%Y-%m-%d %H:%M:%S'))
         self.assertTrue(trade.created_successfully)
 
+    def test_exchange_reference_dropped(self):
+        stock_exchange = StockExchange('test')
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        trade = TradeRecord(stock_exchange, 'TEA', '500', 'sell', '150', '2017-02-05 22:14:39')
+        self.assertFalse(hasattr(trade, '__dict__'))
+        self.assertIsNone(trade.current_stock_exchange)
+        self.assertEqual(len(stock_exchange.recorded_trades['TEA']), 1)
+
     def test_exceptions(self):
         trade = TradeRecord('test', 'TEA', 'test1', 'test2', 'test3', 'test4')
         self.assertFalse(trade.created_successfully)
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+
+import unittest
+import logging.config
+from datetime import datetime
+
+import numpy as np
+
+from simple_stock_exchange.trade_store import TradeStore, to_epoch, from_epoch
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestTradeStore(unittest.TestCase):
+
+    def test_epoch_conversion(self):
+        time_stamp = datetime(2017, 2, 5, 22, 14, 39)
+        self.assertEqual(from_epoch(to_epoch(time_stamp)), time_stamp)
+
+    def test_append_grows_buffers(self):
+        trade_store = TradeStore('GIN', capacity=2)
+        for index in range(100):
+            trade_store.append(1000 + index, 100.0 + index, 10, 'buy')
+        self.assertEqual(len(trade_store), 100)
+        self.assertEqual(trade_store.time_stamps[-1], 1099)
+        self.assertEqual(trade_store.traded_prices[-1], 199.0)
+        self.assertEqual(list(set(trade_store.trade_types)), [1])
+
+    def test_find_and_remove(self):
+        trade_store = TradeStore('GIN')
+        trade_store.append(1000, 130.0, 300, 'buy')
+        trade_store.append(2000, 150.0, 500, 'sell')
+        self.assertEqual(trade_store.find(2000, 150.0, 500, 'sell'), 1)
+        self.assertIsNone(trade_store.find(2000, 150.0, 500, 'buy'))
+        self.assertEqual(trade_store.find_by_time_stamp(1000), 0)
+        trade_store.remove_at(0)
+        self.assertEqual(len(trade_store), 1)
+        self.assertEqual(list(trade_store.quantities), [500])
+        self.assertIsNone(trade_store.find_by_time_stamp(1000))
+
+    def test_volume_weighted_price(self):
+        trade_store = TradeStore('GIN')
+        trade_store.append(1000, 130.0, 300, 'buy')
+        trade_store.append(2000, 150.0, 500, 'sell')
+        trade_store.append(3000, 120.0, 200, 'sell')
+        self.assertEqual(trade_store.volume_weighted_price(0), 138.0)
+        self.assertEqual(trade_store.volume_weighted_price(1500), 141.429)
+        self.assertIsNone(trade_store.volume_weighted_price(3000))
+
+    def test_out_of_order_trades(self):
+        trade_store = TradeStore('GIN')
+        trade_store.append(3000, 120.0, 200, 'sell')
+        trade_store.append(1000, 130.0, 300, 'buy')
+        trade_store.append(2000, 150.0, 500, 'sell')
+        self.assertEqual(list(trade_store.time_stamps), [1000, 2000, 3000])
+        self.assertEqual(list(trade_store.quantities), [300, 500, 200])
+        self.assertEqual(trade_store.volume_weighted_price(1500), 141.429)
+        self.assertEqual(trade_store.volume_weighted_price(0, 2000), 142.5)
+        trade_store.remove_at(1)
+        self.assertEqual(trade_store.volume_weighted_price(0), 126.0)
+        self.assertEqual(trade_store.time_stamp_range(1000, 2500), (0, 1))
+
+    def test_extend(self):
+        trade_store = TradeStore('GIN', capacity=2)
+        trade_store.append(2000, 150.0, 500, 'sell')
+        trade_store.extend(np.array([4000, 1000, 2000, 3000]), np.array([100.0, 130.0, 160.0, 120.0]),
+                           np.array([100, 300, 100, 200]), np.array([1, 1, 2, 2], dtype=np.uint8))
+        self.assertEqual(list(trade_store.time_stamps), [1000, 2000, 2000, 3000, 4000])
+        self.assertEqual(list(trade_store.traded_prices), [130.0, 150.0, 160.0, 120.0, 100.0])
+        self.assertEqual(trade_store.volume_weighted_price(0, 2000), 144.444)
+        self.assertEqual(trade_store.volume_weighted_price(2000), 113.333)
+
+    def test_drop_before(self):
+        trade_store = TradeStore('GIN')
+        for index in range(1000):
+            trade_store.append(1000 + index, 100.0 + index % 10, 10 + index, 'buy')
+        allocated_bytes = trade_store.nbytes
+        volume_weighted_price = trade_store.volume_weighted_price(1900)
+        dropped_columns = trade_store.drop_before(1900)
+        self.assertEqual(len(dropped_columns[0]), 900)
+        self.assertEqual(dropped_columns[0][-1], 1899)
+        self.assertEqual(len(trade_store), 100)
+        self.assertEqual(trade_store.time_stamps[0], 1900)
+        self.assertLess(trade_store.nbytes, allocated_bytes)
+        self.assertEqual(trade_store.volume_weighted_price(1900), volume_weighted_price)
+        self.assertEqual(trade_store._cumulative_quantities[0], trade_store.quantities[0])
+        self.assertEqual(len(trade_store.drop_before(1000)[0]), 0)
+
+    def test_tombstones(self):
+        trade_store = TradeStore('GIN')
+        trade_store.extend(np.arange(10000, dtype=np.int64) // 2, np.arange(10000) % 13 + 100.0,
+                           np.arange(10000, dtype=np.int64) % 7 + 1, np.ones(10000, dtype=np.uint8),
+                           np.arange(10000, dtype=np.int64))
+        for trade_id in range(0, 10000, 3):
+            position = trade_store.find_by_id(trade_id)
+            self.assertEqual(trade_store.trade_at(position)[4], trade_id)
+            trade_store.remove_at(position)
+            self.assertIsNone(trade_store.find_by_id(trade_id))
+            if trade_id == 300:
+                # The removed trades are only marked as removed, until there are enough of them.
+                self.assertEqual(trade_store.size, 10000)
+                self.assertEqual(len(trade_store), 10000 - 101)
+                self.assertEqual(trade_store.find_by_time_stamp(0), 1)
+                self.assertIsNone(trade_store.find(0, 100.0, 1, 'buy'))
+        kept = np.arange(10000) % 3 != 0
+        self.assertEqual(len(trade_store), np.count_nonzero(kept))
+        self.assertEqual(list(trade_store.trade_ids), list(np.arange(10000)[kept]))
+        expected = TradeStore('GIN')
+        expected.extend(*[column[kept] for column in (np.arange(10000, dtype=np.int64) // 2,
+                                                      np.arange(10000) % 13 + 100.0,
+                                                      np.arange(10000, dtype=np.int64) % 7 + 1,
+                                                      np.ones(10000, dtype=np.uint8))])
+        for starting_time in (0, 1000, 4998):
+            self.assertEqual(trade_store.volume_weighted_price(starting_time),
+                             expected.volume_weighted_price(starting_time))
+        for column, expected_column in zip(trade_store.columns()[:6], expected.columns()[:6]):
+            self.assertEqual(list(column), list(expected_column))
+        trade_store.compact()
+        self.assertEqual(trade_store.size, len(trade_store))
+
+    def test_trades_after(self):
+        trade_store = TradeStore('GIN')
+        # Two trades every second.
+        trade_store.extend(np.arange(100, dtype=np.int64) // 2, np.arange(100) + 100.0,
+                           np.ones(100, dtype=np.int64), np.ones(100, dtype=np.uint8), np.arange(100, dtype=np.int64))
+        for trade_id in range(10, 20):
+            trade_store.remove_at(trade_store.find_by_id(trade_id))
+        self.assertEqual(list(trade_store.trades_after(limit=12)[4]), range(10) + [20, 21])
+        # The page starts after the trade, between the trades of the same second.
+        self.assertEqual(list(trade_store.trades_after(10, 20, 3)[4]), [21, 22, 23])
+        self.assertEqual(list(trade_store.trades_after(10, 21, 3)[4]), [22, 23, 24])
+        # The trade does not need to be stored any more.
+        self.assertEqual(list(trade_store.trades_after(5, 10, 3)[4]), [20, 21, 22])
+        self.assertEqual(list(trade_store.trades_after(49, 98, 3)[4]), [99])
+        self.assertEqual(len(trade_store.trades_after(49, 99, 3)[0]), 0)
+        # Paging through all the trades.
+        trade_ids = []
+        columns = trade_store.trades_after(limit=7)
+        while len(columns[0]):
+            trade_ids.extend(columns[4])
+            columns = trade_store.trades_after(columns[0][-1], columns[4][-1], 7)
+        self.assertEqual(trade_ids, list(trade_store.trade_ids))
+
+    def test_trades_between(self):
+        trade_store = TradeStore('GIN')
+        trade_store.extend(np.arange(100, dtype=np.int64), np.arange(100) + 100.0, np.ones(100, dtype=np.int64),
+                           np.ones(100, dtype=np.uint8), np.arange(100, dtype=np.int64))
+        for trade_id in (20, 22, 23):
+            trade_store.remove_at(trade_store.find_by_id(trade_id))
+        self.assertEqual(list(trade_store.trades_between(18, 25)[4]), [18, 19, 21, 24, 25])
+        # Reading past the removed trades, up to the limit.
+        self.assertEqual(list(trade_store.trades_between(18, 25, 4)[4]), [18, 19, 21, 24])
+        self.assertEqual(list(trade_store.trades_between(18, 25, 10)[4]), [18, 19, 21, 24, 25])
+        self.assertEqual(len(trade_store.trades_between(200, 300)[0]), 0)
+
+    def test_find_by_id_out_of_order(self):
+        trade_store = TradeStore('GIN')
+        trade_store.append(2000, 150.0, 500, 'sell', 0)
+        trade_store.append(3000, 130.0, 300, 'buy', 1)
+        trade_store.append(1000, 120.0, 100, 'buy', 2)
+        self.assertEqual([trade_store.find_by_id(trade_id) for trade_id in (0, 1, 2, 3)], [1, 2, 0, None])
+        trade_store.remove_at(trade_store.find_by_id(2))
+        self.assertEqual([trade_store.find_by_id(trade_id) for trade_id in (0, 1, 2)], [0, 1, None])
+        self.assertEqual(trade_store.trade_at(1), (3000, 130.0, 300, 1, 1))
@@ -0,0 +1,134 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+import unittest
+import logging.config
+
+from simple_stock_exchange import Stock, TradeRecord, StockExchange
+from simple_stock_exchange.write_ahead_log import WriteAheadLog, read_write_ahead_log, recover_stock_exchange
+
+__author__ = 'Nikitas Papangelopoulos'
+
+logging.config.fileConfig('logging.conf', disable_existing_loggers=False)
+
+
+class TestWriteAheadLog(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.directory, 'exchange.wal')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def create_logged_exchange(self, **options):
+        stock_exchange = StockExchange('test', WriteAheadLog(self.log_file, **options))
+        Stock('GIN', 'preferred', '8', '100', '2%', stock_exchange)
+        stock = Stock('POP', 'common', '8', '100')
+        stock.current_price = 150.0
+        stock_exchange.add_new_stock(stock)
+        Stock('TEA', 'common', '0', '100', current_stock_exchange=stock_exchange)
+        TradeRecord(stock_exchange, 'GIN', '300', 'buy', '130', '2017-02-05 23:14:39')
+        TradeRecord(stock_exchange, 'GIN', '500', 'sell', '150', '2017-02-05 22:14:39')
+        stock_exchange.add_trades_bulk([('POP', '200', 'sell', '120', '2017-02-05 22:14:39'),
+                                        ('GIN', '100', 'buy', '140', '2017-02-05 22:30:00')])
+        stock_exchange.remove_trade_by_symbol_date('GIN', '2017-02-05 22:14:39')
+        stock_exchange.remove_existing_stock_by_symbol('TEA')
+        return stock_exchange
+
+    def assert_same_exchange(self, recovered, original):
+        self.assertEqual(sorted(recovered.registered_stocks), sorted(original.registered_stocks))
+        for stock_symbol, stock in original.registered_stocks.items():
+            self.assertEqual(recovered.registered_stocks[stock_symbol].to_dict(), stock.to_dict())
+        self.assertEqual(sorted(recovered.recorded_trades), sorted(original.recorded_trades))
+        for stock_symbol, trade_store in original.recorded_trades.items():
+            recovered_store = recovered.recorded_trades[stock_symbol]
+            self.assertEqual(list(recovered_store.time_stamps), list(trade_store.time_stamps))
+            self.assertEqual(list(recovered_store.traded_prices), list(trade_store.traded_prices))
+            self.assertEqual(list(recovered_store.quantities), list(trade_store.quantities))
+            self.assertEqual(list(recovered_store.trade_types), list(trade_store.trade_types))
+            self.assertEqual(list(recovered_store.trade_ids), list(trade_store.trade_ids))
+        self.assertEqual(recovered.all_share_index, original.all_share_index)
+
+    def test_recover(self):
+        for fsync_policy in ('always', 'batch', 'never'):
+            if os.path.exists(self.log_file):
+                os.remove(self.log_file)
+            original = self.create_logged_exchange(fsync_policy=fsync_policy)
+            original.write_ahead_log.close()
+            recovered = recover_stock_exchange('test', self.log_file)
+            self.assert_same_exchange(recovered, original)
+            recovered.write_ahead_log.close()
+
+    def test_group_commit(self):
+        original = self.create_logged_exchange(group_commit_size=1000, group_commit_interval=60)
+        # Nothing is written until the group is committed.
+        self.assertEqual(os.path.getsize(self.log_file), 0)
+        original.write_ahead_log.flush()
+        self.assertEqual(len(list(read_write_ahead_log(self.log_file))), 9)
+        original.write_ahead_log.close()
+
+    def test_recover_continues_logging(self):
+        original = self.create_logged_exchange()
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file)
+        TradeRecord(recovered, 'POP', '100', 'buy', '110', '2017-02-06 10:00:00')
+        recovered.write_ahead_log.close()
+        recovered_again = recover_stock_exchange('test', self.log_file)
+        self.assert_same_exchange(recovered_again, recovered)
+        recovered_again.write_ahead_log.close()
+
+    def test_recover_removed_trade_by_id(self):
+        original = StockExchange('test', WriteAheadLog(self.log_file))
+        Stock('POP', 'common', '8', '100', current_stock_exchange=original)
+        for repeat in range(2):
+            TradeRecord(original, 'POP', '100', 'buy', '120', '2017-02-05 22:14:39')
+        original.remove_trade_by_id('POP', 1)
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file)
+        self.assertEqual(list(recovered.recorded_trades['POP'].trade_ids), [0])
+        recovered.write_ahead_log.close()
+
+    def test_recover_updated_price(self):
+        original = self.create_logged_exchange()
+        original.dividend_yield_calculator('GIN', '125')
+        original.write_ahead_log.close()
+        recovered = recover_stock_exchange('test', self.log_file)
+        # The calculated dividend yield is not restored, as with any restored stock, but the price it set is.
+        for stock_symbol, stock in original.registered_stocks.items():
+            recovered_stock = recovered.registered_stocks[stock_symbol]
+            self.assertEqual((recovered_stock.current_price, recovered_stock.current_price_timestamp),
+                             (stock.current_price, stock.current_price_timestamp))
+        self.assertEqual(recovered.registered_stocks['GIN'].current_price, 125.0)
+        self.assertEqual(recovered.all_share_index, original.all_share_index)
+        recovered.write_ahead_log.close()
+
+    def test_read_from_offset(self):
+        original = self.create_logged_exchange()
+        original.write_ahead_log.close()
+        records = list(read_write_ahead_log(self.log_file))
+        self.assertEqual(records[-1][3], os.path.getsize(self.log_file))
+        # Reading from the end of any record gives the records after it.
+        for position, (_, _, _, end_offset) in enumerate(records):
+            self.assertEqual([(record_type, stock_symbol, offset) for record_type, stock_symbol, _, offset in
+                              read_write_ahead_log(self.log_file, end_offset)],
+                             [(record_type, stock_symbol, offset) for record_type, stock_symbol, _, offset in
+                              records[position + 1:]])
+
+    def test_incomplete_record(self):
+        original = self.create_logged_exchange()
+        original.write_ahead_log.close()
+        complete_size = os.path.getsize(self.log_file)
+        # Simulating a crash in the middle of writing a record.
+        with open(self.log_file, 'ab') as log_file:
+            log_file.write(b'\x03\x20\x00\x00\x00\x01')
+        recovered = recover_stock_exchange('test', self.log_file)
+        self.assert_same_exchange(recovered, original)
+        self.assertEqual(os.path.getsize(self.log_file), complete_size)
+        recovered.write_ahead_log.close()
+
+    def test_invalid_fsync_policy(self):
+        with self.assertRaises(ValueError):
+            WriteAheadLog(self.log_file, fsync_policy='sometimes')